@@ -0,0 +1,120 @@
+"""
+This module generates reproducible synthetic corpora for the smartfile benchmarks.
+
+The same `seed` and specification always produce the same files, so results can be compared
+across releases and machines.
+
+Functions:
+- generate_corpus: Writes a corpus of images, PDFs and text files into a directory.
+
+Dependencies:
+- PIL (Pillow): Used to write JPEG and PNG images.
+- fpdf: Used to write multi-page PDFs.
+"""
+
+import os
+import random
+from fpdf import FPDF
+from PIL import Image
+
+# Default corpus: counts of each kind of file and their sizes
+DEFAULT_SPEC = {
+    'jpeg': {'count': 20, 'size': (4000, 3000)},
+    'png': {'count': 10, 'size': (1920, 1080)},
+    'pdf': {'count': 10, 'pages': 50},
+    'text': {'count': 50, 'lines': 20000, 'line_length': 80},
+    'single_line': {'count': 2, 'bytes': 32 * 1024 * 1024},
+}
+
+_WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+          "incididunt ut labore et dolore magna aliqua").split()
+
+def _random_bytes(rng, count):
+    return rng.getrandbits(8 * count).to_bytes(count, 'little') if count else b''
+
+def _make_image(path, size, rng, image_format):
+    # Smooth random content compresses like a photograph, unlike pure noise
+    width, height = size
+    small = (max(1, width // 16), max(1, height // 16))
+    seed_image = Image.frombytes('RGB', small, _random_bytes(rng, small[0] * small[1] * 3))
+    image = seed_image.resize(size, Image.BILINEAR)
+    if image_format == 'JPEG':
+        image.save(path, image_format, quality=90)
+    else:
+        image.save(path, image_format)
+
+def _make_pdf(path, pages, rng):
+    pdf = FPDF()
+    pdf.set_author(f"Author {rng.randrange(1000)}")
+    pdf.set_font("Arial", size=12)
+    for page in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 5, f"Page {page + 1}\n" + _sentence(rng, 200))
+    pdf.output(path)
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+def _make_text(path, lines, line_length, rng):
+    # A few distinct lines are reused so that large files are quick to write
+    pool = [(_sentence(rng, line_length // 5)[:line_length]).ljust(line_length) for _ in range(64)]
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(lines):
+            f.write(pool[rng.randrange(len(pool))] + "\n")
+
+def _make_single_line(path, size, rng):
+    # One huge line without a terminator: the worst case for line-oriented previews
+    block = (_sentence(rng, 2000) + " ").encode()
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+def generate_corpus(directory, spec=None, seed=0):
+    """
+    Writes a synthetic corpus into `directory`.
+
+    Parameters:
+    - directory (str): The directory to write to. It is created if needed.
+    - spec (dict): Overrides of `DEFAULT_SPEC`, by kind, e.g. `{'jpeg': {'count': 5}}`.
+    - seed (int): The random seed (default is 0).
+
+    Returns:
+    - dict: The paths of the generated files, by kind ('jpeg', 'png', 'pdf', 'text' and
+      'single_line').
+
+    Example:
+    >>> generate_corpus('/tmp/corpus', spec={'jpeg': {'count': 100}}, seed=42)
+    {'jpeg': ['/tmp/corpus/image_0000.jpg', ...], 'png': [...], ...}
+    """
+    merged = {kind: dict(options) for kind, options in DEFAULT_SPEC.items()}
+    for kind, options in (spec or {}).items():
+        if kind not in merged:
+            raise ValueError(f"Unknown file kind {kind!r}.")
+        merged[kind].update(options)
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = {kind: [] for kind in merged}
+
+    def path_for(kind, name):
+        path = os.path.join(directory, name)
+        manifest[kind].append(path)
+        return path
+
+    for i in range(merged['jpeg']['count']):
+        _make_image(path_for('jpeg', f'image_{i:04d}.jpg'), tuple(merged['jpeg']['size']), rng,
+                    'JPEG')
+    for i in range(merged['png']['count']):
+        _make_image(path_for('png', f'image_{i:04d}.png'), tuple(merged['png']['size']), rng,
+                    'PNG')
+    for i in range(merged['pdf']['count']):
+        _make_pdf(path_for('pdf', f'document_{i:04d}.pdf'), merged['pdf']['pages'], rng)
+    for i in range(merged['text']['count']):
+        _make_text(path_for('text', f'notes_{i:04d}.txt'), merged['text']['lines'],
+                   merged['text']['line_length'], rng)
+    for i in range(merged['single_line']['count']):
+        _make_single_line(path_for('single_line', f'single_line_{i:04d}.txt'),
+                          merged['single_line']['bytes'], rng)
+    return manifest
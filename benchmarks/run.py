@@ -0,0 +1,255 @@
+"""
+This module runs the smartfile benchmarks and reports the results as JSON.
+
+Each benchmark runs in a fresh process by default, so its peak RSS is its own. The corpus
+is generated once, reproducibly, and each operation that modifies files works on a copy.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --scale small --only get_file_type get_metadata
+
+Functions:
+- run_benchmarks: Runs the selected benchmarks and returns the report.
+- main: The command-line entry point.
+
+Dependencies:
+- resource: Used to read the peak resident set size (Unix only).
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.corpus import generate_corpus
+
+# Corpus specifications by scale; 'medium' is the default corpus
+SCALES = {
+    'tiny': {
+        'jpeg': {'count': 2, 'size': (640, 480)},
+        'png': {'count': 2, 'size': (320, 240)},
+        'pdf': {'count': 2, 'pages': 3},
+        'text': {'count': 3, 'lines': 200},
+        'single_line': {'count': 1, 'bytes': 256 * 1024},
+    },
+    'small': {
+        'jpeg': {'count': 5, 'size': (2000, 1500)},
+        'png': {'count': 5},
+        'pdf': {'count': 5, 'pages': 20},
+        'text': {'count': 20, 'lines': 5000},
+        'single_line': {'count': 1, 'bytes': 8 * 1024 * 1024},
+    },
+    'medium': {},
+    'large': {
+        'jpeg': {'count': 200},
+        'png': {'count': 50},
+        'pdf': {'count': 100, 'pages': 200},
+        'text': {'count': 500, 'lines': 200000},
+        'single_line': {'count': 4, 'bytes': 256 * 1024 * 1024},
+    },
+}
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _time_each(func, items):
+    """
+    Calls `func` on each item, returning the latency of every call in seconds.
+    """
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def _copy_files(paths, directory):
+    os.makedirs(directory)
+    for path in paths:
+        shutil.copy(path, directory)
+    return directory
+
+def _bench_get_file_type(manifest, workdir, repeat):
+    from smartfile import get_file_type
+    paths = [path for paths in manifest.values() for path in paths]
+    return _time_each(get_file_type, paths * repeat), paths * repeat
+
+def _bench_get_metadata(manifest, workdir, repeat):
+    from smartfile import get_metadata
+    paths = (manifest['jpeg'] + manifest['png'] + manifest['pdf']) * repeat
+    # Fields are extracted on first access, so each call materializes all of them
+    return _time_each(lambda path: dict(get_metadata(path)), paths), paths
+
+def _bench_preview_text_file(manifest, workdir, repeat):
+    from smartfile import preview_text_file
+    paths = (manifest['text'] + manifest['single_line']) * repeat
+    return _time_each(preview_text_file, paths), paths
+
+def _bench_preview_image_file(manifest, workdir, repeat):
+    from smartfile import preview_image_file
+    paths = (manifest['jpeg'] + manifest['png']) * repeat
+    return _time_each(preview_image_file, paths), paths
+
+def _bench_organize_by_type(manifest, workdir, repeat):
+    from smartfile import organize_by_type
+    paths = [path for paths in manifest.values() for path in paths]
+    latencies = []
+    for run in range(repeat):
+        directory = _copy_files(paths, os.path.join(workdir, f'organize_{run}'))
+        latencies += _time_each(organize_by_type, [directory])
+    # One operation per file, so throughput is comparable with the per-file benchmarks
+    return latencies, paths * repeat
+
+def _bench_bulk_rename(manifest, workdir, repeat):
+    from smartfile import bulk_rename
+    paths = manifest['text'] + manifest['pdf']
+    latencies = []
+    for run in range(repeat):
+        directory = _copy_files(paths, os.path.join(workdir, f'rename_{run}'))
+        latencies += _time_each(bulk_rename, [directory])
+    return latencies, paths * repeat
+
+BENCHMARKS = {
+    'get_file_type': _bench_get_file_type,
+    'get_metadata': _bench_get_metadata,
+    'preview_text_file': _bench_preview_text_file,
+    'preview_image_file': _bench_preview_image_file,
+    'organize_by_type': _bench_organize_by_type,
+    'bulk_rename': _bench_bulk_rename,
+}
+
+def _run_one(name, manifest, workdir, repeat):
+    """
+    Runs a single benchmark and summarizes it. Latencies are per call: per file for the
+    per-file functions, per directory for organize_by_type and bulk_rename.
+    """
+    bench_dir = os.path.join(workdir, name)
+    os.makedirs(bench_dir)
+    start = time.perf_counter()
+    latencies, files = BENCHMARKS[name](manifest, bench_dir, repeat)
+    elapsed = sum(latencies)
+    wall = time.perf_counter() - start
+    total_bytes = sum(os.path.getsize(path) for path in set(files)) * repeat
+    ordered = sorted(latencies)
+    return {
+        "name": name,
+        "files": len(files),
+        "calls": len(latencies),
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "wall_seconds": wall,
+        "files_per_second": len(files) / elapsed if elapsed else None,
+        "megabytes_per_second": total_bytes / elapsed / 1e6 if elapsed else None,
+        "latency_ms": {
+            "p50": _percentile(ordered, 0.50) * 1000,
+            "p90": _percentile(ordered, 0.90) * 1000,
+            "p99": _percentile(ordered, 0.99) * 1000,
+            "max": ordered[-1] * 1000,
+        },
+        "peak_rss_kb": _peak_rss_kb(),
+    }
+
+def run_benchmarks(names=None, scale='medium', seed=0, repeat=1, corpus_dir=None,
+                   isolate=True):
+    """
+    Generates the corpus and runs the benchmarks.
+
+    Parameters:
+    - names (list): The benchmarks to run (default is all of `BENCHMARKS`).
+    - scale (str): The corpus size, one of `SCALES` (default is 'medium').
+    - seed (int): The corpus random seed (default is 0).
+    - repeat (int): How many times each benchmark goes over the corpus (default is 1).
+    - corpus_dir (str): Where to write the corpus. By default a temporary directory is used
+      and removed afterwards.
+    - isolate (bool): Whether each benchmark runs in a fresh process, so its peak RSS is
+      measured separately (default is True).
+
+    Returns:
+    - dict: The report, with the environment, the corpus and one entry per benchmark.
+    """
+    names = list(BENCHMARKS) if names is None else list(names)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}.")
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale {scale!r}.")
+
+    workdir = tempfile.mkdtemp(prefix='smartfile-bench-')
+    try:
+        corpus = corpus_dir or os.path.join(workdir, 'corpus')
+        generation_start = time.perf_counter()
+        manifest = generate_corpus(corpus, SCALES[scale], seed=seed)
+        generation_seconds = time.perf_counter() - generation_start
+
+        results = []
+        for name in names:
+            if isolate:
+                context = multiprocessing.get_context('spawn')
+                with context.Pool(1) as pool:
+                    results.append(pool.apply(_run_one, (name, manifest, workdir, repeat)))
+            else:
+                results.append(_run_one(name, manifest, workdir, repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "corpus": {
+            "scale": scale,
+            "seed": seed,
+            "files": {kind: len(paths) for kind, paths in manifest.items()},
+            "generation_seconds": generation_seconds,
+        },
+        "repeat": repeat,
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                     description="Benchmark smartfile and print a JSON report.")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), metavar='NAME',
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--scale', choices=list(SCALES), default='medium')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--corpus-dir', help="keep the generated corpus in this directory")
+    parser.add_argument('--no-isolate', action='store_true',
+                        help="run every benchmark in this process")
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.only, scale=args.scale, seed=args.seed, repeat=args.repeat,
+                            corpus_dir=args.corpus_dir, isolate=not args.no_isolate)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -27,7 +27,7 @@ setup(
         "License :: OSI Approved :: MIT License", 
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',  # Minimum Python version required
+    python_requires='>=3.7',  # Minimum Python version required (module __getattr__, PEP 562)
     install_requires=requirements,  # Load dependencies from requirements.txt
     entry_points={ 
         'console_scripts': [
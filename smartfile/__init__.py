@@ -8,32 +8,64 @@ The public API exposes the following key functions:
 Public Functions:
 - organize_by_type: Organizes files into directories based on their type (e.g., images, text, etc.).
 - get_file_type: Identifies the type of a file by inspecting its extension or content.
+- get_file_types: Identifies the types of many files at once with a single stat per file.
 - get_metadata: Retrieves metadata from files, such as EXIF data for images or other file attributes.
+- iter_metadata: Streams metadata for every file in a directory tree, using worker processes.
 - preview_image_file: Generates a preview of image files, such as displaying a thumbnail.
 - preview_text_file: Provides a preview of text files, displaying the first few lines or characters.
 - bulk_rename: Renames multiple files at once based on a provided pattern or rule.
+- find_duplicates: Finds groups of files with identical content.
+- watch: Organizes files by type continuously as they arrive in a directory.
 
-Note: The core functionality is split into various submodules (file_management, file_types, metadata, preview, renaming), 
-which are imported and made available here for ease of use.
+Public Classes:
+- Catalog: A persistent, incrementally refreshed catalog of a directory tree with indexed queries.
+
+Note: The core functionality is split into various submodules (file_management, file_types, metadata, preview, renaming, duplicates, catalog, watching), 
+which are imported on first access to one of their names (PEP 562), so `import smartfile` stays
+cheap and only the submodules actually used are loaded.
 
 """
 
-# Importing functions from submodules
-from .file_management import organize_by_type  
-from .file_types import get_file_type  
-from .metadata import get_metadata 
-from .preview import (
-    preview_image_file,  
-    preview_text_file
-)
-from .renaming import bulk_rename  # Renames multiple files based on a pattern
+import importlib
+
+# Maps each public name to the submodule that defines it
+_EXPORTS = {
+    'organize_by_type': 'file_management',
+    'get_file_type': 'file_types',
+    'get_file_types': 'file_types',
+    'get_metadata': 'metadata',
+    'iter_metadata': 'metadata',
+    'preview_image_file': 'preview',
+    'preview_text_file': 'preview',
+    'bulk_rename': 'renaming',
+    'find_duplicates': 'duplicates',
+    'watch': 'watching',
+    'Catalog': 'catalog',
+}
 
 # Define the public API of the package by specifying which functions are intended for external use
 __all__ = [
     'organize_by_type',   # Organize files into directories based on their type
     'get_file_type',      # Identify file type from extension or content
+    'get_file_types',     # Identify the types of many files in one pass
     'get_metadata',       # Extract file metadata (e.g., EXIF, size)
+    'iter_metadata',      # Stream metadata for a whole directory tree
     'preview_image_file', # Preview image files (e.g., show a thumbnail)
     'preview_text_file',  # Preview text files (e.g., display the first few lines)
-    'bulk_rename'         # Bulk rename files according to a specified rule
-]
\ No newline at end of file
+    'bulk_rename',        # Bulk rename files according to a specified rule
+    'find_duplicates',    # Find groups of files with identical content
+    'watch',              # Organize files continuously as they arrive
+    'Catalog'             # Persistent catalog of a directory tree
+]
+
+def __getattr__(name):
+    submodule = _EXPORTS.get(name)
+    if submodule is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{submodule}', __name__), name)
+    # Later lookups find the name directly and skip this function
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,336 @@
+"""
+This module provides asyncio coroutines for smartfile's type detection, metadata extraction and
+previews.
+
+The blocking work runs on two executors: a thread pool for I/O-bound calls (type detection,
+text previews, stat-only metadata) and a process pool for CPU-bound parsing (image and PDF
+metadata, image thumbnails). Each executor is guarded by a semaphore, so however many
+coroutines are waiting, only a bounded number of calls are queued on the executors and the
+number of threads and processes stays fixed.
+
+Cancelling a coroutine withdraws its call if it has not started yet. A call that is already
+running finishes in the background and keeps its executor slot until it does, so cancellations
+cannot oversubscribe the executors.
+
+Classes:
+- AsyncSmartFile: Coroutines sharing a pair of bounded executors.
+
+Functions:
+- get_file_type, get_metadata, preview_text_file, preview_image_file: Coroutines using a
+  shared default `AsyncSmartFile`.
+- as_completed: Runs an operation on many files, yielding results as they complete.
+
+Dependencies:
+- asyncio: Used to await the executors.
+- This module relies on `smartfile.file_types`, `smartfile.metadata` and `smartfile.preview`
+  for the actual work.
+"""
+
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from smartfile import archives, file_types, metadata, preview
+
+_IO = 'io'
+_CPU = 'cpu'
+
+class _LoopState:
+    """
+    The semaphores of one event loop and the number of calls holding or awaiting their slots.
+    """
+    __slots__ = ('semaphores', 'users')
+
+    def __init__(self):
+        self.semaphores = {}
+        self.users = 0
+
+class AsyncSmartFile:
+    """
+    Awaitable versions of the smartfile operations, running on bounded executors.
+
+    Parameters:
+    - io_workers (int): The number of threads for I/O-bound calls (default is
+      `min(32, os.cpu_count() + 4)`).
+    - cpu_workers (int): The number of processes for CPU-bound calls (default is
+      `os.cpu_count()`).
+    - io_limit (int): The maximum number of I/O-bound calls queued or running at once
+      (default is twice `io_workers`).
+    - cpu_limit (int): The maximum number of CPU-bound calls queued or running at once
+      (default is twice `cpu_workers`).
+    - io_executor, cpu_executor (concurrent.futures.Executor): Executors to use instead of
+      creating them, e.g. a `ThreadPoolExecutor` as `cpu_executor` where processes are not
+      wanted. Executors passed in are not shut down by `close`.
+    - cache (smartfile.cache.MetadataCache): An optional cache for image and PDF metadata.
+
+    Example:
+    >>> async with AsyncSmartFile(cpu_workers=4) as sf:
+    ...     metadata = await sf.get_metadata('/path/to/photo.jpg')
+    ...     async for path, mime in sf.as_completed(sf.get_file_type, paths):
+    ...         print(path, mime)
+    """
+
+    def __init__(self, io_workers=None, cpu_workers=None, io_limit=None, cpu_limit=None,
+                 io_executor=None, cpu_executor=None, cache=None):
+        cpu_count = os.cpu_count() or 1
+        if io_workers is None:
+            io_workers = min(32, cpu_count + 4)
+        if cpu_workers is None:
+            cpu_workers = cpu_count
+        if io_workers < 1 or cpu_workers < 1:
+            raise ValueError("io_workers and cpu_workers must be at least 1.")
+        self.io_limit = io_limit if io_limit is not None else io_workers * 2
+        self.cpu_limit = cpu_limit if cpu_limit is not None else cpu_workers * 2
+        if self.io_limit < 1 or self.cpu_limit < 1:
+            raise ValueError("io_limit and cpu_limit must be at least 1.")
+        self.cache = cache
+
+        self._io_workers = io_workers
+        self._cpu_workers = cpu_workers
+        self._executors = {_IO: io_executor, _CPU: cpu_executor}
+        self._owned = {_IO: io_executor is None, _CPU: cpu_executor is None}
+        self._executor_lock = threading.Lock()
+        # Semaphores belong to an event loop, so each loop gets its own, created by its first
+        # call and dropped once it holds no slot, which also releases the loop
+        self._loops = {}
+        self._loops_lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
+
+    def close(self, wait=True):
+        """
+        Shuts down the executors created by this object.
+        """
+        with self._executor_lock:
+            for kind, executor in self._executors.items():
+                if executor is not None and self._owned[kind]:
+                    executor.shutdown(wait=wait)
+                    self._executors[kind] = None
+
+    def _executor(self, kind):
+        executor = self._executors[kind]
+        if executor is None:
+            with self._executor_lock:
+                executor = self._executors[kind]
+                if executor is None:
+                    if kind == _IO:
+                        executor = ThreadPoolExecutor(max_workers=self._io_workers,
+                                                      thread_name_prefix='smartfile-io')
+                    else:
+                        executor = ProcessPoolExecutor(max_workers=self._cpu_workers)
+                    self._executors[kind] = executor
+        return executor
+
+    def _enter(self, loop, kind):
+        """
+        Returns the semaphore of `kind` for `loop`, counting one more call using the loop.
+        """
+        with self._loops_lock:
+            state = self._loops.get(loop)
+            if state is None:
+                # A loop closed with release callbacks still queued never saw them run
+                for closed in [other for other in self._loops if other.is_closed()]:
+                    del self._loops[closed]
+                state = self._loops[loop] = _LoopState()
+            state.users += 1
+            semaphore = state.semaphores.get(kind)
+            if semaphore is None:
+                limit = self.io_limit if kind == _IO else self.cpu_limit
+                semaphore = state.semaphores[kind] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _leave(self, loop):
+        with self._loops_lock:
+            state = self._loops.get(loop)
+            if state is not None:
+                state.users -= 1
+                if not state.users:
+                    del self._loops[loop]
+
+    def _release(self, loop, semaphore):
+        semaphore.release()
+        self._leave(loop)
+
+    async def _run(self, kind, func, *args, **kwargs):
+        """
+        Runs `func` on the executor for `kind` once a slot is free and awaits its result.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._enter(loop, kind)
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            self._leave(loop)
+            raise
+        try:
+            future = self._executor(kind).submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._release(loop, semaphore)
+            raise
+
+        def release(_):
+            # The slot is freed when the call ends, not when its awaiting coroutine is cancelled
+            try:
+                loop.call_soon_threadsafe(self._release, loop, semaphore)
+            except RuntimeError:
+                self._leave(loop)  # The event loop is already closed
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    async def get_file_type(self, filepath):
+        """
+        Awaitable `smartfile.file_types.get_file_type`.
+        """
+        return await self._run(_IO, file_types.get_file_type, filepath)
+
+    async def get_metadata(self, filepath, fields=None):
+        """
+        Awaitable `smartfile.metadata.get_metadata`, returning a dictionary with every
+        requested field extracted. Types are detected on the thread pool and images and PDFs
+        are parsed on the process pool; the cache, if any, is consulted on the thread pool.
+        """
+        if fields is not None:
+            fields = frozenset(fields)
+        if self.cache is None or archives.split_archive_path(filepath):
+            mime_type = await self._run(_IO, file_types.get_file_type, filepath)
+            if not metadata._parses(metadata._select(mime_type, fields)):
+                return await self._run(_IO, metadata._extract, filepath, mime_type, fields)
+            return await self._run(_CPU, metadata._extract, filepath, mime_type, fields)
+
+        # One stat on a hit; the type is only detected on a miss
+        st, cached, mime_type, selected = await self._run(
+            _IO, metadata._cache_lookup, self.cache, filepath, fields)
+        if not metadata._parses(selected):
+            return await self._run(_IO, metadata._extract, filepath, mime_type, fields)
+        result = metadata._from_cache(cached, selected)
+        if result is not None and metadata._MIME_KEY in cached:
+            return result
+        if result is None:
+            result = await self._run(_CPU, metadata._extract, filepath, mime_type, fields)
+        await self._run(_IO, self.cache.put, st, metadata._cache_entry(cached, result, mime_type))
+        return result
+
+    async def preview_text_file(self, filepath, num_lines=5, **options):
+        """
+        Awaitable `smartfile.preview.preview_text_file`; accepts the same options.
+        """
+        return await self._run(_IO, preview.preview_text_file, filepath, num_lines, **options)
+
+    async def preview_image_file(self, filepath, size=(100, 100), cache=None):
+        """
+        Awaitable `smartfile.preview.preview_image_file`. Images are decoded on the process
+        pool; with a `ThumbnailCache` they are decoded on the thread pool instead, because the
+        cache keeps its index in this process.
+        """
+        kind = _CPU if cache is None else _IO
+        return await self._run(kind, preview.preview_image_file, filepath, size, cache)
+
+    def as_completed(self, operation, paths, return_exceptions=True, limit=None):
+        """
+        Runs an operation on many files concurrently, yielding results as they complete.
+
+        Parameters:
+        - operation (coroutine function): Called with each path, e.g. `self.get_metadata`.
+        - paths (iterable): The files to process. It is consumed lazily.
+        - return_exceptions (bool): Whether exceptions are yielded as results (default is
+          True). Otherwise the first exception is raised and remaining calls are cancelled.
+        - limit (int): The maximum number of operations started at once (default is
+          `io_limit + cpu_limit`).
+
+        Returns:
+        - async generator: Yields `(path, result)` tuples in completion order.
+        """
+        return _as_completed(operation, paths, return_exceptions,
+                             limit if limit is not None else self.io_limit + self.cpu_limit)
+
+async def _as_completed(operation, paths, return_exceptions, limit):
+    if limit < 1:
+        raise ValueError("limit must be at least 1.")
+    paths = iter(paths)
+    running = {}
+    try:
+        while True:
+            for path in paths:
+                running[asyncio.ensure_future(operation(path))] = path
+                if len(running) >= limit:
+                    break
+            if not running:
+                return
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path = running.pop(task)
+                try:
+                    result = task.result()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    result = e
+                yield path, result
+    finally:
+        # The consumer stopped early, was cancelled or an error was raised
+        for task in running:
+            task.cancel()
+
+_default = None
+_default_lock = threading.Lock()
+
+def _default_instance():
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = AsyncSmartFile()
+    return _default
+
+async def get_file_type(filepath):
+    """
+    Identifies the type of a file without blocking the event loop.
+
+    Example:
+    >>> await get_file_type('/path/to/image.jpg')
+    'image/jpeg'
+    """
+    return await _default_instance().get_file_type(filepath)
+
+async def get_metadata(filepath, fields=None):
+    """
+    Extracts the metadata of a file without blocking the event loop.
+
+    Example:
+    >>> await get_metadata('/path/to/document.pdf')
+    {'author': 'John Doe', 'num_pages': 10}
+    """
+    return await _default_instance().get_metadata(filepath, fields)
+
+async def preview_text_file(filepath, num_lines=5, **options):
+    """
+    Previews a text file without blocking the event loop.
+    """
+    return await _default_instance().preview_text_file(filepath, num_lines, **options)
+
+async def preview_image_file(filepath, size=(100, 100), cache=None):
+    """
+    Generates an image thumbnail without blocking the event loop.
+    """
+    return await _default_instance().preview_image_file(filepath, size, cache)
+
+def as_completed(operation, paths, return_exceptions=True, limit=None):
+    """
+    Runs an operation on many files, yielding `(path, result)` tuples as they complete. See
+    `AsyncSmartFile.as_completed`.
+
+    Example:
+    >>> async for path, mime in as_completed(get_file_type, paths):
+    ...     print(path, mime)
+    """
+    instance = _default_instance()
+    return _as_completed(operation, paths, return_exceptions,
+                         limit if limit is not None else instance.io_limit + instance.cpu_limit)
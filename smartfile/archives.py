@@ -0,0 +1,370 @@
+"""
+This module gives access to the members of zip and tar archives through virtual paths, without
+extracting them.
+
+A virtual path joins the archive and the member with '!/', e.g. 'bundle.zip!/dir/photo.jpg'
+or 'logs.tar.gz!/app.log'. `get_file_type`, `get_metadata`, `preview_text`,
+`preview_text_file` and `preview_image_file` accept such paths and read members as streams:
+type detection reads the first bytes of a member, image metadata and previews decode from the
+member stream, and text previews stop after their byte budget. Nothing is written to disk.
+
+Zip archives and uncompressed tar archives allow random access, so reaching a member costs a
+seek. Compressed tar archives (.tar.gz, .tar.bz2, .tar.xz) can only be read sequentially:
+their member list is built with one pass over the archive and reading a member decompresses
+the archive up to it. The member lists of recently used archives are cached per process and
+refreshed when the archive changes.
+
+Classes:
+- MemberInfo: The size, modification time and kind of an archive member.
+
+Functions:
+- split_archive_path: Splits a virtual path into the archive and the member name.
+- stat_member: Returns the `MemberInfo` of a virtual path.
+- open_member: Opens a member for reading as a binary file object.
+- open_binary: Opens a regular file or an archive member for reading.
+- list_members: Returns the virtual paths of the files in an archive.
+
+Dependencies:
+- zipfile, tarfile: Used to read the archives. They are imported on first use, so paths
+  that do not point into archives cost nothing extra.
+"""
+
+import io
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+# Separates the archive from the member in a virtual path
+ARCHIVE_SEPARATOR = '!/'
+# Number of archives whose member lists are kept open
+_CACHE_SIZE = 16
+_ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+_COMPRESSED_MAGIC = (b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00')
+
+MemberInfo = namedtuple('MemberInfo', ['size', 'mtime', 'is_dir'])
+MemberInfo.__doc__ = """
+Information about an archive member.
+
+Attributes:
+- size (int): The uncompressed size in bytes (0 for directories).
+- mtime (float): The modification time, as a timestamp.
+- is_dir (bool): Whether the member is a directory.
+"""
+
+def split_archive_path(path):
+    """
+    Splits a virtual path into the archive path and the member name.
+
+    Only separators preceded by an existing regular file are considered, so paths that merely
+    contain '!/' in a directory name are left alone.
+
+    Parameters:
+    - path (str): The path to split.
+
+    Returns:
+    - tuple: `(archive, member)`, or None if the path does not point into an archive.
+
+    Example:
+    >>> split_archive_path('/srv/bundle.zip!/dir/photo.jpg')
+    ('/srv/bundle.zip', 'dir/photo.jpg')
+    """
+    if not isinstance(path, str) or ARCHIVE_SEPARATOR not in path:
+        return None
+    position = path.find(ARCHIVE_SEPARATOR)
+    while position != -1:
+        archive = path[:position]
+        if archive and os.path.isfile(archive):
+            return archive, _normalize(path[position + len(ARCHIVE_SEPARATOR):])
+        position = path.find(ARCHIVE_SEPARATOR, position + 1)
+    return None
+
+def _normalize(name):
+    # Tar members may be stored as './name' and directories with a trailing slash
+    while name.startswith('./'):
+        name = name[2:]
+    return name.strip('/')
+
+class _MemberReader(io.RawIOBase):
+    """
+    Reads the bytes of a member stored uncompressed at a known offset of the archive, with
+    its own file handle so readers never share a file position.
+    """
+
+    def __init__(self, path, offset, size):
+        self._file = open(path, 'rb')
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._size - self._position)
+        if count <= 0:
+            return 0
+        self._file.seek(self._offset + self._position)
+        data = self._file.read(count)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("Negative seek position.")
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+class _OwningReader(io.BufferedReader):
+    """
+    A member stream that also closes the archive it was opened from.
+    """
+
+    def __init__(self, raw, owner):
+        super().__init__(raw)
+        self._owner = owner
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._owner.close()
+
+class _ZipArchive:
+    def __init__(self, path):
+        import zipfile
+
+        self._zip = zipfile.ZipFile(path)
+        self.members = {}
+        self.directories = set()
+        for info in self._zip.infolist():
+            name = _normalize(info.filename)
+            if info.is_dir():
+                self.directories.add(name)
+            else:
+                self.members[name] = info
+            _add_parents(self.directories, name)
+
+    def info(self, member):
+        info = self.members[member]
+        return MemberInfo(info.file_size, time.mktime(info.date_time + (0, 0, -1)), False)
+
+    def open(self, member):
+        return self._zip.open(self.members[member])
+
+    def close(self):
+        self._zip.close()
+
+class _TarArchive:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.compressed = f.read(6).startswith(_COMPRESSED_MAGIC)
+        self.members = {}
+        self.directories = set()
+        with _tarfile().open(path, 'r:*') as tar:
+            for info in tar:
+                name = _normalize(info.name)
+                if info.isdir():
+                    self.directories.add(name)
+                elif info.isfile() or info.islnk() or info.issym():
+                    self.members[name] = info
+                _add_parents(self.directories, name)
+
+    def info(self, member):
+        info = self.members[member]
+        return MemberInfo(info.size, float(info.mtime), False)
+
+    def open(self, member):
+        info = self.members[member]
+        if info.isfile() and not self.compressed and not info.sparse:
+            return io.BufferedReader(_MemberReader(self.path, info.offset_data, info.size))
+        # Links and compressed archives go through tarfile, which resolves and decompresses
+        tar = _tarfile().open(self.path, 'r:*')
+        try:
+            stream = tar.extractfile(info)
+        except BaseException:
+            tar.close()
+            raise
+        if stream is None:
+            tar.close()
+            raise FileNotFoundError(f"The archive member '{member}' cannot be read.")
+        return _OwningReader(_StreamAdapter(stream), tar)
+
+    def close(self):
+        pass
+
+class _StreamAdapter(io.RawIOBase):
+    """
+    Exposes a tarfile member stream as a raw stream, so it can be buffered and owned.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._stream.seek(offset, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+        super().close()
+
+def _tarfile():
+    import tarfile  # Deferred: only needed once an archive is opened
+
+    return tarfile
+
+def _add_parents(directories, name):
+    parent = name.rpartition('/')[0]
+    while parent and parent not in directories:
+        directories.add(parent)
+        parent = parent.rpartition('/')[0]
+
+_archives = OrderedDict()
+_archives_lock = threading.Lock()
+
+def _load(archive):
+    """
+    Returns the cached member list of an archive, reading it if the archive is new or changed.
+    """
+    st = os.stat(archive)
+    # The process id is part of the key, so forked workers never share a file position
+    key = (os.getpid(), os.path.abspath(archive), st.st_mtime_ns, st.st_size)
+    with _archives_lock:
+        loaded = _archives.get(key)
+        if loaded is not None:
+            _archives.move_to_end(key)
+            return loaded
+
+    import zipfile
+
+    with open(archive, 'rb') as f:
+        magic = f.read(4)
+    try:
+        loaded = _ZipArchive(archive) if magic in _ZIP_MAGIC else _TarArchive(archive)
+    except (zipfile.BadZipFile, _tarfile().TarError) as e:
+        raise ValueError(f"'{archive}' is not a readable zip or tar archive: {e}") from None
+
+    with _archives_lock:
+        _archives[key] = loaded
+        while len(_archives) > _CACHE_SIZE:
+            # Open member streams keep their own reference to the archive file
+            _archives.popitem(last=False)[1].close()
+    return loaded
+
+def _resolve(path):
+    parts = split_archive_path(path)
+    if parts is None:
+        raise FileNotFoundError(f"'{path}' does not point into an existing archive.")
+    archive, member = parts
+    return archive, member, _load(archive)
+
+def stat_member(path):
+    """
+    Returns information about an archive member.
+
+    Parameters:
+    - path (str): The virtual path, e.g. 'bundle.zip!/dir/photo.jpg'.
+
+    Returns:
+    - MemberInfo: The size, modification time and kind of the member.
+
+    Raises:
+    - FileNotFoundError: If the archive or the member does not exist.
+    - ValueError: If the archive cannot be read.
+
+    Example:
+    >>> stat_member('/srv/bundle.zip!/dir/photo.jpg')
+    MemberInfo(size=482311, mtime=1717430400.0, is_dir=False)
+    """
+    archive, member, loaded = _resolve(path)
+    if member in loaded.members:
+        return loaded.info(member)
+    if member in loaded.directories or not member:
+        return MemberInfo(0, os.stat(archive).st_mtime, True)
+    raise FileNotFoundError(f"The archive '{archive}' has no member '{member}'.")
+
+def open_member(path):
+    """
+    Opens an archive member for reading, without extracting it.
+
+    Parameters:
+    - path (str): The virtual path, e.g. 'bundle.zip!/dir/photo.jpg'.
+
+    Returns:
+    - file object: A seekable binary stream. Only the bytes actually read are decompressed.
+
+    Raises:
+    - FileNotFoundError: If the archive or the member does not exist.
+    - IsADirectoryError: If the member is a directory.
+    - ValueError: If the archive cannot be read.
+
+    Example:
+    >>> with open_member('/srv/logs.tar.gz!/app.log') as f:
+    ...     header = f.read(8192)
+    """
+    archive, member, loaded = _resolve(path)
+    if member not in loaded.members:
+        if member in loaded.directories or not member:
+            raise IsADirectoryError(f"The archive member '{member}' is a directory.")
+        raise FileNotFoundError(f"The archive '{archive}' has no member '{member}'.")
+    return loaded.open(member)
+
+def open_binary(path):
+    """
+    Opens a regular file or, for virtual paths, an archive member for binary reading.
+    """
+    if split_archive_path(path) is not None:
+        return open_member(path)
+    return open(path, 'rb')
+
+def list_members(archive):
+    """
+    Returns the virtual paths of the files in an archive, in sorted order.
+
+    Parameters:
+    - archive (str): The path to the zip or tar archive.
+
+    Returns:
+    - list: Virtual paths such as 'bundle.zip!/dir/photo.jpg', ready to pass to
+      `get_file_type`, `get_metadata` or the preview functions.
+
+    Raises:
+    - ValueError: If the archive cannot be read.
+
+    Example:
+    >>> list_members('/srv/bundle.zip')
+    ['/srv/bundle.zip!/dir/photo.jpg', '/srv/bundle.zip!/readme.txt']
+    """
+    return [f"{archive}{ARCHIVE_SEPARATOR}{name}" for name in sorted(_load(archive).members)]
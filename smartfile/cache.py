@@ -0,0 +1,433 @@
+"""
+This module provides opt-in, on-disk caches that let smartfile skip work for files that have
+not changed since they were last processed.
+
+Files are identified by their stat identity: the device and inode numbers locate the file, and
+its size and modification time tell whether a cached entry is still valid. Checking an entry
+therefore costs a single `stat`, and entries are invalidated automatically when a file changes.
+
+Classes:
+- MetadataCache: A SQLite-backed cache for the results of `smartfile.metadata.get_metadata`,
+  with size-bounded LRU eviction and hit/miss counters.
+- ThumbnailCache: A directory of thumbnails produced by `smartfile.preview.preview_image_file`,
+  capped in total size with LRU eviction.
+
+Functions:
+- default_cache_dir: Returns the directory smartfile stores its caches in by default.
+
+Dependencies:
+- sqlite3: Used to store cached metadata.
+- json: Used to encode cached values.
+- PIL (Pillow): Used to read and write cached thumbnails.
+"""
+
+import os
+import json
+import base64
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+def default_cache_dir():
+    """
+    Returns the directory used for smartfile caches when no explicit location is given.
+
+    This is `$XDG_CACHE_HOME/smartfile`, or `~/.cache/smartfile` when the variable is unset.
+
+    Returns:
+    - str: The path of the cache directory (it is not created by this function).
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'smartfile')
+
+def _to_sqlite_int(value):
+    # SQLite integers are signed 64-bit; device and inode numbers are unsigned
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+# Keys of the one-entry JSON objects standing for values JSON has no type for
+_TAGS = ('__tuple__', '__bytes__', '__items__')
+
+def _tagged(value):
+    if isinstance(value, tuple):
+        return {'__tuple__': [_tagged(item) for item in value]}
+    if isinstance(value, list):
+        return [_tagged(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and not (
+                len(value) == 1 and next(iter(value)) in _TAGS):
+            return {key: _tagged(item) for key, item in value.items()}
+        # Non-string keys (e.g. unnamed EXIF tags) are kept as key-value pairs
+        return {'__items__': [[_tagged(key), _tagged(item)] for key, item in value.items()]}
+    return value
+
+def _untagged(obj):
+    if len(obj) == 1:
+        (key, value), = obj.items()
+        if key == '__tuple__':
+            return tuple(value)
+        if key == '__bytes__':
+            return base64.b64decode(value)
+        if key == '__items__':
+            return {item_key: item for item_key, item in value}
+    return obj
+
+def _encode_value(value):
+    """
+    Encodes a metadata value as JSON text. Tuples, bytes, dictionaries with non-string keys
+    and non-finite floats survive the round trip; other objects are stored as strings.
+    """
+    return json.dumps(_tagged(value), allow_nan=True, default=str)
+
+def _decode_value(text):
+    """
+    Decodes a value written by `_encode_value`.
+
+    Raises:
+    - ValueError: If the text cannot be decoded.
+    """
+    try:
+        return json.loads(text, object_hook=_untagged)
+    except (ValueError, TypeError, RecursionError) as e:
+        raise ValueError(f"Cannot decode the stored value: {e}") from None
+
+class MetadataCache:
+    """
+    Caches extracted file metadata in a local SQLite database.
+
+    Entries are keyed by `(st_dev, st_ino)` and store the `st_size` and `st_mtime_ns` they
+    were computed for; an entry whose size or modification time no longer matches is treated
+    as a miss and replaced on the next `put`. When the cache holds more than `max_entries`
+    entries, the least recently used ones are evicted.
+
+    Parameters:
+    - path (str): The database file. Defaults to 'metadata.sqlite3' in `default_cache_dir()`.
+    - max_entries (int): The maximum number of entries kept (default is 1,000,000).
+
+    Attributes:
+    - hits (int): The number of lookups answered from the cache.
+    - misses (int): The number of lookups that found no valid entry.
+
+    Example:
+    >>> with MetadataCache() as cache:
+    ...     get_metadata('/path/to/image.jpg', cache=cache)
+    {'format': 'JPEG', 'size': (1920, 1080), 'mode': 'RGB'}
+    """
+
+    # Number of writes buffered in a transaction before they are committed
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, path=None, max_entries=1000000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'metadata.sqlite3')
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " dev INTEGER NOT NULL, ino INTEGER NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " value TEXT NOT NULL, last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (dev, ino))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)"
+        )
+        self._conn.commit()
+
+        count, clock = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(MAX(last_used), 0) FROM metadata"
+        ).fetchone()
+        self._count = count
+        self._clock = clock
+        self._pending_writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def _wrote(self):
+        self._pending_writes += 1
+        if self._pending_writes >= self.COMMIT_INTERVAL:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def get(self, st):
+        """
+        Looks up the cached metadata for a file.
+
+        Parameters:
+        - st (os.stat_result): The current stat result of the file.
+
+        Returns:
+        - dict: The cached metadata, or None if there is no entry or the file has changed
+          since it was cached.
+        """
+        key = (_to_sqlite_int(st.st_dev), _to_sqlite_int(st.st_ino))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, value FROM metadata WHERE dev = ? AND ino = ?", key
+            ).fetchone()
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+                self.misses += 1
+                return None
+            try:
+                metadata = _decode_value(row[2])
+            except ValueError:
+                # A damaged entry is dropped and recomputed like any other miss
+                self._conn.execute("DELETE FROM metadata WHERE dev = ? AND ino = ?", key)
+                self._count -= 1
+                self.misses += 1
+                self._wrote()
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE metadata SET last_used = ? WHERE dev = ? AND ino = ?",
+                (self._tick(),) + key
+            )
+            self._wrote()
+        return metadata
+
+    def put(self, st, metadata):
+        """
+        Stores the metadata computed for a file, replacing any previous entry.
+
+        Parameters:
+        - st (os.stat_result): The stat result of the file the metadata was computed from.
+        - metadata (dict): The metadata. Strings, numbers (including NaN and infinities),
+          bytes, tuples, lists, dicts and None are read back as they were; other objects are
+          stored as strings.
+        """
+        key = (_to_sqlite_int(st.st_dev), _to_sqlite_int(st.st_ino))
+        value = _encode_value(metadata)
+        with self._lock:
+            existed = self._conn.execute(
+                "SELECT 1 FROM metadata WHERE dev = ? AND ino = ?", key
+            ).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (dev, ino, size, mtime_ns, value, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                key + (st.st_size, st.st_mtime_ns, value, self._tick())
+            )
+            if not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+            self._wrote()
+
+    def _evict(self):
+        # Evict down to 90% of the limit so eviction does not run on every insert
+        target = max(int(self.max_entries * 0.9), 1)
+        excess = self._count - target
+        self._conn.execute(
+            "DELETE FROM metadata WHERE rowid IN"
+            " (SELECT rowid FROM metadata ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self._count = target
+
+    def clear(self):
+        """
+        Removes every entry from the cache and resets the hit/miss counters.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM metadata")
+            self._conn.commit()
+            self._pending_writes = 0
+            self._count = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+        - dict: The number of `hits`, `misses` and stored `entries`.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": self._count}
+
+    def close(self):
+        """
+        Commits pending writes and closes the database.
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+class ThumbnailCache:
+    """
+    Stores thumbnails as PNG files in a directory so repeated previews skip decoding entirely.
+
+    Each thumbnail is content-addressed by the stat identity of its source file (device,
+    inode, size and modification time) and the requested size, so a changed source simply
+    maps to a new entry. When the files in the directory exceed `max_bytes` in total, the
+    least recently used ones are deleted.
+
+    Parameters:
+    - directory (str): Where thumbnails are stored. Defaults to 'thumbnails' in
+      `default_cache_dir()`.
+    - max_bytes (int): The maximum total size of the stored thumbnails (default is 256 MiB).
+
+    Attributes:
+    - hits (int): The number of thumbnails served from the cache.
+    - misses (int): The number of lookups that found no thumbnail.
+
+    Example:
+    >>> cache = ThumbnailCache()
+    >>> preview_image_file('/path/to/image.jpg', cache=cache)
+    <PIL.PngImagePlugin.PngImageFile image mode=RGB size=100x75 at 0x10F4B9B50>
+    """
+
+    SUFFIX = '.png'
+    # Modes PNG can store as is; anything else is converted before saving
+    _PNG_MODES = ('1', 'L', 'LA', 'I', 'P', 'RGB', 'RGBA')
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1.")
+        if directory is None:
+            directory = os.path.join(default_cache_dir(), 'thumbnails')
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # Entry name -> size in bytes, least recently used first
+        self._entries = OrderedDict()
+        self._total = 0
+
+        existing = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(self.SUFFIX) and entry.is_file():
+                    st = entry.stat()
+                    existing.append((st.st_mtime_ns, entry.name, st.st_size))
+        for _, name, size in sorted(existing):
+            self._entries[name] = size
+            self._total += size
+
+    @property
+    def total_bytes(self):
+        """The total size of the stored thumbnails in bytes."""
+        return self._total
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _name(self, st, size):
+        identity = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:{size[0]}x{size[1]}"
+        return hashlib.sha1(identity.encode()).hexdigest() + self.SUFFIX
+
+    def get(self, st, size):
+        """
+        Looks up the thumbnail of a file.
+
+        Parameters:
+        - st (os.stat_result): The current stat result of the source file.
+        - size (tuple): The requested thumbnail size as `(width, height)`.
+
+        Returns:
+        - PIL.Image.Image: The cached thumbnail, or None if there is none.
+        """
+        from PIL import Image
+
+        name = self._name(st, size)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+        try:
+            with Image.open(path) as img:
+                img.load()
+            # Persist the access so recency survives a restart
+            os.utime(path)
+        except OSError:
+            # The file vanished or is damaged (e.g. removed by another process)
+            with self._lock:
+                size_on_disk = self._entries.pop(name, 0)
+                self._total -= size_on_disk
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return img
+
+    def put(self, st, size, image):
+        """
+        Stores the thumbnail of a file, evicting old thumbnails if the cache grows too large.
+
+        Parameters:
+        - st (os.stat_result): The stat result of the source file.
+        - size (tuple): The requested thumbnail size as `(width, height)`.
+        - image (PIL.Image.Image): The thumbnail.
+        """
+        name = self._name(st, size)
+        if image.mode not in self._PNG_MODES:
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        # Write to a temporary file first so readers never see a partial thumbnail
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, format='PNG')
+            written = os.path.getsize(temp_path)
+            os.replace(temp_path, os.path.join(self.directory, name))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._total += written - self._entries.pop(name, 0)
+            self._entries[name] = written
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size_on_disk = self._entries.popitem(last=False)
+            self._total -= size_on_disk
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+        - dict: The number of `hits`, `misses`, stored `entries` and their total `bytes`.
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self._entries), "bytes": self._total}
@@ -0,0 +1,325 @@
+"""
+This module keeps a persistent, incrementally refreshed catalog of a directory tree.
+
+The catalog stores the path, size, modification time, MIME type (from `get_file_type`) and
+metadata (from `get_metadata`) of every file in a SQLite database. A refresh only lists
+directories whose modification time changed since the last refresh, and only re-detects
+files whose size, modification time or inode changed, so refreshing a large, mostly unchanged
+tree costs roughly one `stat` per directory.
+
+A directory's modification time changes when entries are added, removed or renamed in it, but
+not when an existing file is rewritten in place. Use `refresh(full=True)` to also stat every
+file in unchanged directories.
+
+Classes:
+- Catalog: A catalog of one directory tree, with indexed queries.
+
+Dependencies:
+- sqlite3: Used to store the catalog.
+- This module relies on `smartfile.file_types.get_file_types` and
+  `smartfile.metadata.get_metadata` to describe files.
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from smartfile.cache import _decode_value, _encode_value, _to_sqlite_int, default_cache_dir
+from smartfile.file_types import get_file_types
+from smartfile.metadata import get_metadata
+
+# Directories modified this recently are rescanned on the next refresh, because changes made
+# within the same timestamp tick would not alter their modification time again
+_RACY_WINDOW_NS = 2 * 10 ** 9
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS directories ("
+    " path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent)",
+    "CREATE TABLE IF NOT EXISTS files ("
+    " path TEXT PRIMARY KEY, directory TEXT NOT NULL, size INTEGER NOT NULL,"
+    " mtime_ns INTEGER NOT NULL, dev INTEGER NOT NULL, ino INTEGER NOT NULL,"
+    " mime TEXT, mime_major TEXT, metadata TEXT,"
+    " num_pages INTEGER, width INTEGER, height INTEGER)",
+    "CREATE INDEX IF NOT EXISTS files_directory ON files (directory)",
+    "CREATE INDEX IF NOT EXISTS files_mime ON files (mime, mtime_ns)",
+    "CREATE INDEX IF NOT EXISTS files_mime_major ON files (mime_major, mtime_ns)",
+    "CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime_ns)",
+    "CREATE INDEX IF NOT EXISTS files_size ON files (size)",
+    "CREATE INDEX IF NOT EXISTS files_num_pages ON files (num_pages)",
+    "CREATE INDEX IF NOT EXISTS files_dimensions ON files (width, height)",
+)
+
+def _subtree_bounds(path):
+    # Every path below `path` sorts between 'path/' and 'path0' ('0' follows '/')
+    return path + os.sep, path + chr(ord(os.sep) + 1)
+
+def _stored_metadata(text):
+    if text is None:
+        return None
+    try:
+        return _decode_value(text)
+    except ValueError:
+        return None  # A damaged row reads as a file without metadata
+
+class Catalog:
+    """
+    A persistent catalog of the files below a root directory.
+
+    Parameters:
+    - root (str): The directory tree to catalog.
+    - path (str): The database file. Defaults to a file named after the root in
+      `smartfile.cache.default_cache_dir()`.
+    - with_metadata (bool): Whether to store `get_metadata` output for each file (default is
+      True). Page counts and image dimensions are indexed for queries.
+
+    Example:
+    >>> with Catalog('/srv/archive') as catalog:
+    ...     catalog.refresh()
+    ...     week_ago = time.time() - 7 * 24 * 3600
+    ...     catalog.query(mime='application/pdf', min_pages=101, modified_after=week_ago)
+    [{'path': '/srv/archive/scans/board.pdf', 'size': 91827364, ...}]
+    """
+
+    # Number of directories refreshed between two commits
+    COMMIT_INTERVAL = 500
+
+    def __init__(self, root, path=None, with_metadata=True):
+        if not os.path.isdir(root):
+            raise ValueError(f"The directory {root} does not exist.")
+        self.root = os.path.abspath(root)
+        if path is None:
+            key = hashlib.sha1(os.fsencode(self.root)).hexdigest()[:16]
+            path = os.path.join(default_cache_dir(), f'catalog-{key}.sqlite3')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.with_metadata = with_metadata
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        if self._conn is not None:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    def refresh(self, full=False, workers=None):
+        """
+        Brings the catalog up to date with the filesystem.
+
+        Parameters:
+        - full (bool): Whether to stat every file, even in directories whose modification time
+          did not change. This catches files rewritten in place.
+        - workers (int): The number of threads used to detect types and extract metadata of
+          new or changed files. By default they are processed one at a time.
+
+        Returns:
+        - dict: Counts of 'directories_scanned', 'directories_skipped', 'files_added',
+          'files_updated' and 'files_removed'.
+        """
+        stats = dict.fromkeys(('directories_scanned', 'directories_skipped', 'files_added',
+                               'files_updated', 'files_removed'), 0)
+        scan_started = time.time_ns()
+        pool = ThreadPoolExecutor(max_workers=workers) if workers else None
+        conn = self._conn
+
+        try:
+            pending = [(self.root, None)]
+            refreshed = 0
+            while pending:
+                directory, parent = pending.pop()
+                try:
+                    st = os.stat(directory)
+                except OSError:
+                    self._remove_directory(directory, stats)
+                    continue
+
+                row = conn.execute("SELECT mtime_ns FROM directories WHERE path = ?",
+                                   (directory,)).fetchone()
+                if row is not None and row[0] == st.st_mtime_ns and not full:
+                    # Nothing was added, removed or renamed here: reuse the stored listing
+                    stats['directories_skipped'] += 1
+                    children = [child for (child,) in conn.execute(
+                        "SELECT path FROM directories WHERE parent = ?", (directory,))]
+                else:
+                    stats['directories_scanned'] += 1
+                    children = self._scan_directory(directory, pool, stats)
+
+                mtime_ns = st.st_mtime_ns
+                if mtime_ns >= scan_started - _RACY_WINDOW_NS:
+                    mtime_ns = -1  # Too recent to trust; rescan next time
+                conn.execute("INSERT OR REPLACE INTO directories (path, parent, mtime_ns)"
+                             " VALUES (?, ?, ?)", (directory, parent, mtime_ns))
+                pending.extend((child, directory) for child in reversed(children))
+
+                refreshed += 1
+                if refreshed % self.COMMIT_INTERVAL == 0:
+                    conn.commit()
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+            conn.commit()
+        return stats
+
+    def _scan_directory(self, directory, pool, stats):
+        """
+        Lists one directory, updating its files and forgetting subdirectories that are gone.
+        Returns the paths of its subdirectories.
+        """
+        conn = self._conn
+        known = {path: (size, mtime_ns, dev, ino) for path, size, mtime_ns, dev, ino in
+                 conn.execute("SELECT path, size, mtime_ns, dev, ino FROM files"
+                              " WHERE directory = ?", (directory,))}
+        children = []
+        changed = []
+        present = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    present.add(entry.path)
+                    identity = (st.st_size, st.st_mtime_ns, _to_sqlite_int(st.st_dev),
+                                _to_sqlite_int(st.st_ino))
+                    if known.get(entry.path) != identity:
+                        changed.append((entry, st))
+        except OSError:
+            pass
+
+        # Only new or changed files are described again
+        types = get_file_types(entry for entry, _ in changed)
+        describe = self._describe
+        rows = (pool.map(describe, changed, [types] * len(changed)) if pool is not None
+                else (describe(item, types) for item in changed))
+        for row in rows:
+            stats['files_updated' if row[0] in known else 'files_added'] += 1
+            conn.execute("INSERT OR REPLACE INTO files (path, directory, size, mtime_ns, dev,"
+                         " ino, mime, mime_major, metadata, num_pages, width, height)"
+                         " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+        removed = [path for path in known if path not in present]
+        conn.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+        stats['files_removed'] += len(removed)
+
+        # Forget subdirectories that no longer exist, with everything below them
+        still_there = set(children)
+        for (child,) in conn.execute("SELECT path FROM directories WHERE parent = ?",
+                                     (directory,)).fetchall():
+            if child not in still_there:
+                self._remove_directory(child, stats)
+        return children
+
+    def _describe(self, item, types):
+        entry, st = item
+        mime = types.get(entry.path)
+        metadata = None
+        num_pages = width = height = None
+        if self.with_metadata:
+            try:
+                metadata = dict(get_metadata(entry.path, mime_type=mime))
+            except Exception:
+                metadata = None  # Damaged files are still cataloged, without metadata
+        if metadata is not None:
+            num_pages = metadata.get('num_pages')
+            size = metadata.get('size')
+            if isinstance(size, tuple) and len(size) == 2:
+                width, height = size
+        return (entry.path, os.path.dirname(entry.path), st.st_size, st.st_mtime_ns,
+                _to_sqlite_int(st.st_dev), _to_sqlite_int(st.st_ino), mime,
+                mime.split('/')[0] if mime else None,
+                _encode_value(metadata) if metadata is not None else None, num_pages, width, height)
+
+    def _remove_directory(self, directory, stats):
+        low, high = _subtree_bounds(directory)
+        cursor = self._conn.execute(
+            "DELETE FROM files WHERE directory = ? OR (directory >= ? AND directory < ?)",
+            (directory, low, high))
+        stats['files_removed'] += max(cursor.rowcount, 0)
+        self._conn.execute(
+            "DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)",
+            (directory, low, high))
+
+    def query(self, mime=None, mime_major=None, min_size=None, max_size=None,
+              modified_after=None, modified_before=None, min_pages=None, max_pages=None,
+              min_width=None, min_height=None, under=None, limit=None):
+        """
+        Returns the cataloged files matching every given condition, using the indexes.
+
+        Parameters:
+        - mime (str): An exact MIME type, e.g. 'application/pdf'.
+        - mime_major (str): A MIME major type, e.g. 'image'.
+        - min_size, max_size (int): Bounds on the file size in bytes (inclusive).
+        - modified_after, modified_before (float): Bounds on the modification time, in seconds
+          since the epoch (inclusive).
+        - min_pages, max_pages (int): Bounds on the number of PDF pages (inclusive).
+        - min_width, min_height (int): Minimum image dimensions in pixels.
+        - under (str): Only include files below this directory.
+        - limit (int): The maximum number of results.
+
+        Returns:
+        - list: One dictionary per file with its 'path', 'size', 'mtime' (seconds), 'mime'
+          and 'metadata', ordered by path.
+        """
+        conditions = []
+        parameters = []
+
+        def add(condition, value):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+
+        add("mime = ?", mime)
+        add("mime_major = ?", mime_major)
+        add("size >= ?", min_size)
+        add("size <= ?", max_size)
+        add("mtime_ns >= ?", int(modified_after * 1e9) if modified_after is not None else None)
+        add("mtime_ns <= ?", int(modified_before * 1e9) if modified_before is not None else None)
+        add("num_pages >= ?", min_pages)
+        add("num_pages <= ?", max_pages)
+        add("width >= ?", min_width)
+        add("height >= ?", min_height)
+        if under is not None:
+            low, high = _subtree_bounds(os.path.abspath(under))
+            conditions.append("(directory = ? OR (directory >= ? AND directory < ?))")
+            parameters.extend((os.path.abspath(under), low, high))
+
+        sql = "SELECT path, size, mtime_ns, mime, metadata FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        return [{
+            "path": path,
+            "size": size,
+            "mtime": mtime_ns / 1e9,
+            "mime": mime_type,
+            "metadata": _stored_metadata(metadata),
+        } for path, size, mtime_ns, mime_type, metadata in self._conn.execute(sql, parameters)]
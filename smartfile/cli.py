@@ -0,0 +1,263 @@
+"""
+This module implements the `smartfile-cli` command.
+
+Every subcommand prints one JSON object per line as soon as each result is ready, so the output
+can be piped into other tools while the command is still running. Paths are given as
+arguments or, with '-', read from standard input (one per line, or NUL-delimited with `-0`).
+
+Subcommands:
+- organize: Organizes a directory by file type, or with a JSON rule set.
+- rename: Bulk renames the files of a directory with a prefix.
+- type: Prints the MIME type of files.
+- metadata: Prints the metadata of files.
+- preview: Prints the first lines of text files.
+
+Functions:
+- main: The entry point of the command.
+
+Dependencies:
+- argparse: Used to parse the command line.
+- json: Used to format the output.
+"""
+
+import os
+import sys
+import json
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from smartfile.concurrency import bounded_map
+from smartfile.file_management import organize_by_type
+from smartfile.file_types import get_file_type
+from smartfile.metadata import get_metadata
+from smartfile.preview import preview_text_file
+from smartfile.renaming import bulk_rename
+from smartfile.rules import load_rules
+from smartfile.scanning import scan_files
+
+# Size of the blocks read from standard input when paths are NUL-delimited
+_STDIN_BLOCK_SIZE = 64 * 1024
+
+class _UsageError(Exception):
+    """
+    Raised for invalid arguments found after parsing, e.g. a missing directory.
+    """
+
+def _directory_argument(path):
+    if not os.path.isdir(path):
+        raise _UsageError(f"'{path}' is not a valid directory.")
+    return path
+
+def _rules_argument(path):
+    try:
+        return load_rules(path)
+    except (OSError, ValueError) as e:
+        raise _UsageError(f"Cannot load the rules: {e}") from None
+
+def _read_stdin_paths(null):
+    stream = sys.stdin.buffer
+    if not null:
+        for line in stream:
+            line = line.rstrip(b'\n')
+            if line:
+                yield os.fsdecode(line)
+        return
+    remainder = b''
+    for block in iter(lambda: stream.read(_STDIN_BLOCK_SIZE), b''):
+        parts = (remainder + block).split(b'\0')
+        remainder = parts.pop()
+        for part in parts:
+            if part:
+                yield os.fsdecode(part)
+    if remainder:
+        yield os.fsdecode(remainder)
+
+def _iter_paths(arguments, recursive, null):
+    """
+    Yields the files named by the arguments, expanding '-' to the paths read from standard
+    input and directories to the files they contain.
+    """
+    for argument in arguments:
+        sources = _read_stdin_paths(null) if argument == '-' else (argument,)
+        for path in sources:
+            if os.path.isdir(path):
+                for entry in scan_files(path, recursive=recursive):
+                    yield entry.path
+            else:
+                yield path
+
+def _emit(record):
+    sys.stdout.write(json.dumps(record, default=str) + '\n')
+    sys.stdout.flush()
+
+def _type_of(path):
+    return {"path": path, "mime_type": get_file_type(path)}
+
+def _metadata_of(path, fields=None):
+    return {"path": path, "metadata": dict(get_metadata(path, fields=fields))}
+
+def _preview_of(path, num_lines, max_bytes):
+    return {"path": path, "preview": preview_text_file(path, num_lines=num_lines,
+                                                       max_bytes=max_bytes)}
+
+def _run_per_path(args, func, executor_class=ThreadPoolExecutor):
+    """
+    Applies `func` to every path, printing results in completion order. Returns the exit
+    status: 1 if any path failed, 0 otherwise.
+    """
+    paths = _iter_paths(args.paths, args.recursive, args.null)
+    failed = False
+
+    if args.jobs == 1:
+        outcomes = ((path, _call(func, path)) for path in paths)
+        for path, (record, error) in outcomes:
+            failed |= _report(path, record, error)
+        return int(failed)
+
+    with executor_class(max_workers=args.jobs) as executor:
+        for path, future in bounded_map(executor, func, paths, max_pending=args.jobs * 4):
+            try:
+                record, error = future.result(), None
+            except Exception as e:
+                record, error = None, e
+            failed |= _report(path, record, error)
+    return int(failed)
+
+def _call(func, path):
+    try:
+        return func(path), None
+    except Exception as e:
+        return None, e
+
+def _report(path, record, error):
+    if error is None:
+        _emit(record)
+        return False
+    _emit({"path": path, "error": str(error) or type(error).__name__})
+    return True
+
+def _command_type(args):
+    return _run_per_path(args, _type_of)
+
+def _command_metadata(args):
+    # Image and PDF parsing is CPU-bound, so parallel runs use processes
+    fields = frozenset(args.fields.split(',')) if args.fields else None
+    return _run_per_path(args, functools.partial(_metadata_of, fields=fields),
+                         executor_class=ProcessPoolExecutor)
+
+def _command_preview(args):
+    return _run_per_path(args, functools.partial(_preview_of, num_lines=args.lines,
+                                                 max_bytes=args.max_bytes))
+
+def _command_organize(args):
+    def on_result(status, source, detail):
+        key = "destination" if status == 'moved' else "reason"
+        _emit({"status": status, "path": source, key: detail})
+
+    directory = _directory_argument(args.directory)
+    rules = _rules_argument(args.rules) if args.rules else None
+    result = organize_by_type(directory, workers=args.jobs if args.jobs > 1 else None,
+                              recursive=args.recursive, checkpoint=args.checkpoint,
+                              on_result=on_result, keep_records=False, rules=rules)
+    return int(bool(result.counts['failed']))
+
+def _command_rename(args):
+    directory = os.path.abspath(_directory_argument(args.directory))
+    for name in bulk_rename(directory, prefix=args.prefix, dry_run=args.dry_run,
+                            journal=args.journal):
+        _emit({"path": os.path.join(directory, name)})
+    return 0
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return number
+
+def _build_parser():
+    parser = argparse.ArgumentParser(
+        prog='smartfile-cli',
+        description="Organize, rename, identify and preview files. Results are printed as "
+                    "JSON lines as soon as they are ready.")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-j', '--jobs', type=_positive_int, default=1,
+                        help="number of files processed in parallel (default: 1)")
+    common.add_argument('-r', '--recursive', action='store_true',
+                        help="descend into subdirectories")
+
+    paths = argparse.ArgumentParser(add_help=False)
+    paths.add_argument('paths', nargs='+', metavar='path',
+                       help="files or directories; '-' reads paths from standard input")
+    paths.add_argument('-0', '--null', action='store_true',
+                       help="paths read from standard input are NUL-delimited")
+
+    organize = subparsers.add_parser('organize', parents=[common],
+                                     help="move files into subdirectories named after their type")
+    organize.add_argument('directory')
+    organize.add_argument('--checkpoint', metavar='FILE',
+                          help="progress file used to resume an interrupted run")
+    organize.add_argument('--rules', metavar='FILE',
+                          help="JSON rule set choosing the destination folders "
+                               "(default: one folder per MIME major type)")
+    organize.set_defaults(handler=_command_organize)
+
+    rename = subparsers.add_parser('rename', help="add a prefix and an index to file names")
+    rename.add_argument('directory')
+    rename.add_argument('--prefix', default='file_', help="prefix for new names (default: file_)")
+    rename.add_argument('--dry-run', action='store_true',
+                        help="print the new names without renaming anything")
+    rename.add_argument('--journal', metavar='FILE',
+                        help="journal used to recover from a crash or undo the renames")
+    rename.set_defaults(handler=_command_rename)
+
+    file_type = subparsers.add_parser('type', parents=[common, paths], help="print MIME types")
+    file_type.set_defaults(handler=_command_type)
+
+    metadata = subparsers.add_parser('metadata', parents=[common, paths], help="print metadata")
+    metadata.add_argument('--fields', metavar='NAMES',
+                          help="comma-separated fields to extract, e.g. size,mode or exif "
+                               "(default: all regular fields of each type)")
+    metadata.set_defaults(handler=_command_metadata)
+
+    preview = subparsers.add_parser('preview', parents=[common, paths],
+                                    help="print the first lines of text files")
+    preview.add_argument('-n', '--lines', type=_positive_int, default=5,
+                         help="number of lines per file (default: 5)")
+    preview.add_argument('--max-bytes', type=_positive_int, default=64 * 1024,
+                         help="maximum number of bytes read per file (default: 65536)")
+    preview.set_defaults(handler=_command_preview)
+    return parser
+
+def main(argv=None):
+    """
+    Runs `smartfile-cli` with the given arguments (default is `sys.argv[1:]`).
+
+    Returns:
+    - int: The exit status: 0 on success, 1 if some files failed or the command failed
+      partway through, 2 on invalid usage.
+
+    Example:
+    $ find /srv/inbox -name '*.pdf' -print0 | smartfile-cli metadata -0 --jobs 8 -
+    {"path": "/srv/inbox/report.pdf", "metadata": {"author": "Jane Doe", "num_pages": 12}}
+    """
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args)
+    except _UsageError as e:
+        print(f"smartfile-cli: {e}", file=sys.stderr)
+        return 2
+    except ValueError as e:
+        print(f"smartfile-cli: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); stop quietly without a second error at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
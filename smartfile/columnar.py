@@ -0,0 +1,509 @@
+"""
+This module stores the results of scanning large directory trees column by column.
+
+A dictionary per file costs around a kilobyte; a `ScanTable` keeps one typed array per field
+(size, modification time, MIME type, image dimensions and mode, page count) plus a compact
+path store, for a few dozen bytes per file. MIME types and image modes are interned in small
+tables and stored as integer codes, and paths are stored once per directory plus the file name
+bytes. Summaries grouped by MIME type, MIME major type, image mode or directory run over the
+columns, with NumPy when it is installed and plain loops otherwise.
+
+Tables are saved in a single binary file whose columns can be memory-mapped on load, so a
+saved scan of tens of millions of files opens instantly and is paged in on demand.
+
+Classes:
+- ScanRecord: The fields of one file, as returned when indexing a table.
+- ScanTable: Column-oriented scan results.
+
+Functions:
+- scan_table: Scans a directory tree into a `ScanTable`.
+
+Dependencies:
+- array: Used to store the columns.
+- mmap: Used to map saved tables.
+- numpy (optional): Used for the group-by summaries and `ScanTable.column(..., numpy=True)`.
+  It is imported on first use, and everything works without it.
+"""
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from smartfile.concurrency import bounded_map
+from smartfile.file_types import get_file_types
+from smartfile.metadata import get_metadata
+from smartfile.scanning import scan_files
+
+_MAGIC = b'SFSCAN01'
+_ALIGNMENT = 8
+# Value stored for missing integers (width, height, page count)
+MISSING = -1
+# Columns and their array typecodes. 'directory' and 'name' index the path stores; 'mime' and
+# 'mode' index the interned tables, where 0 stands for None.
+_COLUMNS = (
+    ('directory', 'I'),
+    ('size', 'q'),
+    ('mtime', 'd'),
+    ('mime', 'I'),
+    ('width', 'i'),
+    ('height', 'i'),
+    ('mode', 'H'),
+    ('num_pages', 'i'),
+)
+_STORES = ('names', 'directories')
+_INTERNED = {'mime': 'MIME types', 'mode': 'image modes'}
+_GROUPS = ('mime', 'mime_major', 'mode', 'directory')
+_METADATA_FIELDS = frozenset(('size', 'mode', 'num_pages'))
+# Number of directory entries whose types are detected in one call
+_BATCH_SIZE = 1024
+
+ScanRecord = namedtuple('ScanRecord', ['path', 'size', 'mtime', 'mime_type', 'width', 'height',
+                                       'mode', 'num_pages'])
+ScanRecord.__doc__ = """
+The fields of one file of a `ScanTable`.
+
+Attributes:
+- path (str): The file path.
+- size (int): The size in bytes.
+- mtime (float): The modification time.
+- mime_type (str): The MIME type, or None if unknown.
+- width, height (int): The image dimensions, or None for other files.
+- mode (str): The image mode (e.g. 'RGB'), or None for other files.
+- num_pages (int): The number of pages of a PDF, or None for other files.
+"""
+
+_numpy_module = None
+
+def _numpy():
+    """
+    Returns the numpy module, or None if it is not installed.
+    """
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            import numpy  # Deferred: optional and slow to import
+        except ImportError:
+            numpy = False
+        _numpy_module = numpy
+    return _numpy_module or None
+
+class _StringStore:
+    """
+    Strings stored as one byte buffer and an array of end offsets, at one offset per string
+    on top of the encoded bytes.
+    """
+
+    def __init__(self, data=None, offsets=None):
+        self.data = bytearray() if data is None else data
+        self.offsets = array.array('Q', [0]) if offsets is None else offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return os.fsdecode(bytes(self.data[self.offsets[index]:self.offsets[index + 1]]))
+
+    def append(self, value):
+        self.data += os.fsencode(value)
+        self.offsets.append(len(self.data))
+        return len(self.offsets) - 2
+
+class ScanTable:
+    """
+    Column-oriented scan results: one array per field, interned MIME types and image modes,
+    and a compact path store.
+
+    Tables are built by `scan_table` or with `append`, and saved with `save`. Tables returned
+    by `ScanTable.load` are read-only views of the mapped file; close them (or use a `with`
+    block) to release the file.
+
+    Attributes:
+    - mime_types (list): The interned MIME types; the 'mime' column holds indexes into it.
+    - modes (list): The interned image modes; the 'mode' column holds indexes into it.
+
+    Example:
+    >>> table = scan_table('/srv/archive', metadata=True)
+    >>> table.summarize('mime_major')
+    {'image': {'count': 120000, 'bytes': 431298372011}, 'text': {'count': 8000, ...}, ...}
+    >>> table.save('/srv/reports/archive.scan')
+    """
+
+    def __init__(self):
+        self.mime_types = [None]
+        self.modes = [None]
+        self._columns = {name: array.array(typecode) for name, typecode in _COLUMNS}
+        self._names = _StringStore()
+        self._directories = _StringStore()
+        self._interned = {'mime': {None: 0}, 'mode': {None: 0}, 'directory': {}}
+        self._mapped = None
+
+    def __len__(self):
+        return len(self._columns['size'])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ScanTable index out of range.")
+        columns = self._columns
+        width, height, num_pages = (columns[name][index] for name in ('width', 'height',
+                                                                      'num_pages'))
+        return ScanRecord(
+            self.path(index), columns['size'][index], columns['mtime'][index],
+            self.mime_types[columns['mime'][index]],
+            None if width == MISSING else width, None if height == MISSING else height,
+            self.modes[columns['mode'][index]], None if num_pages == MISSING else num_pages)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def path(self, index):
+        """
+        Returns the path of the file at `index`.
+        """
+        directory = self._directories[self._columns['directory'][index]]
+        return os.path.join(directory, self._names[index])
+
+    def column(self, name, numpy=False):
+        """
+        Returns a column as an `array.array` (or a read-only `memoryview` for loaded tables),
+        or as a NumPy array sharing the same memory with `numpy=True`.
+
+        Parameters:
+        - name (str): One of 'directory', 'size', 'mtime', 'mime', 'width', 'height', 'mode'
+          and 'num_pages'.
+        - numpy (bool): Whether to return a NumPy array. NumPy must be installed.
+        """
+        values = self._columns[name]
+        if not numpy:
+            return values
+        np = _numpy()
+        if np is None:
+            raise ImportError("numpy is required for numpy=True.")
+        return np.frombuffer(values, dtype=values.typecode if isinstance(values, array.array)
+                             else values.format)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes held by the columns and path stores.
+        """
+        total = sum(len(values) * values.itemsize for values in self._columns.values())
+        for store in (self._names, self._directories):
+            total += len(store.data) + len(store.offsets) * store.offsets.itemsize
+        return total
+
+    def _code(self, kind, table, value):
+        """
+        Returns the interned code of `value`, or the code it will get once `_intern` adds it.
+        """
+        code = self._interned[kind].get(value)
+        if code is None:
+            code = len(table)
+            limit = 1 << (8 * self._columns[kind].itemsize)
+            if code >= limit:
+                raise ValueError(f"Too many distinct {_INTERNED[kind]}; a table holds at most "
+                                 f"{limit - 1}.")
+        return code
+
+    def _intern(self, kind, table, value, code):
+        if code == len(table):
+            self._interned[kind][value] = code
+            table.append(value)
+
+    def append(self, path, size, mtime, mime_type=None, width=None, height=None, mode=None,
+               num_pages=None):
+        """
+        Adds a file to the table.
+
+        Parameters:
+        - path (str): The file path.
+        - size (int): The size in bytes.
+        - mtime (float): The modification time.
+        - mime_type (str): The MIME type, if known.
+        - width, height (int): The image dimensions, for images.
+        - mode (str): The image mode, for images.
+        - num_pages (int): The page count, for PDFs.
+
+        Raises:
+        - ValueError: If the table was loaded from a file, a value does not fit its column, or
+          the table would hold too many distinct MIME types or image modes. The table is left
+          unchanged.
+        """
+        if self._mapped is not None:
+            raise ValueError("Tables loaded from a file are read-only.")
+        directory, name = os.path.split(path)
+        mime_code = self._code('mime', self.mime_types, mime_type)
+        mode_code = self._code('mode', self.modes, mode)
+        row = (('size', size), ('mtime', mtime), ('mime', mime_code),
+               ('width', MISSING if width is None else width),
+               ('height', MISSING if height is None else height),
+               ('mode', mode_code),
+               ('num_pages', MISSING if num_pages is None else num_pages))
+
+        columns = self._columns
+        appended = []
+        try:
+            for column, value in row:
+                columns[column].append(value)
+                appended.append(column)
+        except (OverflowError, TypeError) as e:
+            # Keep every column the same length
+            for column in appended:
+                columns[column].pop()
+            raise ValueError(f"Cannot store {path!r}: {e}") from None
+        self._intern('mime', self.mime_types, mime_type, mime_code)
+        self._intern('mode', self.modes, mode, mode_code)
+
+        codes = self._interned['directory']
+        code = codes.get(directory)
+        if code is None:
+            code = codes[directory] = self._directories.append(directory)
+        columns['directory'].append(code)
+        self._names.append(name)
+
+    def _group_codes(self, by):
+        """
+        Returns the group code of every row, as a column or a list, and the group labels.
+        """
+        if by == 'mime':
+            return self._columns['mime'], self.mime_types
+        if by == 'mode':
+            return self._columns['mode'], self.modes
+        if by == 'directory':
+            return self._columns['directory'], [self._directories[index] for index in
+                                                range(len(self._directories))]
+        if by == 'mime_major':
+            labels = [None]
+            major_of = []
+            for mime_type in self.mime_types:
+                major = mime_type.split('/')[0] if mime_type else None
+                if major not in labels:
+                    labels.append(major)
+                major_of.append(labels.index(major))
+            mime = self._columns['mime']
+            np = _numpy()
+            if np is not None:
+                return np.asarray(major_of, dtype=np.int64)[self.column('mime', numpy=True)], labels
+            return [major_of[code] for code in mime], labels
+        raise ValueError(f"Cannot group by {by!r}; use one of {', '.join(_GROUPS)}.")
+
+    def summarize(self, by='mime_major'):
+        """
+        Counts the files and adds up their sizes per group.
+
+        Parameters:
+        - by (str): 'mime_major' (e.g. 'image'), 'mime', 'mode' (the image mode) or
+          'directory' (default is 'mime_major'). Files without a value are grouped under None.
+
+        Returns:
+        - dict: Maps each group to a dictionary with its 'count' and 'bytes'.
+
+        Example:
+        >>> table.summarize('mode')
+        {None: {'count': 9120, 'bytes': 88412993}, 'RGB': {'count': 880, 'bytes': 2210012001}}
+        """
+        codes, labels = self._group_codes(by)
+        np = _numpy()
+        if np is not None:
+            if not isinstance(codes, np.ndarray):
+                codes = np.frombuffer(codes, dtype=codes.typecode if isinstance(
+                    codes, array.array) else codes.format)
+            counts = np.bincount(codes, minlength=len(labels)).tolist()
+            sizes = np.bincount(codes, weights=self.column('size', numpy=True),
+                                minlength=len(labels)).tolist()
+        else:
+            counts = [0] * len(labels)
+            sizes = [0] * len(labels)
+            for code, size in zip(codes, self._columns['size']):
+                counts[code] += 1
+                sizes[code] += size
+        return {labels[code]: {"count": count, "bytes": int(sizes[code])}
+                for code, count in enumerate(counts) if count}
+
+    def save(self, path):
+        """
+        Writes the table to a file that `ScanTable.load` can memory-map.
+
+        The file holds a small JSON header (the interned tables and the position of each
+        column) followed by the raw columns, each aligned to 8 bytes. Columns are stored in
+        the byte order of the machine that wrote them.
+        """
+        buffers = [(name, self._columns[name]) for name, _ in _COLUMNS]
+        for store_name, store in zip(_STORES, (self._names, self._directories)):
+            buffers.append((f'{store_name}.offsets', store.offsets))
+            buffers.append((f'{store_name}.data', store.data))
+
+        layout = {}
+        offset = 0
+        for name, values in buffers:
+            view = memoryview(values)
+            layout[name] = {"format": view.format, "offset": offset, "length": len(view)}
+            offset += _padded(view.nbytes)
+        header = json.dumps({
+            "rows": len(self),
+            "byteorder": sys.byteorder,
+            "mime_types": self.mime_types,
+            "modes": self.modes,
+            "columns": layout,
+        }, ensure_ascii=True).encode('ascii')
+        start = _padded(len(_MAGIC) + 8 + len(header))
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(_MAGIC + struct.pack('<Q', len(header)) + header)
+            f.write(b'\0' * (start - f.tell()))
+            for name, values in buffers:
+                view = memoryview(values).cast('B')
+                f.write(view)
+                f.write(b'\0' * (_padded(len(view)) - len(view)))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Opens a table written by `save`. The columns are memory-mapped, not read, so opening
+        is instant and memory is only used for the parts that are accessed.
+
+        Raises:
+        - ValueError: If the file is not a saved table or was written on a machine with a
+          different byte order.
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"'{path}' is not a saved scan table.")
+            header_length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_length).decode('ascii'))
+            if header["byteorder"] != sys.byteorder:
+                raise ValueError(f"'{path}' was written with a different byte order.")
+            start = _padded(len(_MAGIC) + 8 + header_length)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        table = cls()
+        table._mapped = mapped
+        table.mime_types = header["mime_types"]
+        table.modes = header["modes"]
+        whole = memoryview(mapped)
+        views = {}
+        for name, spec in header["columns"].items():
+            begin = start + spec["offset"]
+            size = struct.calcsize(spec["format"])
+            views[name] = whole[begin:begin + spec["length"] * size].cast(spec["format"])
+        table._columns = {name: views[name] for name, _ in _COLUMNS}
+        table._names = _StringStore(views['names.data'], views['names.offsets'])
+        table._directories = _StringStore(views['directories.data'],
+                                          views['directories.offsets'])
+        table._views = list(views.values()) + [whole]
+        return table
+
+    def close(self):
+        """
+        Releases the mapped file of a loaded table. Does nothing for tables built in memory.
+        """
+        if self._mapped is None:
+            return
+        for view in self._views:
+            view.release()
+        self._mapped.close()
+
+def _padded(length):
+    return (length + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+def _describe_media(item):
+    """
+    Returns the width, height, mode and page count of an image or PDF, for the process pool.
+    """
+    path, mime_type = item
+    metadata = get_metadata(path, fields=_METADATA_FIELDS, mime_type=mime_type)
+    size = metadata.get('size') or (None, None)
+    return size[0], size[1], metadata.get('mode'), metadata.get('num_pages')
+
+def _has_media_metadata(mime_type):
+    return mime_type is not None and (mime_type.startswith('image/')
+                                      or mime_type == 'application/pdf')
+
+def scan_table(directory, recursive=True, metadata=False, workers=None, max_pending=None):
+    """
+    Scans a directory tree into a `ScanTable`.
+
+    Parameters:
+    - directory (str): The directory to scan.
+    - recursive (bool): Whether to include files in subdirectories (default is True).
+    - metadata (bool): Whether to read image dimensions and modes and PDF page counts
+      (default is False). Only those fields are extracted.
+    - workers (int): The number of worker processes extracting metadata. By default files are
+      parsed in the calling process.
+    - max_pending (int): The maximum number of files being parsed at once (default is four
+      per worker).
+
+    Returns:
+    - ScanTable: One row per file. Files whose metadata cannot be read are kept, without it.
+
+    Raises:
+    - ValueError: If the specified directory does not exist.
+
+    Example:
+    >>> table = scan_table('/srv/archive', metadata=True, workers=8)
+    >>> len(table), table.nbytes // len(table)
+    (12000000, 41)
+    """
+    if not os.path.isdir(directory):
+        raise ValueError(f"The directory {directory} does not exist.")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1.")
+
+    table = ScanTable()
+    media = {}  # Path -> (size, mtime, MIME type) of files waiting for their metadata
+
+    def rows():
+        entries = scan_files(directory, recursive=recursive)
+        while True:
+            batch = list(itertools.islice(entries, _BATCH_SIZE))
+            if not batch:
+                return
+            types = get_file_types(batch)
+            for entry in batch:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # Removed since it was listed
+                yield entry.path, st.st_size, st.st_mtime, types.get(entry.path)
+
+    def media_items():
+        for path, size, mtime, mime_type in rows():
+            if metadata and _has_media_metadata(mime_type):
+                media[path] = (size, mtime, mime_type)
+                yield path, mime_type
+            else:
+                table.append(path, size, mtime, mime_type)
+
+    def add(item, describe):
+        path, mime_type = item
+        size, mtime, _ = media.pop(path)
+        try:
+            width, height, mode, num_pages = describe()
+        except Exception:
+            width = height = mode = num_pages = None
+        table.append(path, size, mtime, mime_type, width, height, mode, num_pages)
+
+    if workers is None:
+        for item in media_items():
+            add(item, lambda: _describe_media(item))
+        return table
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for item, future in bounded_map(executor, _describe_media, media_items(),
+                                        max_pending=max_pending or workers * 4):
+            add(item, future.result)
+    return table
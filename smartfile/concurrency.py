@@ -0,0 +1,57 @@
+"""
+This module contains helpers for running smartfile operations on `concurrent.futures` executors.
+
+Functions:
+- bounded_map: Applies a function to every item of an iterable on an executor, keeping only a
+  bounded number of tasks in flight and yielding results as soon as they complete.
+
+Dependencies:
+- concurrent.futures: Used for submitting work and waiting on completed tasks.
+"""
+
+import itertools
+from concurrent.futures import FIRST_COMPLETED, wait
+
+def bounded_map(executor, func, iterable, max_pending=None):
+    """
+    Runs `func` on each item of `iterable` using `executor`, yielding `(item, future)` pairs
+    in completion order.
+
+    At most `max_pending` tasks are submitted at any time, so the iterable is consumed lazily
+    and memory stays flat however many items it produces.
+
+    Parameters:
+    - executor (concurrent.futures.Executor): The executor the tasks are submitted to.
+    - func (callable): The function to call with each item.
+    - iterable (iterable): The items to process.
+    - max_pending (int): The maximum number of tasks in flight (default is 64).
+
+    Returns:
+    - generator: Yields `(item, future)` tuples; `future` is already done, so calling
+      `future.result()` returns the value or raises the task's exception.
+
+    Example:
+    >>> with ThreadPoolExecutor(4) as pool:
+    ...     for path, future in bounded_map(pool, get_file_type, paths):
+    ...         print(path, future.result())
+    """
+    if max_pending is None:
+        max_pending = 64
+    if max_pending < 1:
+        raise ValueError("max_pending must be at least 1.")
+
+    items = iter(iterable)
+    pending = {}
+
+    # Prime the executor with the first batch of tasks
+    for item in itertools.islice(items, max_pending):
+        pending[executor.submit(func, item)] = item
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            item = pending.pop(future)
+            # Top the executor back up before handing the result to the caller
+            for next_item in itertools.islice(items, 1):
+                pending[executor.submit(func, next_item)] = next_item
+            yield item, future
@@ -0,0 +1,210 @@
+"""
+This module finds files with identical content.
+
+Files are compared in tiers, so that most of them are never read in full:
+1. Files are grouped by size; a file with a unique size cannot have a duplicate.
+2. Files sharing a size are hashed on their first and last `partial_size` bytes.
+3. Only files whose partial hashes collide are hashed in full (with BLAKE2b).
+
+Reads are spread over a thread pool and each group of duplicates is yielded as soon as its
+files have been hashed.
+
+Classes:
+- DuplicateGroup: A set of files with identical content.
+
+Functions:
+- find_duplicates: Finds groups of duplicate files in directories and file lists.
+
+Dependencies:
+- hashlib: Used to hash file contents.
+- This module relies on `smartfile.scanning` to walk directories and on
+  `smartfile.file_types.get_file_type` to label each group with its MIME type.
+"""
+
+import os
+import hashlib
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from smartfile.file_types import get_file_type
+from smartfile.scanning import scan_files
+
+DEFAULT_PARTIAL_SIZE = 64 * 1024
+_READ_SIZE = 1024 * 1024
+
+DuplicateGroup = namedtuple('DuplicateGroup', ['size', 'digest', 'mime_type', 'paths'])
+DuplicateGroup.__doc__ = """
+A group of files with identical content.
+
+Attributes:
+- size (int): The size of each file in bytes.
+- digest (str): The hexadecimal BLAKE2b digest of the content.
+- mime_type (str): The MIME type of the files, or None if it cannot be determined.
+- paths (list): The paths of the files, sorted.
+"""
+
+def _partial_digest(path, size, partial_size):
+    """
+    Hashes the first and last `partial_size` bytes of a file. For files no larger than
+    `2 * partial_size` this covers the whole content.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        if size <= 2 * partial_size:
+            digest.update(f.read())
+        else:
+            digest.update(f.read(partial_size))
+            f.seek(size - partial_size)
+            digest.update(f.read(partial_size))
+    return digest.hexdigest()
+
+def _full_digest(path):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _collect_sizes(paths, recursive, min_size):
+    """
+    Groups the files to compare by size, keeping one path per (device, inode) so hard links
+    and repeated arguments are not reported as duplicates of themselves.
+    """
+    by_size = {}
+    seen = set()
+
+    def add(path, st):
+        if st.st_size < min_size:
+            return
+        identity = (st.st_dev, st.st_ino)
+        if identity in seen:
+            return
+        seen.add(identity)
+        by_size.setdefault(st.st_size, []).append(path)
+
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in scan_files(path, recursive=recursive):
+                try:
+                    add(entry.path, entry.stat())
+                except OSError:
+                    continue
+        else:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                add(os.fspath(path), st)
+    return by_size
+
+def _make_group(size, digest, paths):
+    paths = sorted(paths)
+    try:
+        mime_type = get_file_type(paths[0])
+    except (OSError, ValueError):
+        mime_type = None
+    return DuplicateGroup(size, digest, mime_type, paths)
+
+def find_duplicates(paths, workers=None, recursive=True, min_size=1,
+                    partial_size=DEFAULT_PARTIAL_SIZE, max_pending=None):
+    """
+    Finds groups of files with identical content.
+
+    Parameters:
+    - paths (str or iterable): A directory or file, or an iterable of them.
+    - workers (int): The number of threads reading files (default is 1).
+    - recursive (bool): Whether to descend into subdirectories (default is True).
+    - min_size (int): Files smaller than this are ignored (default is 1, skipping empty files).
+    - partial_size (int): The number of bytes hashed at each end of a file before deciding
+      whether it needs a full hash (default is 64 KiB).
+    - max_pending (int): The maximum number of files being hashed at once (default is four
+      per worker).
+
+    Returns:
+    - generator: Yields a `DuplicateGroup` for each set of two or more identical files, as soon
+      as the set is known. Files that cannot be read are left out.
+
+    Example:
+    >>> for group in find_duplicates('/srv/ingest', workers=8):
+    ...     print(group.size, group.paths)
+    52428800 ['/srv/ingest/a/video.mp4', '/srv/ingest/b/video (1).mp4']
+    """
+    if isinstance(paths, (str, bytes, os.PathLike)):
+        paths = [paths]
+    if workers is None:
+        workers = 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if partial_size < 1:
+        raise ValueError("partial_size must be at least 1.")
+    if max_pending is None:
+        max_pending = workers * 4
+
+    by_size = _collect_sizes(paths, recursive, min_size)
+    # Largest files first: they hold the most reclaimable space
+    buckets = ((size, files) for size, files in sorted(by_size.items(), reverse=True)
+               if len(files) > 1)
+
+    def initial_tasks():
+        for size, files in buckets:
+            state[size] = {'remaining': len(files), 'digests': {}}
+            for path in files:
+                yield 'partial', size, path
+
+    state = {}
+    follow_ups = deque()  # Full-hash tasks, which take priority over new partial hashes
+    tasks = initial_tasks()
+    in_flight = {}
+
+    def submit(task):
+        stage, size, path = task
+        if stage == 'partial':
+            future = executor.submit(_partial_digest, path, size, partial_size)
+        else:
+            future = executor.submit(_full_digest, path)
+        in_flight[future] = task
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < max_pending:
+                if follow_ups:
+                    submit(follow_ups.popleft())
+                    continue
+                task = next(tasks, None)
+                if task is None:
+                    break
+                submit(task)
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, size, path = in_flight.pop(future)
+                bucket = state[size]
+                bucket['remaining'] -= 1
+                try:
+                    bucket['digests'][path] = future.result()
+                except OSError:
+                    pass  # The file vanished or cannot be read
+                if bucket['remaining']:
+                    continue
+
+                # Every file of this size has been hashed at the current stage
+                groups = {}
+                for file_path, digest in bucket['digests'].items():
+                    groups.setdefault(digest, []).append(file_path)
+                collisions = [group for group in groups.items() if len(group[1]) > 1]
+
+                if stage == 'full' or size <= 2 * partial_size:
+                    # The hashes cover the whole content: these are duplicates
+                    del state[size]
+                    for digest, files in collisions:
+                        yield _make_group(size, digest, files)
+                    continue
+
+                candidates = [file_path for _, files in collisions for file_path in files]
+                if not candidates:
+                    del state[size]
+                    continue
+                state[size] = {'remaining': len(candidates), 'digests': {}}
+                follow_ups.extend(('full', size, file_path) for file_path in candidates)
@@ -4,54 +4,325 @@ This module contains functions for organizing files within a directory based on
 The primary function exposed by this module is `organize_by_type`, which moves files into
 subdirectories based on the file type (e.g., 'image', 'text', 'audio').
 
+Classes:
+- OrganizeResult: The structured outcome of an `organize_by_type` run (moved, skipped and
+  failed files, with reasons).
+
 Functions:
-- organize_by_type: Organizes files in the specified directory by moving them into subdirectories 
-  named after their type (e.g., 'image', 'text', etc.).
+- organize_by_type: Organizes files in the specified directory by moving them into subdirectories
+  named after their type (e.g., 'image', 'text', etc.), or chosen by a `smartfile.rules` rule set.
 
 Dependencies:
-- This module relies on the `get_file_type` function from the `smartfile.file_types` submodule to 
+- This module relies on the `get_file_type` function from the `smartfile.file_types` submodule to
   determine the file type based on its content or extension.
+- Files are moved with `smartfile.transfer`, which falls back on a crash-safe copy when the
+  destination is on another filesystem.
+- Detection and moves are timed as the 'organize.detect' and 'organize.move' stages of
+  `smartfile.instrumentation`.
 """
 
 import os
-import shutil
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from smartfile.concurrency import bounded_map
 from smartfile.file_types import get_file_type
+from smartfile.instrumentation import stage
+from smartfile.transfer import move_file
+
+class OrganizeResult:
+    """
+    Describes what an `organize_by_type` run did with each file it looked at.
+
+    Attributes:
+    - moved (list): `(source, destination)` tuples for files that were moved.
+    - skipped (list): `(source, reason)` tuples for files that were left in place on purpose,
+      e.g. because their type could not be determined.
+    - failed (list): `(source, reason)` tuples for files that could not be processed because
+      of an error.
+    - counts (dict): The number of 'moved', 'skipped' and 'failed' files. Counts are always
+      kept, even when the per-file lists are disabled with `keep_records=False`.
+    """
+
+    def __init__(self, keep_records=True):
+        self.moved = []
+        self.skipped = []
+        self.failed = []
+        self.counts = {'moved': 0, 'skipped': 0, 'failed': 0}
+        self._keep_records = keep_records
+
+    def add(self, status, source, detail):
+        """
+        Records the outcome for one file; `status` is 'moved', 'skipped' or 'failed'.
+        """
+        self.counts[status] += 1
+        if self._keep_records:
+            getattr(self, status).append((source, detail))
+
+    def __repr__(self):
+        return (f"OrganizeResult(moved={self.counts['moved']}, skipped={self.counts['skipped']}, "
+                f"failed={self.counts['failed']})")
+
+class _FolderCache:
+    """
+    Creates destination folders at most once, even when several threads ask for the same
+    folder at the same time.
+    """
+
+    def __init__(self):
+        self._created = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, path):
+        # Fast path: the folder was already created by this run
+        if path in self._created:
+            return
+        with self._lock:
+            if path not in self._created:
+                os.makedirs(path, exist_ok=True)
+                self._created.add(path)
+
+class _Checkpoint:
+    """
+    Records the progress of an organize run in an append-only JSON-lines file, so an
+    interrupted run can resume without re-processing finished work.
+
+    Moved files disappear from their source directory on their own; the checkpoint only needs
+    to remember files that were left in place and directories whose files are all processed.
+    """
+
+    def __init__(self, path, directory):
+        self.path = path
+        # The checkpoint may live inside the organized directory; it must not be moved itself
+        self.abspath = os.path.abspath(path)
+        self.done_directories = set()
+        self.done_files = set()
+        directory = os.path.abspath(directory)
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        kind, value = json.loads(line)
+                    except ValueError:
+                        break  # A partially written last line from an interrupted run
+                    if kind == 'root' and value != directory:
+                        raise ValueError(f"The checkpoint '{path}' belongs to '{value}', "
+                                         f"not '{directory}'.")
+                    elif kind == 'dir':
+                        self.done_directories.add(value)
+                    elif kind == 'file':
+                        self.done_files.add(value)
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._write('root', directory)
+
+    def _write(self, kind, value):
+        self._file.write(json.dumps([kind, value]) + '\n')
+
+    def record_files(self, paths):
+        for path in paths:
+            self._write('file', path)
+        self._sync()
+
+    def record_directory(self, path):
+        self._write('dir', path)
+        self._sync()
 
-def organize_by_type(directory):
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, completed):
+        self._file.close()
+        if completed:
+            os.remove(self.path)
+
+def _organize_file(directory, filepath, folders, detect, move, rules=None):
+    """
+    Detects the type of a single file and moves it into its type subfolder of `directory`, or
+    into the folder chosen by `rules` (a `smartfile.rules.RuleSet`) when given.
+
+    Returns a `(status, source, detail)` tuple, where `status` is 'moved', 'skipped' or
+    'failed' and `detail` is the destination path or the reason, or None for files that are
+    already in their type subfolder.
     """
-    Organizes files in the specified directory by type. This function scans the given directory, 
+    try:
+        if rules is not None:
+            with stage('organize.detect'):
+                subfolder = rules.route(filepath, detect=detect)
+            if subfolder is None:
+                return 'skipped', filepath, "no rule matched"
+        else:
+            with stage('organize.detect'):
+                file_type = detect(filepath)
+            if not file_type:
+                return 'skipped', filepath, "unknown file type"
+            subfolder = file_type.split('/')[0]  # Example: 'image', 'text'
+
+        subfolder_path = os.path.join(directory, *subfolder.split('/'))
+        if os.path.dirname(filepath) == subfolder_path:
+            return None  # Already organized
+        destination = os.path.join(subfolder_path, os.path.basename(filepath))
+
+        # Never overwrite a file that is already organized under the same name
+        if os.path.lexists(destination):
+            return 'skipped', filepath, f"destination '{destination}' already exists"
+
+        folders.ensure(subfolder_path)
+        with stage('organize.move'):
+            move(filepath, destination)
+        return 'moved', filepath, destination
+    except Exception as e:
+        return 'failed', filepath, str(e)
+
+def organize_by_type(directory, workers=None, executor=None, recursive=False, chunk_size=1000,
+                     checkpoint=None, on_result=None, keep_records=True, mover=None, rules=None):
+    """
+    Organizes files in the specified directory by type. This function scans the given directory,
     identifies the type of each file, and moves it into a subdirectory based on its type.
 
+    The directory is read lazily with `os.scandir` and files are processed in chunks of
+    `chunk_size`, so memory use does not depend on the number of entries.
+
     Parameters:
     - directory (str): The path to the directory that contains the files to be organized.
+    - workers (int): The number of threads used to detect types and move files concurrently.
+      By default files are processed one at a time.
+    - executor (concurrent.futures.Executor): An optional executor used for type detection,
+      e.g. a `ProcessPoolExecutor` when content sniffing is the bottleneck. Moves always run
+      on threads. Without `workers`, the types of each chunk are detected on the executor in
+      bounded batches before its files are moved one at a time.
+    - recursive (bool): Whether to also organize files in subdirectories. They are moved into
+      the type subfolders of `directory` itself.
+    - chunk_size (int): The number of files processed between two checkpoints (default is 1000).
+    - checkpoint (str): An optional path to a progress file. If a run is interrupted, calling
+      `organize_by_type` again with the same checkpoint resumes where it stopped. The file is
+      removed once the run completes.
+    - on_result (callable): Called as `on_result(status, source, detail)` as soon as each file
+      is processed.
+    - keep_records (bool): Whether the result lists every file (default is True). Pass False
+      on very large runs to only keep counts.
+    - mover (smartfile.transfer.Mover): Moves the files. Moves within a filesystem are plain
+      renames; across filesystems the default mover copies with kernel-side zero-copy calls
+      into a temporary file that is renamed into place. Pass a `Mover` to limit concurrent
+      copies or bandwidth.
+    - rules (smartfile.rules.RuleSet): Chooses the destination folder of each file instead of
+      its MIME major type, e.g. by extension, size, age or image resolution. Build it with
+      `smartfile.rules.compile_rules`. Files the rule set cannot route are skipped.
+
+    Returns:
+    - OrganizeResult: The files that were moved, skipped and failed, with reasons.
 
     Raises:
     - ValueError: If the specified directory does not exist.
-    
+
     Example usage:
-    >>> organize_by_type('/path/to/directory')
+    >>> organize_by_type('/path/to/directory', workers=8)
+    OrganizeResult(moved=120, skipped=2, failed=0)
     This will organize all files in '/path/to/directory' by type into appropriate subdirectories.
     """
-    
+
     # Check if the provided directory exists
     if not os.path.exists(directory):
         raise ValueError(f"The directory {directory} does not exist.")
-    
-    # Loop through all files in the specified directory
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        
-        # Only process files (not subdirectories)
-        if os.path.isfile(filepath):
-            file_type = get_file_type(filepath)
-            
-            if file_type:
-                subfolder = file_type.split('/')[0]  # Example: 'image', 'text'
-                subfolder_path = os.path.join(directory, subfolder)
-                
-                # Create the subfolder if it doesn't already exist
-                if not os.path.exists(subfolder_path):
-                    os.makedirs(subfolder_path)
-                    
-                # Move the file to the appropriate subfolder
-                shutil.move(filepath, os.path.join(subfolder_path, filename))
\ No newline at end of file
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1.")
+
+    detected = {}  # Types already submitted to `executor`, by path
+    if executor is not None:
+        def detect(filepath):
+            future = detected.pop(filepath, None)
+            if future is None:
+                future = executor.submit(get_file_type, filepath)
+            return future.result()
+    else:
+        detect = get_file_type
+
+    folders = _FolderCache()
+    result = OrganizeResult(keep_records=keep_records)
+    progress = _Checkpoint(checkpoint, directory) if checkpoint is not None else None
+    pool = ThreadPoolExecutor(max_workers=workers) if workers is not None else None
+
+    move = mover.move if mover is not None else move_file
+
+    def organize(filepath):
+        return _organize_file(directory, filepath, folders, detect, move, rules)
+
+    def process(chunk):
+        if pool is None:
+            if executor is not None:
+                # One blocking call per file would leave the executor idle but for one task
+                detected.update(bounded_map(executor, get_file_type, chunk))
+            records = map(organize, chunk)
+        else:
+            records = (future.result() for _, future in
+                       bounded_map(pool, organize, chunk, max_pending=workers * 4))
+        kept = []
+        for record in records:
+            if record is None:
+                continue
+            status, source, detail = record
+            result.add(status, source, detail)
+            if on_result is not None:
+                on_result(status, source, detail)
+            if status != 'moved':
+                kept.append(source)
+        detected.clear()
+        if progress is not None:
+            progress.record_files(kept)
+
+    completed = False
+    try:
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            try:
+                entries = os.scandir(current)
+            except OSError as e:
+                if current == directory:
+                    raise
+                result.add('failed', current, str(e))
+                continue
+
+            # A directory finished by an earlier run is only listed for its subdirectories
+            files_done = progress is not None and current in progress.done_directories
+            subdirectories = []
+            chunk = []
+            with entries:
+                for entry in entries:
+                    try:
+                        # DirEntry caches the file type, so no extra stat is needed here
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                subdirectories.append(entry.path)
+                            continue
+                        if files_done or not entry.is_file():
+                            continue
+                    except OSError as e:
+                        result.add('failed', entry.path, str(e))
+                        continue
+                    if progress is not None and (entry.path in progress.done_files
+                                                 or os.path.abspath(entry.path) == progress.abspath):
+                        continue
+                    chunk.append(entry.path)
+                    if len(chunk) >= chunk_size:
+                        process(chunk)
+                        chunk = []
+            if chunk:
+                process(chunk)
+
+            if progress is not None and not files_done:
+                progress.record_directory(current)
+            pending.extend(reversed(subdirectories))
+        completed = True
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+        if progress is not None:
+            progress.close(completed)
+
+    return result
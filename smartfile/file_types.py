@@ -1,20 +1,137 @@
+"""
+This module provides functions to determine the MIME type of files.
+
+Functions:
+- get_file_type: Determines the MIME type of a single file from its extension or content.
+- get_file_types: Determines the MIME types of many files at once, with one `stat` and at most
+  one bounded header read per file.
+
+Both accept virtual paths into zip and tar archives (e.g. 'bundle.zip!/photo.jpg', see
+`smartfile.archives`); only the first bytes of such members are read.
+
+Dependencies:
+- mimetypes: Used to guess the MIME type from the file extension.
+- filetype: Used to guess the MIME type from the file content when the extension is unknown.
+  It is imported on first use.
+"""
+
 import os
+import stat
+import functools
 import mimetypes
-import filetype
+from smartfile import archives
+from smartfile.instrumentation import stage
+
+# Number of leading bytes read for content sniffing; matches what `filetype` inspects
+HEADER_SIZE = 8192
+
+# Magic numbers of the most common formats, indexed by their first byte so that a header is
+# only compared against the handful of signatures that can possibly match it. Container
+# formats whose subtype depends on their content (zip, tiff, ...) are left to `filetype`.
+# Each entry is (offset, signature, MIME type).
+_SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'BZh', 'application/x-bzip2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'fLaC', 'audio/x-flac'),
+    (0, b'\x7fELF', 'application/x-executable'),
+)
+
+def _build_signature_index(signatures):
+    index = {}
+    for offset, signature, mime in signatures:
+        index.setdefault(signature[0], []).append((offset, signature, mime))
+    return index
+
+_SIGNATURE_INDEX = _build_signature_index(_SIGNATURES)
+
+def _extension_key(filepath):
+    """
+    Reduces a path to the part `mimetypes` actually looks at: at most the last two suffixes
+    (e.g. '.tar.gz'). Keeping the key small makes the extension lookup cache effective.
+    """
+    name = os.path.basename(os.fsdecode(filepath))
+    root, ext = os.path.splitext(name)
+    if not ext:
+        return ''
+    inner = os.path.splitext(root)[1]
+    return inner + ext
+
+@functools.lru_cache(maxsize=4096)
+def _guess_from_extension(key):
+    """
+    Guesses a MIME type from an extension key, memoized so the `mimetypes` tables are only
+    consulted once per distinct extension.
+    """
+    if not key:
+        return None
+    return mimetypes.guess_type('file' + key)[0]
+
+def _match_signature(header):
+    """
+    Matches a header buffer against the precompiled signature table, falling back on
+    `filetype` for the less common formats.
+    """
+    if not header:
+        return None
+    for offset, signature, mime in _SIGNATURE_INDEX.get(header[0], ()):
+        if header.startswith(signature, offset):
+            return mime
+    import filetype  # Deferred: only needed for formats missing from the table
+
+    kind = filetype.guess(header)
+    return kind.mime if kind else None
+
+def _read_header(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read(HEADER_SIZE)
+
+def _detect(filepath, read_header=_read_header):
+    """
+    Detects the MIME type of a path that is known to be a regular file.
+    """
+    mime_type = _guess_from_extension(_extension_key(filepath))
+    if mime_type:
+        return mime_type
+    with stage('file_types.sniff') as current:
+        header = read_header(filepath)
+        current.add_bytes(len(header))
+        return _match_signature(header)
+
+def _read_member_header(filepath):
+    with archives.open_member(filepath) as f:
+        return f.read(HEADER_SIZE)
+
+def _detect_member(filepath):
+    """
+    Detects the MIME type of an archive member, raising like `get_file_type` if it is missing
+    or a directory.
+    """
+    if archives.stat_member(filepath).is_dir:
+        raise ValueError(f"The path '{filepath}' is a directory, not a file.")
+    return _detect(filepath, _read_member_header)
 
 def get_file_type(filepath):
     """
     Determines the MIME type of a file by inspecting its extension or content.
 
     The function first tries to guess the MIME type based on the file's extension using the
-    `mimetypes` library. If that fails, it falls back on the `filetype` library, which inspects 
-    the file's contents to guess its MIME type.
+    `mimetypes` library. If that fails, it falls back on the file's leading bytes, which are
+    matched against a table of common signatures and then against the `filetype` library.
 
     Parameters:
     - filepath (str): The path to the file whose MIME type is to be determined.
 
     Returns:
-    - str: The MIME type of the file (e.g., 'image/jpeg', 'text/plain'), or None if the type 
+    - str: The MIME type of the file (e.g., 'image/jpeg', 'text/plain'), or None if the type
       cannot be determined.
 
     Raises:
@@ -29,23 +146,69 @@ def get_file_type(filepath):
     # Validate input type
     if not isinstance(filepath, (str, bytes, os.PathLike)):
         raise TypeError(f"Invalid type for filepath: {type(filepath).__name__}")
+    if archives.split_archive_path(filepath) is not None:
+        return _detect_member(filepath)
 
-    # Check if the file exists
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"The file '{filepath}' does not exist.")
+    # A single stat answers both "does it exist" and "is it a directory"
+    try:
+        with stage('file_types.stat'):
+            st = os.stat(filepath)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"The file '{filepath}' does not exist.") from None
 
-    # Check if the path is a directory
-    if os.path.isdir(filepath):
+    if stat.S_ISDIR(st.st_mode):
         raise ValueError(f"The path '{filepath}' is a directory, not a file.")
 
-    # Try using mimetypes to guess based on file extension
-    mime_type, _ = mimetypes.guess_type(filepath)
-    if mime_type:
-        return mime_type
+    return _detect(filepath)
+
+def get_file_types(paths):
+    """
+    Determines the MIME types of many files at once.
+
+    Each file costs at most one `stat` and, when its extension is unknown, one bounded read of
+    its first `HEADER_SIZE` bytes. `os.DirEntry` objects (e.g. from `os.scandir`) are accepted
+    as well and reuse the type information cached by the directory scan, so regular files
+    found that way are not stat'ed again.
+
+    Parameters:
+    - paths (iterable): Paths (str, bytes or os.PathLike) or `os.DirEntry` objects.
+
+    Returns:
+    - dict: Maps each path (as given, or `entry.path` for directory entries) to its MIME type.
+      Paths that are missing, unreadable, directories or of an undetectable type map to None.
 
-    # If mimetypes failed, fall back to filetype for binary inspection
-    kind = filetype.guess(filepath)
-    if kind:
-        return kind.mime
+    Example:
+    >>> get_file_types(['/path/to/a.jpg', '/path/to/b'])
+    {'/path/to/a.jpg': 'image/jpeg', '/path/to/b': 'application/pdf'}
+    """
+    types = {}
+    for item in paths:
+        if isinstance(item, os.DirEntry):
+            filepath = item.path
+            try:
+                is_file = item.is_file()
+            except OSError:
+                is_file = False
+        else:
+            if not isinstance(item, (str, bytes, os.PathLike)):
+                raise TypeError(f"Invalid type for filepath: {type(item).__name__}")
+            filepath = item
+            if archives.split_archive_path(filepath) is not None:
+                try:
+                    types[filepath] = _detect_member(filepath)
+                except (OSError, ValueError):
+                    types[filepath] = None
+                continue
+            try:
+                is_file = not stat.S_ISDIR(os.stat(filepath).st_mode)
+            except OSError:
+                is_file = False
 
-    return None
\ No newline at end of file
+        if not is_file:
+            types[filepath] = None
+            continue
+        try:
+            types[filepath] = _detect(filepath)
+        except OSError:
+            types[filepath] = None
+    return types
@@ -0,0 +1,339 @@
+"""
+This module measures how long each stage of smartfile's work takes.
+
+The instrumented functions wrap their stages (stat, content sniffing, image decoding, PDF
+parsing, moves, renames, ...) in `stage(name)`. While no sink is registered, `stage` returns a
+shared do-nothing context manager, so the cost is one global lookup per stage. Once a sink is
+added, every stage produces an `Event` with its duration, the number of bytes it handled and
+the type of the exception it raised, if any.
+
+Stages:
+- file_types.stat, file_types.sniff: Checking a path and reading its header.
+- metadata.stat, metadata.image, metadata.exif, metadata.pdf, metadata.pdf_fallback: Stat-only
+  records, Pillow decoding, EXIF reading, the fast PDF parser and the PyPDF2 fallback.
+- preview.text_read, preview.image: Reading a text preview and decoding a thumbnail.
+- organize.detect, organize.move: Type detection and the move of each organized file.
+- rename.rename: Each rename of `bulk_rename`.
+- thumbnails.decode, thumbnails.resize, thumbnails.encode: The steps of `make_thumbnails`.
+- similarity.hash: Decoding and hashing an image in `image_hash`.
+
+Classes:
+- Event: One measured stage.
+- CallbackSink: Passes every event to a function.
+- HistogramSink: Aggregates events into per-stage counters and latency histograms in memory.
+- PrometheusTextfileSink: Writes aggregated metrics to a file in the Prometheus text format,
+  e.g. for the node_exporter textfile collector.
+
+Functions:
+- stage: Measures a stage of work.
+- add_sink, remove_sink: Register and unregister sinks.
+- instrumented: Registers sinks for the duration of a `with` block.
+
+Dependencies:
+- time: Used to measure durations with `time.perf_counter`.
+"""
+
+import os
+import time
+import bisect
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+Event = namedtuple('Event', ['stage', 'seconds', 'bytes', 'error'])
+Event.__doc__ = """
+One measured stage.
+
+Attributes:
+- stage (str): The stage name, e.g. 'metadata.image'.
+- seconds (float): How long the stage took.
+- bytes (int): The number of bytes read or written by the stage (0 if not applicable).
+- error (str): The name of the exception raised by the stage, or None.
+"""
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Registered sinks. Replaced, never mutated, so readers need no lock.
+_sinks = ()
+_sinks_lock = threading.Lock()
+
+class _NullStage:
+    """
+    The stage returned while instrumentation is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add_bytes(self, count):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ('name', 'bytes', '_sinks', '_start')
+
+    def __init__(self, name, sinks, count):
+        self.name = name
+        self.bytes = count
+        self._sinks = sinks
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event = Event(self.name, time.perf_counter() - self._start, self.bytes,
+                      exc_type.__name__ if exc_type is not None else None)
+        for sink in self._sinks:
+            sink.record(event)
+        return False
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+def stage(name, nbytes=0):
+    """
+    Returns a context manager measuring one stage of work.
+
+    Parameters:
+    - name (str): The stage name.
+    - nbytes (int): The number of bytes the stage handles, if known in advance. More can be
+      added with `add_bytes` on the object returned by the `with` statement.
+
+    Example:
+    >>> with stage('file_types.sniff') as current:
+    ...     header = f.read(8192)
+    ...     current.add_bytes(len(header))
+    """
+    sinks = _sinks
+    if not sinks:
+        return _NULL_STAGE
+    return _Stage(name, sinks, nbytes)
+
+def enabled():
+    """
+    Returns whether any sink is registered.
+    """
+    return bool(_sinks)
+
+def add_sink(sink):
+    """
+    Registers a sink, an object with a `record(event)` method. Plain callables are wrapped in
+    a `CallbackSink`.
+
+    Returns:
+    - The registered sink, to pass to `remove_sink` later.
+    """
+    global _sinks
+    if not hasattr(sink, 'record'):
+        sink = CallbackSink(sink)
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+    return sink
+
+def remove_sink(sink):
+    """
+    Unregisters a sink registered with `add_sink`.
+    """
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(registered for registered in _sinks if registered is not sink)
+
+@contextmanager
+def instrumented(*sinks):
+    """
+    Registers sinks for the duration of a `with` block.
+
+    Example:
+    >>> histogram = HistogramSink()
+    >>> with instrumented(histogram):
+    ...     organize_by_type('/srv/inbox')
+    >>> histogram.summary()['organize.move']['p90']
+    0.0025
+    """
+    registered = [add_sink(sink) for sink in sinks]
+    try:
+        yield registered[0] if len(registered) == 1 else registered
+    finally:
+        for sink in registered:
+            remove_sink(sink)
+
+class CallbackSink:
+    """
+    Passes every event to `callback(event)`. The callback runs on the thread that ran the
+    stage, so it should be quick.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, event):
+        self.callback(event)
+
+class _StageStats:
+    __slots__ = ('count', 'seconds', 'bytes', 'errors', 'buckets')
+
+    def __init__(self, bucket_count):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.errors = 0
+        # One more bucket than bounds, for durations above the last bound
+        self.buckets = [0] * (bucket_count + 1)
+
+class HistogramSink:
+    """
+    Aggregates events per stage: counts, total time, bytes, errors and a latency histogram.
+
+    Parameters:
+    - buckets (tuple): Increasing upper bounds of the latency buckets, in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        index = bisect.bisect_left(self.bounds, event.seconds)
+        with self._lock:
+            stats = self._stats.get(event.stage)
+            if stats is None:
+                stats = self._stats[event.stage] = _StageStats(len(self.bounds))
+            stats.count += 1
+            stats.seconds += event.seconds
+            stats.bytes += event.bytes
+            stats.buckets[index] += 1
+            if event.error is not None:
+                stats.errors += 1
+
+    def _percentile(self, buckets, count, fraction):
+        # The upper bound of the bucket holding the requested rank
+        rank = fraction * count
+        seen = 0
+        for index, bucket in enumerate(buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return None
+
+    def summary(self):
+        """
+        Returns the aggregated metrics of every stage seen so far.
+
+        Returns:
+        - dict: Maps each stage to a dictionary with its 'count', 'seconds' (total), 'mean',
+          'bytes', 'errors' and approximate 'p50', 'p90' and 'p99' latencies (the upper bound
+          of the matching histogram bucket).
+        """
+        with self._lock:
+            snapshot = {name: (stats.count, stats.seconds, stats.bytes, stats.errors,
+                               list(stats.buckets)) for name, stats in self._stats.items()}
+        return {name: {
+            'count': count,
+            'seconds': seconds,
+            'mean': seconds / count if count else None,
+            'bytes': total_bytes,
+            'errors': errors,
+            'p50': self._percentile(buckets, count, 0.50),
+            'p90': self._percentile(buckets, count, 0.90),
+            'p99': self._percentile(buckets, count, 0.99),
+        } for name, (count, seconds, total_bytes, errors, buckets) in snapshot.items()}
+
+    def histograms(self):
+        """
+        Returns the raw bucket counts of every stage, with `bounds` as the upper bounds.
+        """
+        with self._lock:
+            return {name: list(stats.buckets) for name, stats in self._stats.items()}
+
+    def reset(self):
+        """
+        Forgets everything recorded so far.
+        """
+        with self._lock:
+            self._stats.clear()
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+class PrometheusTextfileSink(HistogramSink):
+    """
+    Aggregates events like `HistogramSink` and writes them to a file in the Prometheus text
+    exposition format. The file is replaced atomically, at most every `interval` seconds while
+    events arrive and whenever `write` or `close` is called.
+
+    The metrics are `<prefix>_stage_duration_seconds` (a histogram),
+    `<prefix>_stage_bytes_total` and `<prefix>_stage_errors_total`, labelled by stage.
+
+    Parameters:
+    - path (str): The file to write, e.g. in the node_exporter textfile directory.
+    - interval (float): The minimum number of seconds between two automatic writes (default
+      is 10).
+    - prefix (str): The metric name prefix (default is 'smartfile').
+    - buckets (tuple): The latency bucket bounds, as for `HistogramSink`.
+
+    Example:
+    >>> sink = add_sink(PrometheusTextfileSink('/var/lib/node_exporter/smartfile.prom'))
+    """
+
+    def __init__(self, path, interval=10.0, prefix='smartfile', buckets=DEFAULT_BUCKETS):
+        super().__init__(buckets)
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self._next_write = time.monotonic() + interval
+        self._write_lock = threading.Lock()
+
+    def record(self, event):
+        super().record(event)
+        if time.monotonic() >= self._next_write and self._write_lock.acquire(blocking=False):
+            try:
+                self._write()
+            finally:
+                self._write_lock.release()
+
+    def write(self):
+        """
+        Writes the current metrics to the file.
+        """
+        with self._write_lock:
+            self._write()
+
+    close = write
+
+    def _write(self):
+        self._next_write = time.monotonic() + self.interval
+        summary = self.summary()
+        histograms = self.histograms()
+        name = f'{self.prefix}_stage_duration_seconds'
+        lines = [f'# HELP {name} Time spent in each smartfile stage.', f'# TYPE {name} histogram']
+        for stage_name in sorted(summary):
+            label = stage_name.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), histograms[stage_name]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{label}",le="{_format_bound(bound)}"}} '
+                             f'{cumulative}')
+            lines.append(f'{name}_sum{{stage="{label}"}} {summary[stage_name]["seconds"]!r}')
+            lines.append(f'{name}_count{{stage="{label}"}} {summary[stage_name]["count"]}')
+        for metric, key, description in (('bytes_total', 'bytes', 'Bytes handled'),
+                                         ('errors_total', 'errors', 'Errors raised')):
+            metric_name = f'{self.prefix}_stage_{metric}'
+            lines.append(f'# HELP {metric_name} {description} by each smartfile stage.')
+            lines.append(f'# TYPE {metric_name} counter')
+            for stage_name in sorted(summary):
+                label = stage_name.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{metric_name}{{stage="{label}"}} {summary[stage_name][key]}')
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.path)
@@ -0,0 +1,252 @@
+"""
+This module builds and persists line-offset indexes for large text files, so that any range of
+lines can be read without scanning everything before it.
+
+An index stores the byte offset of every `stride`-th line in a compact `array('Q')`. Reading
+line N then means seeking to the checkpoint before it and skipping fewer than `stride` lines.
+Indexes are saved next to the file or in the smartfile cache directory. They are rebuilt when
+the file changes, and extended from where they stopped when the file has only grown (e.g. a
+log that is appended to).
+
+Lines are delimited by b'\n', so indexes apply to ASCII-compatible encodings such as UTF-8 and
+Latin-1.
+
+Classes:
+- LineIndex: Sparse line checkpoints for a single file.
+
+Functions:
+- load_line_index: Returns an up-to-date index for a file, loading, extending or building it
+  as needed.
+- index_path_for: Returns where the index of a file is stored.
+
+Dependencies:
+- array: Used to store offsets compactly.
+- hashlib: Used to check that the indexed part of a growing file was not rewritten.
+"""
+
+import os
+import sys
+import array
+import struct
+import hashlib
+from itertools import accumulate
+from smartfile.cache import default_cache_dir
+
+DEFAULT_STRIDE = 1024
+# Size of the chunks read while building an index
+_CHUNK_SIZE = 1024 * 1024
+# Bytes before the end of the indexed region that are fingerprinted to detect rewrites
+_FINGERPRINT_SIZE = 4096
+
+_MAGIC = b'SFLIDX01'
+# magic, stride, indexed size, newline count, start of the last line, mtime_ns,
+# number of offsets, fingerprint
+_HEADER = struct.Struct('<8sIQQQqQ32s')
+
+def _fingerprint(f, end):
+    start = max(0, end - _FINGERPRINT_SIZE)
+    f.seek(start)
+    return hashlib.blake2b(f.read(end - start), digest_size=32).digest()
+
+class LineIndex:
+    """
+    Byte offsets of every `stride`-th line of a file.
+
+    Attributes:
+    - stride (int): The number of lines between checkpoints.
+    - offsets (array.array): `offsets[k]` is the byte offset where line `k * stride` starts.
+    - size (int): The number of bytes of the file covered by the index.
+    - newlines (int): The number of line terminators in the covered bytes.
+    - last_line_start (int): The byte offset just past the last line terminator.
+    - mtime_ns (int): The modification time of the file when it was indexed.
+    """
+
+    def __init__(self, stride=DEFAULT_STRIDE):
+        if stride < 1:
+            raise ValueError("stride must be at least 1.")
+        self.stride = stride
+        self.offsets = array.array('Q', [0])
+        self.size = 0
+        self.newlines = 0
+        self.last_line_start = 0
+        self.mtime_ns = 0
+        self.fingerprint = b'\0' * 32
+
+    @property
+    def line_count(self):
+        """The number of lines in the indexed part of the file."""
+        # A final line without a terminator still counts as a line
+        if self.size > self.last_line_start:
+            return self.newlines + 1
+        return self.newlines
+
+    def extend(self, f, st):
+        """
+        Scans the file from the end of the indexed region and records new checkpoints.
+
+        Parameters:
+        - f (file): The file, opened in binary mode.
+        - st (os.stat_result): The current stat result of the file.
+        """
+        stride = self.stride
+        offsets = self.offsets
+        position = self.size
+        newlines = self.newlines
+        last_line_start = self.last_line_start
+        f.seek(position)
+
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            parts = chunk.split(b'\n')
+            found = len(parts) - 1
+            if found:
+                # ends[i] + i + 1 is the offset just past the (i + 1)-th newline in the chunk
+                ends = list(accumulate(map(len, parts)))
+                # The first newline whose following line is a checkpoint
+                first = stride - (newlines % stride)
+                for i in range(first, found + 1, stride):
+                    offsets.append(position + ends[i - 1] + i)
+                last_line_start = position + ends[found - 1] + found
+                newlines += found
+            position += len(chunk)
+
+        self.size = position
+        self.newlines = newlines
+        self.last_line_start = last_line_start
+        self.mtime_ns = st.st_mtime_ns
+        self.fingerprint = _fingerprint(f, position)
+
+    def locate(self, line):
+        """
+        Returns the checkpoint at or before a line.
+
+        Parameters:
+        - line (int): A zero-based line number.
+
+        Returns:
+        - tuple: `(offset, lines_to_skip)`, the byte offset of the checkpoint and the number
+          of lines between it and the requested line.
+        """
+        if line < 0:
+            raise ValueError("line must not be negative.")
+        checkpoint = min(line // self.stride, len(self.offsets) - 1)
+        return self.offsets[checkpoint], line - checkpoint * self.stride
+
+    def save(self, path):
+        """
+        Writes the index to `path` atomically.
+        """
+        offsets = self.offsets
+        if sys.byteorder != 'little':
+            offsets = array.array('Q', offsets)
+            offsets.byteswap()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.stride, self.size, self.newlines,
+                                 self.last_line_start, self.mtime_ns, len(offsets),
+                                 self.fingerprint))
+            offsets.tofile(f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an index written by `save`.
+
+        Returns:
+        - LineIndex: The index, or None if the file is missing or not a valid index.
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(_HEADER.size)
+                if len(header) != _HEADER.size:
+                    return None
+                (magic, stride, size, newlines, last_line_start, mtime_ns, count,
+                 fingerprint) = _HEADER.unpack(header)
+                if magic != _MAGIC or stride < 1:
+                    return None
+                offsets = array.array('Q')
+                offsets.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return None
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+
+        index = cls(stride)
+        index.offsets = offsets
+        index.size = size
+        index.newlines = newlines
+        index.last_line_start = last_line_start
+        index.mtime_ns = mtime_ns
+        index.fingerprint = fingerprint
+        return index
+
+def index_path_for(filepath, sidecar=False, cache_dir=None):
+    """
+    Returns the path where the line index of a file is stored.
+
+    Parameters:
+    - filepath (str): The indexed file.
+    - sidecar (bool): Whether to store the index next to the file, as '<file>.lineidx'.
+    - cache_dir (str): The directory for indexes that are not sidecars. Defaults to
+      'line-index' in `smartfile.cache.default_cache_dir()`.
+
+    Returns:
+    - str: The path of the index file.
+    """
+    if sidecar:
+        return os.fspath(filepath) + '.lineidx'
+    if cache_dir is None:
+        cache_dir = os.path.join(default_cache_dir(), 'line-index')
+    key = hashlib.sha1(os.fsencode(os.path.abspath(filepath))).hexdigest()
+    return os.path.join(cache_dir, key + '.lineidx')
+
+def load_line_index(filepath, stride=DEFAULT_STRIDE, sidecar=False, cache_dir=None, persist=True):
+    """
+    Returns a line index that is up to date with the file.
+
+    A stored index is reused as is when the file's size and modification time are unchanged.
+    When the file has only grown and the indexed bytes are untouched, the index is extended
+    by scanning just the new bytes. In every other case it is rebuilt in one streaming pass.
+
+    Parameters:
+    - filepath (str): The text file to index.
+    - stride (int): The number of lines between checkpoints (default is 1024). A stride of 1
+      stores every line offset.
+    - sidecar (bool): Whether to store the index next to the file instead of the cache directory.
+    - cache_dir (str): The directory indexes are stored in when `sidecar` is False.
+    - persist (bool): Whether to save new or extended indexes (default is True).
+
+    Returns:
+    - LineIndex: The index of the file.
+
+    Example:
+    >>> index = load_line_index('/var/log/huge.log')
+    >>> index.line_count
+    48211734
+    """
+    index_path = index_path_for(filepath, sidecar=sidecar, cache_dir=cache_dir)
+    with open(filepath, 'rb') as f:
+        st = os.fstat(f.fileno())
+        index = LineIndex.load(index_path) if persist else None
+
+        if index is not None and index.stride == stride:
+            if index.size == st.st_size and index.mtime_ns == st.st_mtime_ns:
+                return index
+            # Only a file that grew with its indexed bytes untouched can be extended
+            if not (index.size < st.st_size and _fingerprint(f, index.size) == index.fingerprint):
+                index = None
+        else:
+            index = None
+
+        if index is None:
+            index = LineIndex(stride)
+        index.extend(f, st)
+
+    if persist:
+        index.save(index_path)
+    return index
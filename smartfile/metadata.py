@@ -2,21 +2,51 @@
 This module provides functions to extract metadata from different types of files, including
 images and PDFs.
 
+Extractors are registered per MIME type (as returned by `get_file_type`), each computing a
+group of fields that are cheaper to read together (e.g. everything in an image header).
+`get_metadata` returns a lazy mapping: a group is only extracted when one of its fields is
+first accessed, and callers can restrict the fields with `fields=...` so costly ones (the PDF
+page count, EXIF tags) are never computed.
+
+Virtual paths into zip and tar archives (e.g. 'bundle.zip!/photo.jpg') are accepted too; the
+members are read as streams, see `smartfile.archives`.
+
+Classes:
+- Metadata: A read-only mapping whose fields are extracted on first access.
+
 Functions:
 - get_image_metadata: Extracts metadata from image files (e.g., format, size, and mode).
+- get_exif_metadata: Extracts the EXIF tags of image files.
 - get_pdf_metadata: Extracts metadata from PDF files (e.g., author, number of pages).
+- register_extractor: Registers a function extracting some fields for some MIME types.
 - get_metadata: A general function that determines the metadata for a given file, 
   supporting image and PDF files as well as other file types.
+- iter_metadata: Streams the metadata of every file in a directory tree, parsing images and
+  PDFs on a process pool.
 
 Dependencies:
 - PIL (Pillow): Used for working with image files.
-- PyPDF2: Used for extracting metadata from PDF files.
+- PyPDF2: Used for extracting metadata from PDF files the fast path in
+  `smartfile.pdfinfo` cannot read.
 - os: Used for basic file system operations such as file size and creation time.
+
+Pillow and PyPDF2 are imported on first use, so importing this module stays cheap.
 """
 
 import os
-from PIL import Image
-from PyPDF2 import PdfReader
+import functools
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from smartfile import archives
+from smartfile.file_types import get_file_type
+from smartfile.instrumentation import stage
+from smartfile.pdfinfo import read_pdf_info, PDFInfoError, PDF_FIELDS
+from smartfile.scanning import scan_files
+
+# Image formats Pillow reads, by MIME type
+IMAGE_MIME_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/x-ms-bmp',
+                    'image/tiff', 'image/webp', 'image/x-icon', 'image/vnd.microsoft.icon')
 
 def get_image_metadata(filepath):
     """
@@ -32,61 +62,426 @@ def get_image_metadata(filepath):
     >>> get_image_metadata('/path/to/image.jpg')
     {'format': 'JPEG', 'size': (1920, 1080), 'mode': 'RGB'}
     """
-    with Image.open(filepath) as img:
+    from PIL import Image
+
+    with stage('metadata.image'), archives.open_binary(filepath) as f, Image.open(f) as img:
         return {
             "format": img.format,
             "size": img.size,
             "mode": img.mode
         }
 
-def get_pdf_metadata(filepath):
+def _exif_value(value):
+    # Keep values storable in `MetadataCache`: rationals become floats, other objects strings
+    if isinstance(value, (str, bytes, int, float)) or value is None:
+        return value
+    if isinstance(value, tuple):
+        return tuple(_exif_value(item) for item in value)
+    if getattr(value, 'denominator', None) == 0:
+        return None  # Cameras write 0/0 for unset tags
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return str(value)
+
+def get_exif_metadata(filepath):
+    """
+    Extracts the EXIF tags of an image file.
+
+    Parameters:
+    - filepath (str): The path to the image file.
+
+    Returns:
+    - dict: A dictionary with a single 'exif' entry mapping tag names (e.g. 'Model',
+      'DateTime') to their values. It is empty for images without EXIF data.
+
+    Example:
+    >>> get_exif_metadata('/path/to/photo.jpg')
+    {'exif': {'Make': 'Canon', 'Model': 'EOS 5D', 'Orientation': 1}}
+    """
+    from PIL import Image, ExifTags
+
+    with stage('metadata.exif'), archives.open_binary(filepath) as f, Image.open(f) as img:
+        exif = img.getexif()
+        return {
+            "exif": {ExifTags.TAGS.get(tag, str(tag)): _exif_value(value)
+                     for tag, value in exif.items()}
+        }
+
+def get_pdf_metadata(filepath, fields=None):
     """
     Extracts metadata from a PDF file.
 
+    The page count and author are read from the cross-reference table, the root page tree
+    node and the document information dictionary, without loading the pages themselves.
+    Files the fast path cannot handle (e.g. compressed cross-reference streams or damaged
+    files) are parsed with PyPDF2 instead.
+
     Parameters:
     - filepath (str): The path to the PDF file.
+    - fields (iterable): The fields to read, 'author' and/or 'num_pages' (default is both).
 
     Returns:
     - dict: A dictionary containing the PDF's author and number of pages.
-    
+
     Example:
     >>> get_pdf_metadata('/path/to/document.pdf')
     {'author': 'John Doe', 'num_pages': 10}
     """
-    with open(filepath, 'rb') as f:
-        reader = PdfReader(f) 
-        return {
-            "author": reader.metadata.get('author', None),  # Return 'None' if no author
-            "num_pages": len(reader.pages)
-        }
+    fields = PDF_FIELDS if fields is None else fields
+    try:
+        with stage('metadata.pdf'):
+            return read_pdf_info(filepath, fields)
+    except PDFInfoError:
+        pass
+
+    from PyPDF2 import PdfReader  # Deferred: most PDFs never need it
 
-def get_metadata(filepath):
+    with stage('metadata.pdf_fallback'), archives.open_binary(filepath) as f:
+        reader = PdfReader(f)
+        result = {}
+        if 'author' in fields:
+            info = reader.metadata  # None when the document has no /Info dictionary
+            author = info.author if info is not None else None
+            result["author"] = str(author) if author is not None else None  # 'None' if no author
+        if 'num_pages' in fields:
+            result["num_pages"] = len(reader.pages)
+        return result
+
+def _stat_metadata(filepath):
+    with stage('metadata.stat'):
+        if archives.split_archive_path(filepath) is not None:
+            info = archives.stat_member(filepath)
+            # Archives only record when members were modified
+            return {"size": info.size, "created": info.mtime}
+        st = os.stat(filepath)
+    return {
+        "size": st.st_size,
+        "created": st.st_ctime
+    }
+
+_Extractor = namedtuple('_Extractor', ['fields', 'func', 'default'])
+
+# Extractors by MIME type or 'major/*' pattern, in registration order
+_extractors = {}
+# Used for files no extractor is registered for; its results are never cached
+_STAT_EXTRACTOR = _Extractor(('size', 'created'), _stat_metadata, True)
+
+def register_extractor(mime_types, fields, func, default=True):
+    """
+    Registers a function that extracts a group of metadata fields.
+
+    The fields of a group are computed together by one call, so a group should hold fields
+    that come from the same read (e.g. an image header) and expensive fields should get a
+    group of their own. When several extractors provide the same field for a file, the one
+    registered for the exact MIME type wins over a 'major/*' pattern, and otherwise the first
+    one registered wins.
+
+    Extractors registered at runtime are not seen by the worker processes of `iter_metadata`
+    unless they are registered at import time of a module the workers import too, or the
+    pool uses the 'fork' start method.
+
+    Parameters:
+    - mime_types (str or iterable): The MIME types handled, e.g. 'image/png', or patterns
+      such as 'image/*'.
+    - fields (iterable): The names of the fields `func` returns.
+    - func (callable): Called as `func(filepath)`; returns a dictionary with (at least) the
+      fields. It should be a module-level function so it can run on a process pool.
+    - default (bool): Whether the fields are included when no `fields` are requested
+      (default is True). Optional fields are only computed when asked for by name.
+
+    Example:
+    >>> register_extractor('audio/mpeg', ('duration',), read_mp3_duration)
+    """
+    if isinstance(mime_types, str):
+        mime_types = (mime_types,)
+    extractor = _Extractor(tuple(fields), func, default)
+    if not extractor.fields:
+        raise ValueError("An extractor must provide at least one field.")
+    for mime_type in mime_types:
+        _extractors.setdefault(mime_type, []).append(extractor)
+
+def _select(mime_type, fields=None):
+    """
+    Returns a dictionary mapping each field to compute for a file of the given MIME type to
+    the extractor providing it.
+    """
+    candidates = []
+    if mime_type is not None:
+        candidates += _extractors.get(mime_type, ())
+        candidates += _extractors.get(mime_type.split('/')[0] + '/*', ())
+    if not candidates:
+        candidates = [_STAT_EXTRACTOR]
+
+    selected = {}
+    for extractor in candidates:
+        for field in extractor.fields:
+            if field in selected:
+                continue
+            if (extractor.default if fields is None else field in fields):
+                selected[field] = extractor
+    return selected
+
+def _parses(selected):
+    """
+    Returns whether any of the selected fields needs more than a `stat`.
+    """
+    return any(extractor is not _STAT_EXTRACTOR for extractor in selected.values())
+
+def _from_cache(cached, selected):
+    """
+    Returns the selected fields found in a cached dictionary, or None unless all are there.
+    """
+    if cached is None or any(field not in cached for field in selected):
+        return None
+    return {field: cached[field] for field in selected}
+
+# Cache entries also remember the MIME type of the file, so hits skip type detection
+_MIME_KEY = '_mime_type'
+
+def _cache_lookup(cache, filepath, fields, mime_type=None):
+    """
+    Looks a file up in the cache with a single `stat`, detecting its type only on a miss.
+
+    Returns a `(st, cached, mime_type, selected)` tuple, where `cached` is the cached
+    dictionary (empty on a miss) and `selected` maps the fields to compute to extractors.
+    """
+    st = os.stat(filepath)
+    cached = cache.get(st) or {}
+    if mime_type is None:
+        mime_type = cached[_MIME_KEY] if _MIME_KEY in cached else get_file_type(filepath)
+    return st, cached, mime_type, _select(mime_type, fields)
+
+def _cache_entry(cached, values, mime_type):
+    """
+    Returns the dictionary to store for a file: what was cached before, the new values and
+    the MIME type.
+    """
+    return {**cached, **values, _MIME_KEY: mime_type}
+
+class Metadata(Mapping):
+    """
+    The metadata of a file: a read-only mapping whose fields are extracted on first access.
+
+    Only the group of fields that holds the accessed field is extracted, once; the other
+    groups are left alone until they are needed. Iterating over the keys, `len` and `in`
+    never extract anything. Errors (e.g. a damaged image) are raised when a field of the
+    affected group is accessed.
+
+    Use `dict(metadata)` to extract all fields at once, e.g. before sending the metadata to
+    another process or serializing it.
+
+    Attributes:
+    - path (str): The file.
+    - mime_type (str): Its MIME type, or None if unknown.
+    """
+
+    __slots__ = ('path', 'mime_type', '_selected', '_values')
+
+    def __init__(self, path, mime_type, selected, values=None):
+        self.path = path
+        self.mime_type = mime_type
+        self._selected = selected
+        self._values = dict(values) if values else {}
+
+    def __getitem__(self, field):
+        try:
+            return self._values[field]
+        except KeyError:
+            extractor = self._selected[field]  # Raises KeyError for unknown fields
+        result = extractor.func(self.path)
+        for name in extractor.fields:
+            if self._selected.get(name) is extractor:
+                self._values[name] = result.get(name)
+        return self._values[field]
+
+    def __iter__(self):
+        return iter(self._selected)
+
+    def __len__(self):
+        return len(self._selected)
+
+    def __contains__(self, field):
+        return field in self._selected
+
+    def is_loaded(self, field):
+        """
+        Returns whether a field has already been extracted.
+        """
+        return field in self._values
+
+    def __repr__(self):
+        # Shows the values, so this extracts every field
+        return repr(dict(self))
+
+for _mime_type in IMAGE_MIME_TYPES:
+    register_extractor(_mime_type, ('format', 'size', 'mode'), get_image_metadata)
+    register_extractor(_mime_type, ('exif',), get_exif_metadata, default=False)
+# Separate groups, so asking for the author never walks the page tree
+register_extractor('application/pdf', ('author',),
+                   functools.partial(get_pdf_metadata, fields=('author',)))
+register_extractor('application/pdf', ('num_pages',),
+                   functools.partial(get_pdf_metadata, fields=('num_pages',)))
+
+def get_metadata(filepath, cache=None, fields=None, mime_type=None):
     """
     Retrieves metadata from a file based on its type (image, PDF, or general file).
 
+    The file type is detected with `get_file_type` and the metadata is returned as a lazy
+    `Metadata` mapping: each group of fields is extracted when one of its fields is first
+    accessed. With a cache, the fields are looked up (and, if missing, extracted and stored)
+    immediately instead.
+
     Parameters:
     - filepath (str): The path to the file.
+    - cache (smartfile.cache.MetadataCache): An optional cache for image and PDF metadata.
+      Files that have not changed since they were cached cost a single `stat`: their type
+      is stored with their metadata, so it is not detected again.
+    - fields (iterable): The fields wanted, e.g. `{'size', 'mode'}`. Fields the file type
+      does not provide are left out. By default all the regular fields of the type are
+      included; optional ones such as 'exif' must be asked for.
+    - mime_type (str): The MIME type of the file, if already known, to skip detection.
 
     Returns:
-    - dict: A dictionary containing metadata relevant to the file type.
-      - For images, it includes format, size, and mode.
+    - Metadata: A mapping containing metadata relevant to the file type.
+      - For images, it includes format, size, and mode ('exif' on request).
       - For PDFs, it includes author and number of pages.
       - For other file types, it includes size and creation time.
-    
+
+    Raises:
+    - FileNotFoundError: If the file does not exist.
+    - ValueError: If the path is a directory.
+
     Example:
     >>> get_metadata('/path/to/image.jpg')
     {'format': 'JPEG', 'size': (1920, 1080), 'mode': 'RGB'}
-    >>> get_metadata('/path/to/document.pdf')
-    {'author': 'John Doe', 'num_pages': 10}
+    >>> get_metadata('/path/to/document.pdf', fields={'author'})
+    {'author': 'John Doe'}
     >>> get_metadata('/path/to/otherfile.txt')
     {'size': 1024, 'created': 1622548695}
     """
-    if filepath.endswith('.jpg') or filepath.endswith('.png'):
-        return get_image_metadata(filepath)
-    elif filepath.endswith('.pdf'):
-        return get_pdf_metadata(filepath)
-    else:
-        return {
-            "size": os.path.getsize(filepath),
-            "created": os.path.getctime(filepath)
-        }
\ No newline at end of file
+    if fields is not None and not isinstance(fields, (set, frozenset, dict)):
+        fields = frozenset(fields)
+    if cache is None or archives.split_archive_path(filepath):
+        if mime_type is None:
+            mime_type = get_file_type(filepath)
+        return Metadata(filepath, mime_type, _select(mime_type, fields))
+
+    st, cached, mime_type, selected = _cache_lookup(cache, filepath, fields, mime_type)
+    if not _parses(selected):
+        return Metadata(filepath, mime_type, selected)
+    metadata = Metadata(filepath, mime_type, selected,
+                        {field: cached[field] for field in selected if field in cached})
+    missing = [field for field in selected if not metadata.is_loaded(field)]
+    if missing or _MIME_KEY not in cached:
+        # Extract what is missing now, and store it together with what was cached before
+        for field in missing:
+            metadata[field]
+        cache.put(st, _cache_entry(cached, metadata._values, mime_type))
+    return metadata
+
+def _extract(filepath, mime_type, fields):
+    """
+    Extracts all the selected fields of a file at once, for the process pool.
+    """
+    return dict(get_metadata(filepath, fields=fields, mime_type=mime_type))
+
+def iter_metadata(directory, recursive=True, workers=None, cache=None, max_pending=None,
+                  fields=None):
+    """
+    Extracts metadata for every file in a directory, yielding each record as soon as it is ready.
+
+    Image and PDF parsing runs on a pool of `workers` processes. Only `max_pending` files are
+    handed to the pool at a time, so memory stays flat however large the directory tree is.
+    A file that cannot be read produces an error record instead of stopping the iteration.
+
+    Parameters:
+    - directory (str): The directory to scan.
+    - recursive (bool): Whether to include files in subdirectories (default is True).
+    - workers (int): The number of worker processes. By default files are parsed one at a time
+      in the calling process.
+    - cache (smartfile.cache.MetadataCache): An optional cache consulted before parsing.
+    - max_pending (int): The maximum number of files being parsed at once (default is four
+      per worker).
+    - fields (iterable): The fields wanted, as for `get_metadata`.
+
+    Returns:
+    - generator: Yields `(path, metadata)` tuples, where `metadata` is a dictionary with the
+      fields `get_metadata` returns, all extracted, or the exception raised while extracting
+      them. With `workers`, records arrive in completion order.
+
+    Raises:
+    - ValueError: If the specified directory does not exist.
+
+    Example:
+    >>> for path, metadata in iter_metadata('/path/to/photos', workers=4):
+    ...     if isinstance(metadata, Exception):
+    ...         print(f"{path}: {metadata}")
+    """
+    if not os.path.isdir(directory):
+        raise ValueError(f"The directory {directory} does not exist.")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if fields is not None:
+        fields = frozenset(fields)
+
+    paths = (entry.path for entry in scan_files(directory, recursive=recursive))
+
+    if workers is None:
+        for path in paths:
+            try:
+                yield path, dict(get_metadata(path, cache=cache, fields=fields))
+            except Exception as e:
+                yield path, e
+        return
+
+    if max_pending is None:
+        max_pending = workers * 4
+    pending = {}
+
+    def finished(future):
+        path, st, cached, mime_type = pending.pop(future)
+        try:
+            metadata = future.result()
+        except Exception as e:
+            return path, e
+        if cache is not None:
+            cache.put(st, _cache_entry(cached, metadata, mime_type))
+        return path, metadata
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path in paths:
+            # Cheap records are produced in this process; only parsing goes to the pool
+            try:
+                if cache is not None:
+                    st, cached, mime_type, selected = _cache_lookup(cache, path, fields)
+                else:
+                    st = cached = None
+                    mime_type = get_file_type(path)
+                    selected = _select(mime_type, fields)
+                if not _parses(selected):
+                    yield path, dict(Metadata(path, mime_type, selected))
+                    continue
+                metadata = _from_cache(cached, selected)
+                if metadata is not None:
+                    if _MIME_KEY not in cached:
+                        cache.put(st, _cache_entry(cached, {}, mime_type))
+                    yield path, metadata
+                    continue
+            except Exception as e:
+                yield path, e
+                continue
+
+            future = executor.submit(_extract, path, mime_type, fields)
+            pending[future] = (path, st, cached, mime_type)
+
+            # Backpressure: wait for a slot before scanning further
+            while len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield finished(future)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finished(future)
@@ -1,44 +1,558 @@
 """
-Module for bulk renaming files in a directory by adding a prefix and a numerical index.
+This module renames files in bulk, in two phases: planning and applying.
+
+The plan is built entirely in memory from a single directory listing. Conflicts (two files
+renamed to the same name, a target that already exists, invalid names) are detected with sets
+before anything is touched, and renames that depend on each other are ordered so that a name
+is always freed before it is reused. Cycles (e.g. swapping two names) go through a temporary
+name. Applying the plan renames each file once and can record every step in an append-only
+journal, from which an interrupted run is finished or rolled back, and a completed run undone.
+
+Classes:
+- Rename: A single rename of a file within a directory.
+- RenamePlan: A validated, ordered list of renames.
+- RenameConflictError: Raised when a plan cannot be applied safely.
+
+Functions:
+- plan_renames: Validates and orders arbitrary renames within a directory.
+- plan_bulk_rename: Plans the prefix-and-index renames of `bulk_rename`.
+- bulk_rename: Renames files in a directory by adding a prefix and a numerical index.
+- recover_renames: Finishes or rolls back a run interrupted by a crash.
+- undo_renames: Reverts the last run recorded in a journal.
 
 Dependencies:
 - os: For file system operations (e.g., renaming files).
+- json: Used to write the journal.
 """
 
 import os
+import re
+import json
+import itertools
+from collections import namedtuple
+from smartfile.instrumentation import stage
+
+Rename = namedtuple('Rename', ['source', 'target'])
+Rename.__doc__ = """
+A single rename within a directory.
 
-def bulk_rename(directory, prefix='file_'):
+Attributes:
+- source (str): The current file name.
+- target (str): The new file name.
+"""
+
+class RenameConflictError(ValueError):
+    """
+    Raised when a plan cannot be applied without overwriting or losing files.
+
+    Attributes:
+    - conflicts (list): `(source, target, reason)` tuples, one per offending rename.
+    """
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        source, target, reason = conflicts[0]
+        more = f" (and {len(conflicts) - 1} more)" if len(conflicts) > 1 else ""
+        super().__init__(f"Cannot rename '{source}' to '{target}': {reason}{more}.")
+
+class RenamePlan:
+    """
+    A validated list of renames within one directory, in the order they must be applied.
+
+    Plans are built by `plan_renames` or `plan_bulk_rename`. Nothing is renamed until
+    `apply` is called, so a plan doubles as a dry run.
+
+    Attributes:
+    - directory (str): The absolute path of the directory.
+    - mapping (dict): Maps each source name to its target, sorted by source name.
     """
-    Renames files in the specified directory by adding a prefix and a numerical index.
 
-    Args:
-        directory (str): Path to the directory.
-        prefix (str): Prefix to prepend to each file. Defaults to 'file_'.
+    def __init__(self, directory, mapping, steps=None):
+        self.directory = directory
+        self.mapping = mapping
+        # None when no rename depends on another, so `mapping` order can be used as is
+        self._steps = steps
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def __iter__(self):
+        return map(Rename._make, self.mapping.items())
+
+    @property
+    def renames(self):
+        """
+        The requested `Rename`s, sorted by source name.
+        """
+        return list(self)
+
+    @property
+    def steps(self):
+        """
+        The `Rename`s to perform, in order. Cycles add steps through temporary names, so there
+        can be more steps than renames.
+        """
+        return list(self._steps) if self._steps is not None else self.renames
+
+    def _pairs(self):
+        return self._steps if self._steps is not None else self.mapping.items()
+
+    def apply(self, journal=None):
+        """
+        Performs the renames.
+
+        If a rename fails, the renames already performed are reverted and the error is
+        raised, so the directory is left as it was.
+
+        Parameters:
+        - journal (str): An optional path to an append-only journal. The plan is written to
+          it before the first rename and every rename is recorded as it happens, so a run
+          interrupted by a crash can be finished or rolled back with `recover_renames`, and a
+          completed run reverted with `undo_renames`.
+
+        Returns:
+        - list: The new file names, in the order of `renames`.
+
+        Raises:
+        - OSError: If a rename fails.
+        """
+        writer = _JournalWriter(journal) if journal is not None else None
+        try:
+            if writer is not None:
+                writer.begin(self.directory, len(self._pairs()), self._pairs())
+            applied, error = _apply_steps(self.directory, self._pairs(), 0, writer)
+            if error is not None:
+                _revert(self.directory, list(itertools.islice(self._pairs(), applied)), writer)
+                raise error
+            if writer is not None:
+                writer.commit()
+        finally:
+            if writer is not None:
+                writer.close()
+        return list(self.mapping.values())
+
+def _list_names(directory):
+    with os.scandir(directory) as entries:
+        return {entry.name for entry in entries}
+
+def _temporary_name(taken, counter):
+    while True:
+        name = f".smartfile-rename-{os.getpid()}-{counter[0]}.tmp"
+        counter[0] += 1
+        if name not in taken:
+            taken.add(name)
+            return name
+
+def _order(pending, taken):
+    """
+    Orders the renames of `pending` (source -> target) so that each target is free when its
+    rename runs, breaking cycles with temporary names.
+    """
+    steps = []
+    done = set()
+    counter = [0]
+    for start in sorted(pending):
+        if start in done:
+            continue
+        # Follow the chain of renames whose targets are themselves being renamed
+        path = [start]
+        on_path = {start}
+        current = start
+        cycle = False
+        while True:
+            target = pending[current]
+            if target not in pending or target in done:
+                break
+            if target in on_path:
+                cycle = True  # Targets are unique, so the chain closes on its first element
+                break
+            path.append(target)
+            on_path.add(target)
+            current = target
+
+        if cycle:
+            temporary = _temporary_name(taken, counter)
+            steps.append(Rename(path[-1], temporary))
+            for source in reversed(path[:-1]):
+                steps.append(Rename(source, pending[source]))
+            steps.append(Rename(temporary, pending[path[-1]]))
+        else:
+            for source in reversed(path):
+                steps.append(Rename(source, pending[source]))
+        done.update(path)
+    return steps
+
+def plan_renames(directory, renames, names=None):
+    """
+    Validates renames within a directory and orders them so they can be applied safely.
+
+    Validation uses one directory listing and set lookups, so it takes linear time and makes
+    no per-file filesystem calls. Renames whose source and target are equal are dropped.
+
+    Parameters:
+    - directory (str): The directory holding the files.
+    - renames (dict or iterable): Maps current file names to new ones, as a dictionary or
+      `(source, target)` pairs.
+    - names (set): The names currently in the directory, if already listed.
+
+    Returns:
+    - RenamePlan: The validated plan.
+
+    Raises:
+    - ValueError: If the directory is invalid.
+    - RenameConflictError: If a source is missing or listed twice, a name is invalid, two
+      files would get the same name, or a target already exists and is not renamed itself.
+
+    Example:
+    >>> plan = plan_renames('/path/to/files', {'a.txt': 'b.txt', 'b.txt': 'a.txt'})
+    >>> plan.steps
+    [Rename(source='b.txt', target='.smartfile-rename-4242-0.tmp'), Rename(source='a.txt', target='b.txt'), ...]
+    """
+    if not os.path.isdir(directory):
+        raise ValueError(f"'{directory}' is not a valid directory.")
+    directory = os.path.abspath(directory)
+    if names is None:
+        names = _list_names(directory)
+    if isinstance(renames, dict):
+        pending = dict(renames)
+        repeated = False
+    else:
+        renames = list(renames)
+        pending = dict(renames)
+        repeated = len(pending) != len(renames)
+    targets = set(pending.values())
+
+    # Set operations check everything at once; the conflicts are only itemized if one is found
+    if (repeated or len(targets) != len(pending) or not pending.keys() <= names
+            or _has_invalid_names(targets) or not (targets & names) <= pending.keys()):
+        items = renames.items() if isinstance(renames, dict) else renames
+        raise RenameConflictError(_find_conflicts(items, names))
+
+    unchanged = [source for source in pending.keys() & targets if pending[source] == source]
+    for source in unchanged:
+        del pending[source]
+        targets.discard(source)
+
+    steps = None  # No rename depends on another, so the order is free
+    if not pending.keys().isdisjoint(targets):
+        steps = _order(pending, names | targets)
+    return RenamePlan(directory, {source: pending[source] for source in sorted(pending)}, steps)
+
+def _has_invalid_names(names):
+    if not names.isdisjoint(('', '.', '..')):
+        return True
+    # One scan of the joined names instead of one check per name
+    joined = '/'.join(names)
+    return ('\0' in joined or joined.count('/') != len(names) - 1
+            or (os.sep != '/' and os.sep in joined)
+            or (os.altsep is not None and os.altsep != '/' and os.altsep in joined))
+
+def _find_conflicts(items, names):
+    """
+    Returns a sorted `(source, target, reason)` tuple for each rename of `items` that cannot
+    be applied.
+    """
+    conflicts = []
+    pending = {}
+    targets = {}
+    for source, target in items:
+        if source in pending:
+            conflicts.append((source, target, "the file is renamed twice"))
+        elif source not in names:
+            conflicts.append((source, target, "the file does not exist"))
+        elif _has_invalid_names({target}):
+            conflicts.append((source, target, "invalid file name"))
+        elif target in targets:
+            conflicts.append((source, target, f"'{targets[target]}' is renamed to the same name"))
+        else:
+            pending[source] = target
+            targets[target] = source
+    for source, target in pending.items():
+        if target in names and target not in pending:
+            conflicts.append((source, target, "a file with that name already exists"))
+    return sorted(conflicts)
+
+def plan_bulk_rename(directory, prefix='file_', exclude=()):
+    """
+    Plans the renames of `bulk_rename` without performing them.
+
+    Files are numbered in sorted name order, so the plan only depends on the names in the
+    directory. Files whose names already start with the prefix followed by a number and an
+    underscore (e.g. 'file_12_') are left alone, and new files are numbered after them, so
+    running `bulk_rename` again only renames the files added since. With an empty prefix such
+    names cannot be told from original ones (e.g. '2024_report.txt'), so every file is renamed.
+
+    Parameters:
+    - directory (str): Path to the directory.
+    - prefix (str): Prefix to prepend to each file. Defaults to 'file_'.
+    - exclude (iterable): File names to leave alone.
 
     Returns:
-        list: List of new file names for renamed files.
+    - RenamePlan: The plan.
 
     Raises:
-        ValueError: If the directory is invalid.
+    - ValueError: If the directory is invalid.
+    - RenameConflictError: If a new name is already taken.
 
     Example:
-        >>> bulk_rename('/path/to/files', 'image_')
-        ['image_1_file1.jpg', 'image_2_file2.png']
+    >>> [tuple(rename) for rename in plan_bulk_rename('/path/to/files', 'image_')]
+    [('file1.jpg', 'image_1_file1.jpg'), ('file2.png', 'image_2_file2.png')]
     """
-    new_file_names = []
-    
     if not os.path.isdir(directory):
         raise ValueError(f"'{directory}' is not a valid directory.")
-    
-    for idx, filename in enumerate(os.listdir(directory)):
-        filepath = os.path.join(directory, filename)
-        if os.path.isfile(filepath):
-            new_name = f"{prefix}{idx+1}_{filename}"
-            new_filepath = os.path.join(directory, new_name)
+    renamed = re.compile(re.escape(prefix) + r'(\d+)_') if prefix else None
+    exclude = set(exclude)
+    names = set()
+    sources = []
+    last_index = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            names.add(entry.name)
+            if entry.name in exclude or not entry.is_file():
+                continue
+            match = renamed.match(entry.name) if renamed is not None else None
+            if match:
+                last_index = max(last_index, int(match.group(1)))
+            else:
+                sources.append(entry.name)
+
+    sources.sort()
+    renames = [(name, f"{prefix}{last_index + index}_{name}")
+               for index, name in enumerate(sources, 1)]
+    return plan_renames(directory, renames, names=names)
+
+def bulk_rename(directory, prefix='file_', dry_run=False, journal=None):
+    """
+    Renames files in the specified directory by adding a prefix and a numerical index.
+
+    The renames are planned first (see `plan_bulk_rename`), so conflicts are reported before
+    any file is touched, existing files are never overwritten and running the function twice
+    does not add the prefix twice.
+
+    Parameters:
+    - directory (str): Path to the directory.
+    - prefix (str): Prefix to prepend to each file. Defaults to 'file_'.
+    - dry_run (bool): Whether to only return the new names without renaming anything.
+    - journal (str): An optional journal file for crash recovery and undo (see
+      `RenamePlan.apply`). A journal inside the directory is not renamed itself.
+
+    Returns:
+    - list: List of new file names for renamed files, in sorted order of the original names.
+
+    Raises:
+    - ValueError: If the directory is invalid.
+    - RenameConflictError: If a new name is already taken.
+    - OSError: If a rename fails; the files already renamed are renamed back.
+
+    Example:
+    >>> bulk_rename('/path/to/files', 'image_')
+    ['image_1_file1.jpg', 'image_2_file2.png']
+    """
+    exclude = ()
+    if journal is not None and os.path.isdir(directory):
+        journal_directory, journal_name = os.path.split(os.path.abspath(journal))
+        if journal_directory == os.path.abspath(directory):
+            exclude = (journal_name,)
+    plan = plan_bulk_rename(directory, prefix, exclude=exclude)
+    if dry_run:
+        return list(plan.mapping.values())
+    return plan.apply(journal=journal)
+
+def _apply_steps(directory, steps, first, writer):
+    """
+    Performs the steps from index `first` on. Returns the number of steps applied in total and
+    the error that stopped the run, or None.
+    """
+    applied = first
+    for index, (source, target) in enumerate(itertools.islice(steps, first, None), first):
+        try:
+            with stage('rename.rename'):
+                os.rename(os.path.join(directory, source), os.path.join(directory, target))
+        except OSError as e:
+            return index, e
+        if writer is not None:
+            writer.done(index)
+        applied = index + 1
+    return applied, None
+
+def _net_renames(steps):
+    """
+    Returns the overall effect of a sequence of steps as a dictionary mapping original names
+    to final names.
+    """
+    origin = {}  # Current name -> original name
+    for source, target in steps:
+        origin[target] = origin.pop(source, source)
+    return {original: final for final, original in origin.items() if original != final}
+
+def _revert(directory, steps, writer):
+    """
+    Reverts applied steps. With a journal, the reversal is recorded as a new run.
+    """
+    if not steps:
+        return
+    if writer is not None:
+        writer.abort()
+    inverse = {final: original for original, final in _net_renames(steps).items()}
+    plan = plan_renames(directory, inverse)
+    if writer is not None:
+        writer.begin(plan.directory, len(plan._pairs()), plan._pairs())
+    _, error = _apply_steps(plan.directory, plan._pairs(), 0, writer)
+    if error is not None:
+        raise error
+    if writer is not None:
+        writer.commit()
+
+class _JournalWriter:
+    """
+    Appends runs to a journal. Each run is a 'begin' line with the directory, one 'step' line
+    per rename, then a 'done' line as each step completes and a 'commit' line at the end.
+    Lines are JSON arrays, like the checkpoints of `organize_by_type`.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self.applied = 0
+
+    def _write(self, *record):
+        self._file.write(json.dumps(record) + '\n')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def begin(self, directory, count, steps):
+        self.applied = 0
+        self._write('begin', directory, count)
+        for source, target in steps:
+            self._write('step', source, target)
+        # The whole plan is on disk before the first rename
+        self._sync()
+
+    def done(self, index):
+        self._write('done', index)
+        # Flushed to the OS so it survives a crash of this process; synced at commit
+        self._file.flush()
+        self.applied = index + 1
+
+    def commit(self):
+        self._write('commit')
+        self._sync()
+
+    def abort(self):
+        self._write('abort')
+        self._sync()
+
+    def close(self):
+        self._file.close()
+
+def _read_last_run(journal):
+    """
+    Returns the directory, steps, number of completed steps and state ('committed',
+    'aborted' or 'interrupted') of the last run recorded in a journal.
+    """
+    run = None
+    with open(journal, encoding='utf-8') as f:
+        for line in f:
             try:
-                os.rename(filepath, new_filepath)
-                new_file_names.append(new_name)
-            except OSError as e:
-                print(f"Error renaming {filename}: {e}")
-    
-    return new_file_names
\ No newline at end of file
+                record = json.loads(line)
+            except ValueError:
+                break  # A partially written last line from an interrupted run
+            kind = record[0]
+            if kind == 'begin':
+                run = {'directory': record[1], 'steps': [], 'applied': 0, 'state': 'interrupted'}
+            elif run is None:
+                continue
+            elif kind == 'step':
+                run['steps'].append(Rename(record[1], record[2]))
+            elif kind == 'done':
+                run['applied'] = record[1] + 1
+            elif kind == 'commit':
+                run['state'] = 'committed'
+            elif kind == 'abort':
+                run['state'] = 'aborted'
+    if run is None:
+        raise ValueError(f"The journal '{journal}' does not record any renames.")
+    return run['directory'], run['steps'], run['applied'], run['state']
+
+def recover_renames(journal, rollback=False):
+    """
+    Finishes or rolls back a run that was interrupted, e.g. by a crash or a kill.
+
+    The last step recorded as started but not as done is checked against the directory: it
+    counts as done if its source name is gone and its target exists.
+
+    Parameters:
+    - journal (str): The journal passed to `bulk_rename` or `RenamePlan.apply`.
+    - rollback (bool): Whether to revert the renames already done instead of finishing the
+      remaining ones (default is False).
+
+    Returns:
+    - int: The number of renames performed by the recovery (0 if the last run completed).
+
+    Raises:
+    - ValueError: If the journal records no run.
+
+    Example:
+    >>> recover_renames('/path/to/renames.journal')
+    125000
+    """
+    directory, steps, applied, state = _read_last_run(journal)
+    if state != 'interrupted':
+        return 0
+
+    unrecorded = False
+    if applied < len(steps):
+        source, target = steps[applied]
+        unrecorded = (not os.path.lexists(os.path.join(directory, source))
+                      and os.path.lexists(os.path.join(directory, target)))
+
+    writer = _JournalWriter(journal)
+    try:
+        if unrecorded:
+            # Renamed, but the process stopped before recording it
+            writer.done(applied)
+            applied += 1
+        if rollback:
+            if applied:
+                _revert(directory, steps[:applied], writer)
+            else:
+                writer.abort()
+            return len(_net_renames(steps[:applied]))
+        _, error = _apply_steps(directory, steps, applied, writer)
+        if error is not None:
+            raise error
+        writer.commit()
+        return len(steps) - applied
+    finally:
+        writer.close()
+
+def undo_renames(journal):
+    """
+    Reverts the last completed run recorded in a journal. The reversal is recorded as a new
+    run, so calling `undo_renames` again redoes the renames.
+
+    Parameters:
+    - journal (str): The journal passed to `bulk_rename` or `RenamePlan.apply`.
+
+    Returns:
+    - list: The restored file names.
+
+    Raises:
+    - ValueError: If the journal records no completed run; interrupted runs are handled by
+      `recover_renames`.
+    - RenameConflictError: If files were added or removed since, so the original names can
+      no longer be restored safely.
+
+    Example:
+    >>> bulk_rename('/path/to/files', 'image_', journal='/tmp/rename.journal')
+    ['image_1_file1.jpg', 'image_2_file2.png']
+    >>> undo_renames('/tmp/rename.journal')
+    ['file1.jpg', 'file2.png']
+    """
+    directory, steps, _, state = _read_last_run(journal)
+    if state != 'committed':
+        raise ValueError(f"The last run in '{journal}' did not complete; "
+                         f"use recover_renames instead.")
+    inverse = {final: original for original, final in _net_renames(steps).items()}
+    return plan_renames(directory, inverse).apply(journal=journal)
@@ -0,0 +1,379 @@
+"""
+This module routes files to destination folders with declarative rules.
+
+A rule set is a list of dictionaries, each naming a `destination` folder and the conditions a
+file must meet to go there, e.g. ``{"destination": "raw", "mime": "image/*",
+"min_megapixels": 20}``. The first rule whose conditions all hold wins. Rules are compiled
+once into a `RuleSet`, which routes each file in a single pass:
+1. The file extension is looked up in a dictionary that lists, in order, the rules the file
+   can still match, so rules for other extensions are never looked at.
+2. The name patterns of those rules (their globs, or their regexes for rules without globs)
+   are combined into one regular expression, run once on the file name; it also tells which
+   is the first rule whose pattern matches. A rule with both globs and regexes checks its
+   regexes on their own afterwards.
+3. The remaining conditions of each candidate are checked from cheapest to most expensive:
+   size and age (one `stat`), then the MIME type (one header read) and finally metadata
+   fields (parsed on demand, only the fields the rules use). Each is computed at most once
+   per file, whatever the number of rules.
+
+Conditions:
+- extension: An extension or list of extensions, e.g. '.jpg' (case-insensitive).
+- glob: A shell-style pattern or list of patterns matched against the file name; one of
+  them must match.
+- regex: A regular expression or list of them searched in the file name; one of them must
+  match. A rule with both a glob and a regex needs both to match.
+- mime: A MIME type or list of them; 'image/*' matches a whole major type.
+- min_size, max_size: Bounds on the size in bytes.
+- min_age, max_age: Bounds on the time since the last modification, in seconds.
+- min_megapixels, max_megapixels: Bounds on the image resolution.
+- metadata: A dictionary of metadata fields to values, lists of accepted values, or
+  ``{"min": ..., "max": ...}`` bounds, e.g. ``{"mode": "CMYK"}``.
+
+Destinations are relative folders, and may use `{major}`, `{subtype}` (parts of the MIME
+type) and `{extension}` (without the dot), e.g. 'documents/{subtype}'.
+
+Classes:
+- RuleSet: A compiled rule set.
+
+Functions:
+- compile_rules: Validates and compiles a rule set.
+- load_rules: Reads and compiles a rule set from a JSON file.
+
+Dependencies:
+- re, fnmatch: Used to compile the name patterns.
+- This module relies on `smartfile.file_types.get_file_type` and
+  `smartfile.metadata.get_metadata` for the conditions that need them.
+"""
+
+import os
+import re
+import json
+import time
+import bisect
+import itertools
+import string
+import fnmatch
+from smartfile.file_types import get_file_type
+from smartfile.metadata import get_metadata
+
+# The default destination of `compile_rules`: the MIME major type, as `organize_by_type` does
+TYPE_FOLDER = '{major}'
+_CONDITIONS = ('extension', 'glob', 'regex', 'mime', 'min_size', 'max_size', 'min_age',
+               'max_age', 'min_megapixels', 'max_megapixels', 'metadata')
+_PLACEHOLDERS = frozenset(('major', 'subtype', 'extension'))
+_MISSING = object()
+
+def _as_list(value):
+    return [value] if isinstance(value, (str, int, float)) else list(value)
+
+def _check_destination(destination, where):
+    if not isinstance(destination, str) or not destination:
+        raise ValueError(f"{where} needs a 'destination' folder.")
+    fields = set()
+    for _, field, _, _ in string.Formatter().parse(destination):
+        if field is not None:
+            if field not in _PLACEHOLDERS:
+                raise ValueError(f"{where}: unknown placeholder {{{field}}} in the destination; "
+                                 f"use {{major}}, {{subtype}} or {{extension}}.")
+            fields.add(field)
+    parts = destination.replace('\\', '/').split('/')
+    if os.path.isabs(destination) or '..' in parts:
+        raise ValueError(f"{where}: the destination must be a folder inside the organized "
+                         f"directory.")
+    return fields
+
+def _alternation(alternatives):
+    if not alternatives:
+        return None
+    return re.compile('|'.join(f"(?:{alternative})" for alternative in alternatives))
+
+class _Rule:
+    """
+    One compiled rule. Conditions that are not set are None.
+    """
+    __slots__ = ('index', 'destination', 'placeholders', 'extensions', 'pattern', 'regex',
+                 'mime_types', 'mime_majors', 'size', 'age', 'megapixels', 'metadata',
+                 'needs_mime')
+
+    def __init__(self, index, spec):
+        where = f"Rule {index}"
+        if not isinstance(spec, dict):
+            raise ValueError(f"{where} must be a dictionary.")
+        unknown = set(spec) - set(_CONDITIONS) - {'destination'}
+        if unknown:
+            raise ValueError(f"{where}: unknown condition(s) {', '.join(sorted(unknown))}.")
+        self.index = index
+        self.destination = spec.get('destination')
+        self.placeholders = _check_destination(self.destination, where)
+
+        self.extensions = None
+        if 'extension' in spec:
+            self.extensions = frozenset('.' + extension.lower().lstrip('.')
+                                        for extension in _as_list(spec['extension']))
+
+        # `pattern` takes part in the combined prefilter; `regex` is only set when the rule
+        # also has globs, and is then checked separately
+        globs = [fnmatch.translate(glob) for glob in _as_list(spec.get('glob', ()))]
+        regexes = [f"(?s:.*?)(?:{regex})" for regex in _as_list(spec.get('regex', ()))]
+        try:
+            self.pattern = _alternation(globs or regexes)
+            self.regex = _alternation(regexes) if globs else None
+        except re.error as e:
+            raise ValueError(f"{where}: invalid pattern: {e}") from None
+
+        self.mime_types = self.mime_majors = None
+        if 'mime' in spec:
+            mime_types = _as_list(spec['mime'])
+            self.mime_types = frozenset(mime for mime in mime_types if not mime.endswith('/*'))
+            self.mime_majors = frozenset(mime[:-2] for mime in mime_types if mime.endswith('/*'))
+
+        self.size = self._bounds(spec, 'size')
+        self.age = self._bounds(spec, 'age')
+        self.megapixels = self._bounds(spec, 'megapixels')
+        self.metadata = None
+        if 'metadata' in spec:
+            if not isinstance(spec['metadata'], dict) or not spec['metadata']:
+                raise ValueError(f"{where}: 'metadata' must map field names to conditions.")
+            self.metadata = tuple(spec['metadata'].items())
+        self.needs_mime = (self.mime_types is not None or self.metadata is not None
+                           or self.megapixels is not None
+                           or bool(self.placeholders & {'major', 'subtype'}))
+
+    @staticmethod
+    def _bounds(spec, name):
+        low, high = spec.get(f'min_{name}'), spec.get(f'max_{name}')
+        if low is None and high is None:
+            return None
+        return (low, high)
+
+    def metadata_fields(self):
+        fields = {field for field, _ in self.metadata or ()}
+        if self.megapixels is not None:
+            fields.add('size')
+        return fields
+
+    def matches(self, candidate):
+        """
+        Checks every condition except the extension and the name pattern, cheapest first.
+        """
+        if self.size is not None and not _within(candidate.stat().st_size, self.size):
+            return False
+        if self.age is not None and not _within(candidate.now - candidate.stat().st_mtime,
+                                                self.age):
+            return False
+        if self.needs_mime:
+            mime_type = candidate.mime_type()
+            if mime_type is None:
+                return False
+            if self.mime_types is not None and not (
+                    mime_type in self.mime_types
+                    or mime_type.split('/')[0] in self.mime_majors):
+                return False
+        if self.megapixels is not None:
+            size = candidate.field('size')
+            if not isinstance(size, tuple) or not _within(size[0] * size[1] / 1e6,
+                                                          self.megapixels):
+                return False
+        for field, condition in self.metadata or ():
+            if not _satisfies(candidate.field(field), condition):
+                return False
+        return True
+
+    def folder(self, candidate):
+        if not self.placeholders:
+            return self.destination
+        major, _, subtype = (candidate.mime_type() or '').partition('/')
+        return self.destination.format(major=major, subtype=subtype,
+                                       extension=candidate.extension.lstrip('.'))
+
+def _within(value, bounds):
+    low, high = bounds
+    return (low is None or value >= low) and (high is None or value <= high)
+
+def _satisfies(value, condition):
+    if value is _MISSING:
+        return False
+    if isinstance(condition, dict):
+        try:
+            return _within(value, (condition.get('min'), condition.get('max')))
+        except TypeError:
+            return False  # Not comparable, e.g. a string against a number
+    if isinstance(condition, list):
+        return value in condition or (isinstance(value, tuple) and list(value) in condition)
+    return value == condition or (isinstance(value, tuple) and list(value) == condition)
+
+class _Candidate:
+    """
+    The file being routed. Its stat, MIME type and metadata are computed on first use and
+    shared by all rules.
+    """
+    __slots__ = ('path', 'extension', 'now', '_entry', '_stat', '_detect', '_mime_type',
+                 '_fields', '_metadata')
+
+    def __init__(self, path, extension, entry, detect, fields, now):
+        self.path = path
+        self.extension = extension
+        self.now = now
+        self._entry = entry
+        self._stat = None
+        self._detect = detect
+        self._mime_type = _MISSING
+        self._fields = fields
+        self._metadata = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = self._entry.stat() if self._entry is not None else os.stat(self.path)
+        return self._stat
+
+    def mime_type(self):
+        if self._mime_type is _MISSING:
+            self._mime_type = self._detect(self.path)
+        return self._mime_type
+
+    def field(self, name):
+        if self._metadata is None:
+            try:
+                self._metadata = get_metadata(self.path, fields=self._fields,
+                                              mime_type=self.mime_type())
+            except (OSError, ValueError):
+                self._metadata = {}
+        try:
+            return self._metadata.get(name, _MISSING)
+        except Exception:
+            return _MISSING  # The file cannot be parsed
+
+class RuleSet:
+    """
+    A compiled rule set; see `compile_rules`.
+
+    Attributes:
+    - rules (list): The rule dictionaries, in order.
+    - default (str): The destination of files no rule matches, or None to leave them in place.
+    """
+
+    def __init__(self, rules, default=TYPE_FOLDER):
+        self.rules = list(rules)
+        self.default = default
+        compiled = [_Rule(index, spec) for index, spec in enumerate(self.rules)]
+        if default is not None:
+            fallback = _Rule(len(compiled), {'destination': default})
+            compiled.append(fallback)
+        self._fields = frozenset().union(*(rule.metadata_fields() for rule in compiled))
+
+        # Each extension maps to the rules a file with that extension can match, in order
+        extensions = set()
+        for rule in compiled:
+            extensions.update(rule.extensions or ())
+        self._by_extension = {extension: self._candidates(compiled, extension)
+                              for extension in extensions}
+        self._others = self._candidates(compiled, None)
+
+    @staticmethod
+    def _candidates(compiled, extension):
+        """
+        Returns the rules a file with the given extension can match, the positions of those
+        without a name pattern, and the combined pattern of the others, where group
+        `r<position>` is the rule at that position.
+        """
+        rules = tuple(rule for rule in compiled
+                      if rule.extensions is None or extension in rule.extensions)
+        plain = tuple(position for position, rule in enumerate(rules) if rule.pattern is None)
+        alternatives = [f"(?P<r{position}>{rule.pattern.pattern})"
+                        for position, rule in enumerate(rules) if rule.pattern is not None]
+        combined = None
+        if alternatives:
+            try:
+                combined = re.compile('|'.join(alternatives))
+            except re.error:
+                # Patterns with clashing group names: every rule is checked on its own
+                plain = tuple(range(len(rules)))
+        return rules, plain, combined
+
+    def route(self, path, detect=get_file_type, entry=None):
+        """
+        Returns the destination folder of a file, relative to the organized directory.
+
+        Parameters:
+        - path (str): The file.
+        - detect (callable): Returns the MIME type of a path; only called if a rule needs it
+          (default is `get_file_type`).
+        - entry (os.DirEntry): The directory entry of the file, if known, to reuse its stat.
+
+        Returns:
+        - str: The destination folder, with '/' separators, or None if no rule matches.
+
+        Example:
+        >>> rules.route('/srv/inbox/IMG_0001.CR2')
+        'raw'
+        """
+        name = os.path.basename(path)
+        extension = os.path.splitext(name)[1].lower()
+        rules, plain, combined = self._by_extension.get(extension, self._others)
+        candidate = _Candidate(path, extension, entry, detect, self._fields, time.time())
+
+        first = None  # Position of the first rule whose pattern matches the name
+        if combined is None:
+            positions = plain
+        else:
+            # Rules whose pattern comes before the first match in the combined pattern cannot
+            # match, so only rules without a pattern are left before it
+            found = combined.match(name)
+            first = int(found.lastgroup[1:]) if found is not None else len(rules)
+            positions = itertools.chain(plain[:bisect.bisect_left(plain, first)],
+                                        range(first, len(rules)))
+        for position in positions:
+            rule = rules[position]
+            if rule.pattern is not None:
+                if position != first and not rule.pattern.match(name):
+                    continue
+                if rule.regex is not None and not rule.regex.match(name):
+                    continue
+            try:
+                if rule.matches(candidate):
+                    return rule.folder(candidate)
+            except OSError:
+                return None  # The file vanished or cannot be read
+        return None
+
+def compile_rules(rules, default=TYPE_FOLDER):
+    """
+    Validates and compiles a rule set.
+
+    Parameters:
+    - rules (iterable): Rule dictionaries, each with a 'destination' and any of the conditions
+      listed in this module's documentation. The first matching rule wins.
+    - default (str): The destination of files no rule matches (default is '{major}', the
+      MIME major type). Pass None to leave such files in place.
+
+    Returns:
+    - RuleSet: The compiled rules, to pass to `organize_by_type(..., rules=...)`.
+
+    Raises:
+    - ValueError: If a rule has an unknown condition, an invalid pattern or no destination.
+
+    Example:
+    >>> rules = compile_rules([
+    ...     {"destination": "raw", "extension": [".cr2", ".nef", ".arw"]},
+    ...     {"destination": "raw", "mime": "image/*", "min_megapixels": 20},
+    ...     {"destination": "archive/{major}", "max_size": 1024, "min_age": 365 * 86400},
+    ... ])
+    >>> organize_by_type('/srv/inbox', rules=rules)
+    """
+    return RuleSet(rules, default=default)
+
+def load_rules(path):
+    """
+    Reads and compiles a rule set from a JSON file holding either a list of rules or an object
+    with 'rules' and an optional 'default' destination.
+
+    Raises:
+    - ValueError: If the file is not valid JSON or holds an invalid rule set.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return compile_rules(data)
+    if not isinstance(data, dict) or not isinstance(data.get('rules'), list):
+        raise ValueError(f"'{path}' must hold a list of rules or an object with 'rules'.")
+    return compile_rules(data['rules'], default=data.get('default', TYPE_FOLDER))
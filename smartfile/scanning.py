@@ -0,0 +1,59 @@
+"""
+This module provides the directory walker shared by smartfile's batch operations.
+
+Functions:
+- scan_files: Lazily yields the regular files below a directory as `os.DirEntry` objects.
+
+Dependencies:
+- os: Used for `os.scandir`, whose entries cache the file type so most files need no extra
+  `stat` call.
+"""
+
+import os
+
+def scan_files(directory, recursive=True, onerror=None):
+    """
+    Yields the regular files in a directory, optionally descending into subdirectories.
+
+    The walk is iterative and lazy: only the directories still to be visited are kept in
+    memory, so trees of any size can be scanned in constant memory per directory level.
+    Symbolic links to directories are not followed.
+
+    Parameters:
+    - directory (str): The directory to scan.
+    - recursive (bool): Whether to descend into subdirectories (default is True).
+    - onerror (callable): Called with the `OSError` raised when a directory cannot be listed.
+      By default such directories are skipped silently.
+
+    Returns:
+    - generator: Yields an `os.DirEntry` for each regular file.
+
+    Example:
+    >>> [entry.name for entry in scan_files('/path/to/directory')]
+    ['notes.txt', 'photo.jpg', 'report.pdf']
+    """
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+
+        subdirectories = []
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+                except OSError as e:
+                    if onerror is not None:
+                        onerror(e)
+
+        # Visit subdirectories in the order they were listed
+        pending.extend(reversed(subdirectories))
@@ -0,0 +1,501 @@
+"""
+This module finds images that look the same even when their bytes differ, e.g. resized,
+re-encoded or lightly edited copies of a photo.
+
+Each image gets a perceptual hash: a 64-bit fingerprint computed from a tiny grayscale version
+of the picture, so similar pictures get hashes that differ in few bits. JPEGs are decoded
+directly at a reduced resolution, so hashing costs a fraction of a full decode. Hashes are
+indexed so that "every hash within N bits of this one" is answered without comparing against
+every other image, and images linked by such matches are clustered together.
+
+Classes:
+- BKTree: A tree of hashes supporting Hamming-radius queries, for incremental use.
+- HammingIndex: A multi-index hash table for Hamming-radius queries over millions of hashes.
+- SimilarGroup: A cluster of near-duplicate images.
+
+Functions:
+- image_hash: Computes the perceptual hash of one image.
+- hamming_distance: Returns the number of bits that differ between two hashes.
+- hash_images: Computes the hashes of many images, optionally on a process pool.
+- find_similar_images: Clusters near-duplicate images.
+- organize_similar: Moves each cluster into a folder of its own.
+
+Dependencies:
+- PIL (Pillow): Used to decode the images.
+- This module relies on `smartfile.concurrency.bounded_map` to feed the process pool and on
+  `smartfile.transfer.move_file` to move clustered files.
+"""
+
+import os
+import math
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from smartfile import archives
+from smartfile.concurrency import bounded_map
+from smartfile.file_management import OrganizeResult
+from smartfile.file_types import get_file_type
+from smartfile.instrumentation import stage
+from smartfile.scanning import scan_files
+from smartfile.transfer import move_file
+
+HASH_METHODS = ('dhash', 'phash')
+# Default number of differing bits up to which two 64-bit hashes are considered similar
+DEFAULT_THRESHOLD = 6
+_HASH_SIZE = 8
+# pHash keeps the lowest 8x8 frequencies of a 32x32 image
+_PHASH_FACTOR = 4
+
+try:
+    _popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+    def _popcount(value):
+        return bin(value).count('1')
+
+def hamming_distance(first, second):
+    """
+    Returns the number of bits that differ between two hashes.
+    """
+    return _popcount(first ^ second)
+
+SimilarGroup = namedtuple('SimilarGroup', ['paths', 'hashes'])
+SimilarGroup.__doc__ = """
+A cluster of near-duplicate images.
+
+Every image is within the threshold of at least one other image of the cluster, so the two
+most distant images may differ by more than the threshold.
+
+Attributes:
+- paths (list): The image paths, sorted.
+- hashes (list): The hash of each image, in the same order.
+"""
+
+_dct_tables = {}
+
+def _dct_table(size, kept):
+    """
+    Returns the cosines of the first `kept` DCT-II frequencies for `size` samples.
+    """
+    table = _dct_tables.get((size, kept))
+    if table is None:
+        table = _dct_tables[(size, kept)] = [
+            [math.cos(math.pi * (2 * x + 1) * u / (2 * size)) for x in range(size)]
+            for u in range(kept)]
+    return table
+
+def _bits(flags):
+    value = 0
+    for flag in flags:
+        value = (value << 1) | flag
+    return value
+
+def _dhash(pixels, width, height):
+    # One bit per horizontal neighbour pair: is the left pixel brighter?
+    return _bits(pixels[row * width + column] > pixels[row * width + column + 1]
+                 for row in range(height) for column in range(width - 1))
+
+def _phash(pixels, size, kept):
+    # The lowest frequencies of a 2D DCT, compared with their median
+    table = _dct_table(size, kept)
+    rows = [[sum(c * p for c, p in zip(cosines, pixels[y * size:(y + 1) * size]))
+             for cosines in table] for y in range(size)]
+    coefficients = [sum(cosines[y] * rows[y][u] for y in range(size))
+                    for v, cosines in enumerate(table) for u in range(kept)]
+    ordered = sorted(coefficients)
+    median = (ordered[len(ordered) // 2 - 1] + ordered[len(ordered) // 2]) / 2
+    return _bits(coefficient > median for coefficient in coefficients)
+
+def image_hash(path, method='dhash', hash_size=_HASH_SIZE):
+    """
+    Computes the perceptual hash of an image.
+
+    'dhash' compares neighbouring pixels of a (hash_size + 1) x hash_size thumbnail; it is
+    fast and robust to resizing and re-encoding. 'phash' keeps the lowest frequencies of a
+    discrete cosine transform; it is slower but also tolerates contrast and gamma changes.
+    Either way, the image is decoded at the lowest resolution the format allows.
+
+    Parameters:
+    - path (str): The image, or a virtual path into an archive.
+    - method (str): 'dhash' or 'phash' (default is 'dhash').
+    - hash_size (int): The hash has hash_size * hash_size bits (default is 8, for 64 bits).
+
+    Returns:
+    - int: The hash. Compare hashes with `hamming_distance`.
+
+    Raises:
+    - ValueError: If the method is unknown.
+    - OSError: If the image cannot be read or decoded.
+
+    Example:
+    >>> hamming_distance(image_hash('beach.jpg'), image_hash('beach_small.jpg'))
+    2
+    """
+    if method not in HASH_METHODS:
+        raise ValueError(f"Unknown hash method {method!r}; use one of {', '.join(HASH_METHODS)}.")
+    if method == 'dhash':
+        width, height = hash_size + 1, hash_size
+    else:
+        width = height = hash_size * _PHASH_FACTOR
+
+    with stage('similarity.hash'), archives.open_binary(path) as f, Image.open(f) as img:
+        # JPEG decodes straight to a small grayscale image; other formats ignore the request
+        img.draft('L', (width, height))
+        pixels = list(img.convert('L').resize((width, height), Image.LANCZOS).getdata())
+    if method == 'dhash':
+        return _dhash(pixels, width, height)
+    return _phash(pixels, width, hash_size)
+
+class _Hasher:
+    """
+    A picklable `image_hash` call with fixed options, for the process pool.
+    """
+
+    def __init__(self, method, hash_size):
+        self.options = (method, hash_size)
+
+    def __call__(self, path):
+        return image_hash(path, *self.options)
+
+def hash_images(paths, method='dhash', hash_size=_HASH_SIZE, workers=None, max_pending=None):
+    """
+    Computes the perceptual hashes of many images.
+
+    Parameters:
+    - paths (iterable): The images to hash. It is consumed lazily.
+    - method, hash_size: As for `image_hash`.
+    - workers (int): The number of worker processes. By default images are hashed one at a
+      time in the calling process.
+    - max_pending (int): The maximum number of images being hashed at once (default is four
+      per worker).
+
+    Returns:
+    - generator: Yields `(path, hash)` tuples, where `hash` is the exception raised if the
+      image cannot be hashed. With `workers`, results arrive in completion order.
+    """
+    if method not in HASH_METHODS:
+        raise ValueError(f"Unknown hash method {method!r}; use one of {', '.join(HASH_METHODS)}.")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1.")
+    hasher = _Hasher(method, hash_size)
+
+    if workers is None:
+        for path in paths:
+            try:
+                yield path, hasher(path)
+            except Exception as e:
+                yield path, e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, future in bounded_map(executor, hasher, paths,
+                                        max_pending=max_pending or workers * 4):
+            try:
+                yield path, future.result()
+            except Exception as e:
+                yield path, e
+
+class BKTree:
+    """
+    A BK-tree over hashes with the Hamming distance.
+
+    Each child of a node is keyed by its distance to the node, so by the triangle inequality a
+    query within `radius` of a hash only descends into children whose key is within `radius`
+    of the query's distance to the node. For radii of a few bits much of the tree is skipped.
+    Equal hashes share a node, which keeps every item added with them.
+
+    Example:
+    >>> tree = BKTree()
+    >>> tree.add(0b1011, 'a.jpg')
+    >>> tree.add(0b1001, 'b.jpg')
+    >>> tree.query(0b1011, 1)
+    [(0, 11, ['a.jpg']), (1, 9, ['b.jpg'])]
+    """
+
+    def __init__(self, items=()):
+        self._root = None
+        self._size = 0
+        for value, item in items:
+            self.add(value, item)
+
+    def __len__(self):
+        """
+        Returns the number of distinct hashes in the tree.
+        """
+        return self._size
+
+    def add(self, value, item=None):
+        """
+        Adds a hash, with an optional item (e.g. a path) attached to it.
+        """
+        # Nodes are [hash, items, children] lists, children mapping a distance to a node
+        if self._root is None:
+            self._root = [value, [item], {}]
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = _popcount(value ^ node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                self._size += 1
+                return
+            node = child
+
+    def query(self, value, radius):
+        """
+        Returns every hash within `radius` bits of `value`.
+
+        Returns:
+        - list: `(distance, hash, items)` tuples, sorted by distance.
+        """
+        if self._root is None:
+            return []
+        found = []
+        pending = [self._root]
+        while pending:
+            node = pending.pop()
+            distance = _popcount(value ^ node[0])
+            if distance <= radius:
+                found.append((distance, node[0], node[1]))
+            children = node[2]
+            if len(children) <= 2 * radius + 1:
+                pending.extend(child for key, child in children.items()
+                               if distance - radius <= key <= distance + radius)
+            else:
+                for key in range(max(1, distance - radius), distance + radius + 1):
+                    child = children.get(key)
+                    if child is not None:
+                        pending.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+_flip_masks = {}
+
+def _masks_within(width, radius):
+    """
+    Returns every mask of `width` bits with at most `radius` bits set.
+    """
+    masks = _flip_masks.get((width, radius))
+    if masks is None:
+        masks = [0]
+        for count in range(1, radius + 1):
+            masks += [sum(1 << bit for bit in bits)
+                      for bits in itertools.combinations(range(width), count)]
+        masks = _flip_masks[(width, radius)] = tuple(masks)
+    return masks
+
+class HammingIndex:
+    """
+    A multi-index hash table for Hamming-radius queries over many hashes.
+
+    Hashes are cut into `blocks` substrings, each indexed in its own table. If two hashes are
+    within `radius` bits, one of their substrings is within `radius // blocks` bits (the
+    pigeonhole principle), so a query only probes those few neighbouring substrings in each
+    table and checks the hashes found there. Unlike a BK-tree, the work per query stays small
+    when the hashes are spread evenly, which is the usual case for large photo libraries.
+
+    Parameters:
+    - bits (int): The number of bits per hash (default is 64).
+    - blocks (int): The number of substrings (default is 4). Queries are fastest when each
+      substring has about log2(number of hashes) bits; `for_size` picks that.
+
+    Example:
+    >>> index = HammingIndex.for_size(1000000)
+    >>> index.add(image_hash('beach.jpg'), 'beach.jpg')
+    >>> index.query(image_hash('beach_small.jpg'), 6)
+    [(2, 10983741254087391232, ['beach.jpg'])]
+    """
+
+    def __init__(self, bits=_HASH_SIZE * _HASH_SIZE, blocks=4):
+        if not 1 <= blocks <= bits:
+            raise ValueError("blocks must be between 1 and the number of bits.")
+        self.bits = bits
+        # (shift, width) of each substring; the first ones take the remainder bits
+        widths = [bits // blocks + (index < bits % blocks) for index in range(blocks)]
+        self._blocks = []
+        shift = bits
+        for width in widths:
+            shift -= width
+            self._blocks.append((shift, width))
+        self._tables = [{} for _ in widths]
+        self._items = {}
+
+    @classmethod
+    def for_size(cls, count, bits=_HASH_SIZE * _HASH_SIZE, max_radius=DEFAULT_THRESHOLD):
+        """
+        Returns an empty index tuned for about `count` hashes queried within `max_radius`.
+        """
+        blocks = round(bits / max(1.0, math.log2(max(count, 2))))
+        return cls(bits, max(1, min(blocks, max_radius + 1, bits)))
+
+    def __len__(self):
+        """
+        Returns the number of distinct hashes in the index.
+        """
+        return len(self._items)
+
+    def add(self, value, item=None):
+        """
+        Adds a hash, with an optional item (e.g. a path) attached to it.
+        """
+        items = self._items.get(value)
+        if items is not None:
+            items.append(item)
+            return
+        self._items[value] = [item]
+        for table, (shift, width) in zip(self._tables, self._blocks):
+            table.setdefault((value >> shift) & ((1 << width) - 1), []).append(value)
+
+    def query(self, value, radius):
+        """
+        Returns every hash within `radius` bits of `value`.
+
+        Returns:
+        - list: `(distance, hash, items)` tuples, sorted by distance.
+        """
+        found = []
+        seen = set()
+        block_radius = radius // len(self._blocks)
+        for table, (shift, width) in zip(self._tables, self._blocks):
+            key = (value >> shift) & ((1 << width) - 1)
+            for mask in _masks_within(width, block_radius):
+                candidates = table.get(key ^ mask)
+                if candidates is None:
+                    continue
+                for candidate in candidates:
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = _popcount(value ^ candidate)
+                    if distance <= radius:
+                        found.append((distance, candidate, self._items[candidate]))
+        found.sort(key=lambda match: match[0])
+        return found
+
+def _image_paths(paths, recursive):
+    if isinstance(paths, (str, bytes, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        if not os.path.isdir(path):
+            yield os.fspath(path)
+            continue
+        for entry in scan_files(path, recursive=recursive):
+            try:
+                mime_type = get_file_type(entry.path)
+            except (OSError, ValueError):
+                continue
+            if mime_type and mime_type.startswith('image/'):
+                yield entry.path
+
+def find_similar_images(paths, threshold=DEFAULT_THRESHOLD, method='dhash',
+                        hash_size=_HASH_SIZE, workers=None, recursive=True, on_error=None):
+    """
+    Clusters near-duplicate images.
+
+    Images are hashed (in parallel with `workers`) and indexed in a `HammingIndex`. Each distinct
+    hash is then looked up once, and images whose hashes are within `threshold` bits of each
+    other end up in the same cluster.
+
+    Parameters:
+    - paths (str or iterable): A directory or image, or an iterable of them. Directories are
+      searched for images by content type.
+    - threshold (int): The maximum number of differing bits between two similar images
+      (default is 6 of 64). 0 only groups images with identical hashes.
+    - method, hash_size: As for `image_hash`.
+    - workers (int): The number of worker processes hashing images.
+    - recursive (bool): Whether to descend into subdirectories (default is True).
+    - on_error (callable): Called as `on_error(path, exception)` for images that cannot be
+      hashed. By default they are skipped silently.
+
+    Returns:
+    - list: A `SimilarGroup` for each cluster of two or more images, largest first.
+
+    Example:
+    >>> for group in find_similar_images('/srv/photos', workers=8):
+    ...     print(group.paths)
+    ['/srv/photos/beach.jpg', '/srv/photos/export/beach_small.jpg']
+    """
+    if threshold < 0:
+        raise ValueError("threshold must not be negative.")
+
+    by_hash = {}
+    for path, value in hash_images(_image_paths(paths, recursive), method, hash_size, workers):
+        if isinstance(value, Exception):
+            if on_error is not None:
+                on_error(path, value)
+            continue
+        by_hash.setdefault(value, []).append(path)
+
+    index = HammingIndex.for_size(len(by_hash), hash_size * hash_size, threshold)
+    for value in by_hash:
+        index.add(value)
+
+    # Union-find over the distinct hashes
+    parents = {value: value for value in by_hash}
+
+    def find(value):
+        root = value
+        while parents[root] != root:
+            root = parents[root]
+        while parents[value] != root:
+            parents[value], value = root, parents[value]
+        return root
+
+    if threshold:
+        for value in by_hash:
+            for _, match, _ in index.query(value, threshold):
+                first, second = find(value), find(match)
+                if first != second:
+                    parents[second] = first
+
+    clusters = {}
+    for value, files in by_hash.items():
+        clusters.setdefault(find(value), []).extend((path, value) for path in files)
+    groups = []
+    for members in clusters.values():
+        if len(members) > 1:
+            members.sort()
+            groups.append(SimilarGroup([path for path, _ in members],
+                                       [value for _, value in members]))
+    groups.sort(key=lambda group: (-len(group.paths), group.paths[0]))
+    return groups
+
+def organize_similar(groups, destination, folder_template='similar_{index:04d}'):
+    """
+    Moves each cluster of near-duplicates into a folder of its own, for review.
+
+    Parameters:
+    - groups (iterable): `SimilarGroup` objects, e.g. from `find_similar_images`.
+    - destination (str): The directory the cluster folders are created in.
+    - folder_template (str): The folder names, formatted with `index`, starting at 1.
+
+    Returns:
+    - OrganizeResult: The files that were moved, skipped (a file of the same name is already
+      in the folder) and failed, with reasons.
+
+    Example:
+    >>> organize_similar(find_similar_images('/srv/photos'), '/srv/review')
+    OrganizeResult(moved=312, skipped=0, failed=0)
+    """
+    result = OrganizeResult()
+    for index, group in enumerate(groups, start=1):
+        folder = os.path.join(destination, folder_template.format(index=index))
+        os.makedirs(folder, exist_ok=True)
+        for path in group.paths:
+            target = os.path.join(folder, os.path.basename(path))
+            if os.path.lexists(target):
+                result.add('skipped', path, f"destination '{target}' already exists")
+                continue
+            try:
+                with stage('organize.move'):
+                    move_file(path, target)
+            except Exception as e:
+                result.add('failed', path, str(e))
+            else:
+                result.add('moved', path, target)
+    return result
@@ -0,0 +1,285 @@
+"""
+This module renders several thumbnail sizes of images in one pass and packs them into atlases.
+
+Each source image is decoded once: formats that support it (e.g. JPEG) are decoded directly
+at the lowest resolution that still serves the largest requested size. Every rendition is then
+derived from that decode, or from a larger rendition when it is big enough, so asking for
+64, 256 and 1024 px costs little more than asking for 1024 px alone. EXIF orientation is
+applied, so thumbnails are always upright.
+
+Classes:
+- Thumbnail: A rendered thumbnail file.
+
+Functions:
+- make_thumbnails: Renders all requested sizes of one image.
+- generate_thumbnails: Renders many images, optionally on a process pool.
+- pack_atlases: Packs thumbnails into sprite sheets with a JSON manifest of their positions.
+
+Dependencies:
+- PIL (Pillow): Used to decode, resize and encode images.
+- This module relies on `smartfile.concurrency.bounded_map` to feed the process pool.
+"""
+
+import os
+import json
+import math
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from smartfile.concurrency import bounded_map
+from smartfile.instrumentation import stage
+
+DEFAULT_SIZES = (64, 256, 1024)
+# Decode at least this many times larger than the target, so the final resize stays sharp
+_REDUCING_GAP = 2
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+_EXIF_ORIENTATION = 0x0112
+_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+# Modes each output format can store; anything else is converted
+_FORMAT_MODES = {'JPEG': ('RGB', 'L', 'CMYK'), 'PNG': ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'),
+                 'WEBP': ('RGB', 'RGBA')}
+
+Thumbnail = namedtuple('Thumbnail', ['source', 'label', 'path', 'width', 'height'])
+Thumbnail.__doc__ = """
+A rendered thumbnail.
+
+Attributes:
+- source (str): The source image.
+- label (str): The requested size, e.g. '256' or '320x200'.
+- path (str): The thumbnail file.
+- width, height (int): The actual dimensions of the thumbnail.
+"""
+
+def _box(size):
+    """
+    Returns the `(width, height)` bounding box and label of a requested size, given either as
+    a single number (the longest edge) or as a `(width, height)` tuple.
+    """
+    if isinstance(size, int):
+        if size < 1:
+            raise ValueError("Thumbnail sizes must be positive.")
+        return (size, size), str(size)
+    width, height = size
+    if width < 1 or height < 1:
+        raise ValueError("Thumbnail sizes must be positive.")
+    return (width, height), f"{width}x{height}"
+
+def _decode(source, largest):
+    """
+    Opens an image at the lowest resolution that still serves `largest` and applies its EXIF
+    orientation.
+    """
+    with Image.open(source) as img:
+        orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+        width, height = largest
+        if orientation in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width  # The box applies after rotation
+        img.draft(None, (width * _REDUCING_GAP, height * _REDUCING_GAP))
+        img.load()
+        return ImageOps.exif_transpose(img)
+
+def _save(image, path, image_format, quality):
+    if image.mode not in _FORMAT_MODES.get(image_format, (image.mode,)):
+        keep_alpha = 'A' in image.getbands() and 'RGBA' in _FORMAT_MODES[image_format]
+        image = image.convert('RGBA' if keep_alpha else 'RGB')
+    options = {'quality': quality} if image_format in ('JPEG', 'WEBP') else {}
+    directory = os.path.dirname(os.path.abspath(path))
+    # Write to a temporary file first so readers never see a partial thumbnail
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, format=image_format, **options)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def make_thumbnails(source, output_dir, sizes=DEFAULT_SIZES, image_format='JPEG', quality=85,
+                    name_template='{stem}_{label}.{ext}'):
+    """
+    Renders every requested size of one image from a single decode.
+
+    Parameters:
+    - source (str): The image to render.
+    - output_dir (str): The directory the thumbnails are written to. It is created if needed.
+    - sizes (iterable): The sizes to render, each either the longest edge in pixels or a
+      `(width, height)` bounding box (default is 64, 256 and 1024). Images are never
+      enlarged.
+    - image_format (str): 'JPEG', 'PNG' or 'WEBP' (default is 'JPEG').
+    - quality (int): The JPEG or WebP quality (default is 85).
+    - name_template (str): The thumbnail file names, formatted with `stem` (the source name
+      without its extension), `label` (e.g. '256') and `ext`.
+
+    Returns:
+    - list: A `Thumbnail` for each size, in the order requested.
+
+    Example:
+    >>> make_thumbnails('/photos/beach.jpg', '/srv/thumbs', sizes=(64, 256, 1024))
+    [Thumbnail(source='/photos/beach.jpg', label='64', path='/srv/thumbs/beach_64.jpg', ...), ...]
+    """
+    image_format = image_format.upper()
+    if image_format not in _EXTENSIONS:
+        raise ValueError(f"Unsupported thumbnail format {image_format!r}.")
+    boxes = [_box(size) for size in sizes]
+    if not boxes:
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+
+    largest = (max(box[0] for box, _ in boxes), max(box[1] for box, _ in boxes))
+    with stage('thumbnails.decode'):
+        base = _decode(source, largest)
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    ext = _EXTENSIONS[image_format]
+    renditions = []  # Largest first, so each size can start from the smallest suitable one
+    results = {}
+    with stage('thumbnails.resize'):
+        for box, label in sorted(boxes, key=lambda item: item[0][0] * item[0][1], reverse=True):
+            start = base
+            for rendition in renditions:
+                if (rendition.width >= box[0] * _REDUCING_GAP
+                        and rendition.height >= box[1] * _REDUCING_GAP):
+                    start = rendition
+            image = start.copy()
+            image.thumbnail(box, Image.LANCZOS)
+            renditions.append(image)
+            results[label] = image
+
+    thumbnails = []
+    for _, label in boxes:
+        image = results[label]
+        path = os.path.join(output_dir, name_template.format(stem=stem, label=label, ext=ext))
+        with stage('thumbnails.encode') as current:
+            _save(image, path, image_format, quality)
+            current.add_bytes(os.path.getsize(path))
+        thumbnails.append(Thumbnail(source, label, path, image.width, image.height))
+    return thumbnails
+
+def generate_thumbnails(sources, output_dir, sizes=DEFAULT_SIZES, workers=None,
+                        image_format='JPEG', quality=85, name_template='{stem}_{label}.{ext}',
+                        max_pending=None):
+    """
+    Renders thumbnails for many images, each decoded once.
+
+    Parameters:
+    - sources (iterable): The images to render. It is consumed lazily.
+    - output_dir (str): The directory the thumbnails are written to.
+    - sizes, image_format, quality, name_template: As for `make_thumbnails`.
+    - workers (int): The number of worker processes. By default images are rendered one at a
+      time in the calling process.
+    - max_pending (int): The maximum number of images being rendered at once (default is four
+      per worker).
+
+    Returns:
+    - generator: Yields `(source, thumbnails)` tuples, where `thumbnails` is the list returned
+      by `make_thumbnails`, or the exception raised while rendering. With `workers`, results
+      arrive in completion order.
+
+    Example:
+    >>> for source, result in generate_thumbnails(photos, '/srv/thumbs', workers=8):
+    ...     if isinstance(result, Exception):
+    ...         print(f"{source}: {result}")
+    """
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1.")
+    sizes = tuple(sizes)
+    render = _Renderer(output_dir, sizes, image_format, quality, name_template)
+
+    if workers is None:
+        for source in sources:
+            try:
+                yield source, render(source)
+            except Exception as e:
+                yield source, e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for source, future in bounded_map(executor, render, sources,
+                                          max_pending=max_pending or workers * 4):
+            try:
+                yield source, future.result()
+            except Exception as e:
+                yield source, e
+
+class _Renderer:
+    """
+    A picklable `make_thumbnails` call with fixed options, for the process pool.
+    """
+
+    def __init__(self, output_dir, sizes, image_format, quality, name_template):
+        self.options = (output_dir, sizes, image_format, quality, name_template)
+
+    def __call__(self, source):
+        return make_thumbnails(source, *self.options)
+
+def pack_atlases(thumbnails, output_dir, name='atlas', max_dimension=4096, image_format='PNG'):
+    """
+    Packs thumbnails into sprite sheets (atlases), one set per size label, so a page can load
+    many thumbnails in a few requests.
+
+    Thumbnails of the same label are placed on a grid whose cells are as large as the largest
+    of them. Each atlas is at most `max_dimension` pixels wide and high; more atlases are
+    written when needed. A JSON manifest records where each thumbnail is.
+
+    Parameters:
+    - thumbnails (iterable): `Thumbnail` objects, e.g. from `generate_thumbnails`.
+    - output_dir (str): The directory the atlases and manifest are written to.
+    - name (str): The prefix of the atlas files and the manifest, '<name>.json'.
+    - max_dimension (int): The maximum width and height of an atlas (default is 4096).
+    - image_format (str): The atlas format (default is 'PNG').
+
+    Returns:
+    - dict: The manifest: for each label, a list of atlases, each a dictionary with the
+      atlas 'image' file name, its 'width' and 'height', and 'tiles' mapping each source to
+      its `[x, y, width, height]` in the atlas.
+
+    Example:
+    >>> manifest = pack_atlases(thumbnails, '/srv/thumbs')
+    >>> manifest['64'][0]['tiles']['/photos/beach.jpg']
+    [128, 0, 64, 48]
+    """
+    image_format = image_format.upper()
+    if image_format not in _EXTENSIONS:
+        raise ValueError(f"Unsupported atlas format {image_format!r}.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    by_label = {}
+    for thumbnail in thumbnails:
+        by_label.setdefault(thumbnail.label, []).append(thumbnail)
+
+    manifest = {}
+    for label, group in by_label.items():
+        cell_width = max(thumbnail.width for thumbnail in group)
+        cell_height = max(thumbnail.height for thumbnail in group)
+        if cell_width > max_dimension or cell_height > max_dimension:
+            raise ValueError(f"Thumbnails of size {label} do not fit in a {max_dimension} px atlas.")
+        max_columns = max_dimension // cell_width
+        per_atlas = max_columns * (max_dimension // cell_height)
+
+        atlases = manifest[label] = []
+        for first in range(0, len(group), per_atlas):
+            tiles = group[first:first + per_atlas]
+            # Prefer square atlases, within the width limit
+            columns = min(max_columns, math.ceil(math.sqrt(len(tiles))))
+            rows = math.ceil(len(tiles) / columns)
+            mode = 'RGBA' if image_format != 'JPEG' else 'RGB'
+            atlas = Image.new(mode, (columns * cell_width, rows * cell_height))
+            positions = {}
+            for index, thumbnail in enumerate(tiles):
+                x = (index % columns) * cell_width
+                y = (index // columns) * cell_height
+                with Image.open(thumbnail.path) as tile:
+                    atlas.paste(tile.convert(mode), (x, y))
+                positions[thumbnail.source] = [x, y, thumbnail.width, thumbnail.height]
+
+            file_name = f"{name}_{label}_{len(atlases)}.{_EXTENSIONS[image_format]}"
+            _save(atlas, os.path.join(output_dir, file_name), image_format, 90)
+            atlases.append({"image": file_name, "width": atlas.width, "height": atlas.height,
+                            "tiles": positions})
+
+    with open(os.path.join(output_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
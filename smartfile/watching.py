@@ -0,0 +1,298 @@
+"""
+This module organizes files continuously as they arrive in a directory.
+
+On Linux the directory is watched with inotify: a file is only considered once it has been
+closed after writing (`IN_CLOSE_WRITE`) or moved into the directory (`IN_MOVED_TO`), so
+half-written files are never moved. Elsewhere, or when inotify is unavailable, the directory
+is polled and a file is considered once its size and modification time stay the same between
+two polls. Bursts of arrivals are debounced and organized together in batches, using the same
+detect-and-move path as `organize_by_type`. While nothing arrives the watcher sleeps in the
+kernel and uses no CPU.
+
+Functions:
+- watch: Organizes files by type as they arrive, until stopped.
+
+Dependencies:
+- ctypes: Used to call the inotify functions of the C library.
+- This module relies on `smartfile.file_management` to detect and move each file.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+from smartfile.concurrency import bounded_map
+from smartfile.file_management import OrganizeResult, _FolderCache, _organize_file
+from smartfile.file_types import get_file_type
+from smartfile.transfer import move_file
+
+# inotify constants from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+# The longest time the watcher sleeps before checking whether it was asked to stop
+_STOP_CHECK_INTERVAL = 0.5
+
+def _list_files(directory):
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    files.append(entry.path)
+            except OSError:
+                continue
+    return files
+
+def _load_inotify():
+    if not hasattr(os, 'O_CLOEXEC'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        init1, add_watch = libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    init1.argtypes = [ctypes.c_int]
+    add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return init1, add_watch
+
+class _InotifySource:
+    """
+    Reports files of a directory that were closed after writing or moved into it.
+    """
+
+    def __init__(self, directory, functions):
+        init1, add_watch = functions
+        self.directory = directory
+        self.gone = False
+        self._fd = init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR
+        if add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            code = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(code, os.strerror(code), directory)
+
+    def read(self, timeout):
+        """
+        Waits up to `timeout` seconds and returns the paths of the files that became ready.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # Events were dropped: fall back on listing the directory once
+                paths.extend(_list_files(self.directory))
+            elif mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                self.gone = True
+            elif name and not mask & _IN_ISDIR:
+                paths.append(os.path.join(self.directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+class _PollingSource:
+    """
+    Reports files of a directory whose size and modification time stayed the same between two
+    consecutive listings.
+    """
+
+    def __init__(self, directory, interval, existing):
+        self.directory = directory
+        self.gone = False
+        self._interval = interval
+        self._next_poll = time.monotonic()
+        # path -> [(size, mtime_ns), reported]
+        self._files = {}
+        if not existing:
+            self._poll(report=False)
+
+    def _poll(self, report=True):
+        ready = []
+        files = {}
+        try:
+            entries = os.scandir(self.directory)
+        except FileNotFoundError:
+            self.gone = True
+            return ready
+        with entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                identity = (st.st_size, st.st_mtime_ns)
+                previous = self._files.get(entry.path)
+                if previous is not None and previous[0] == identity:
+                    state = previous
+                    if report and not state[1]:
+                        state[1] = True
+                        ready.append(entry.path)
+                else:
+                    state = [identity, not report]
+                files[entry.path] = state
+        self._files = files
+        return ready
+
+    def read(self, timeout):
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        if delay > 0:
+            time.sleep(delay)
+        self._next_poll = time.monotonic() + self._interval
+        return self._poll()
+
+    def close(self):
+        pass
+
+def watch(directory, stop=None, on_result=None, backend=None, debounce=0.2, max_delay=1.0,
+          max_batch=1000, existing=True, workers=None, mover=None, poll_interval=1.0,
+          keep_records=False, rules=None):
+    """
+    Watches a directory and organizes files by type as they arrive, moving them into
+    subdirectories named after their type exactly like `organize_by_type`.
+
+    Arrivals are collected until none has come for `debounce` seconds, the oldest has waited
+    `max_delay` seconds, or `max_batch` files are pending, and are then organized as a batch.
+
+    Parameters:
+    - directory (str): The directory to watch. Subdirectories are not watched.
+    - stop (threading.Event): Watching ends once this event is set. Without it, `watch` runs
+      until interrupted.
+    - on_result (callable): Called as `on_result(status, source, detail)` for each organized
+      file, as in `organize_by_type`.
+    - backend (str): 'inotify' or 'polling'. By default inotify is used where available.
+    - debounce (float): Seconds without new arrivals before a batch is organized (default is
+      0.2).
+    - max_delay (float): The longest time in seconds a file waits before its batch is
+      organized, even while files keep arriving (default is 1.0).
+    - max_batch (int): The largest number of files organized in one batch (default is 1000).
+    - existing (bool): Whether files already in the directory are organized when watching
+      starts (default is True).
+    - workers (int): The number of threads used to organize a batch. By default files are
+      organized one at a time.
+    - mover (smartfile.transfer.Mover): Moves the files, as in `organize_by_type`.
+    - poll_interval (float): Seconds between two listings with the polling backend (default
+      is 1.0).
+    - keep_records (bool): Whether the result lists every file (default is False, since a
+      watcher may run for a long time).
+    - rules (smartfile.rules.RuleSet): Chooses the destination folders, as in
+      `organize_by_type`.
+
+    Returns:
+    - OrganizeResult: What was done with the files seen while watching, once stopped or once
+      the directory is removed.
+
+    Raises:
+    - ValueError: If the directory does not exist or an option is invalid.
+    - OSError: If the inotify backend is requested but cannot be used.
+
+    Example:
+    >>> stop = threading.Event()
+    >>> threading.Thread(target=watch, args=('/srv/inbox',), kwargs={'stop': stop}).start()
+    >>> stop.set()  # Later, to stop watching
+    """
+    if not os.path.isdir(directory):
+        raise ValueError(f"The directory {directory} does not exist.")
+    if backend not in (None, 'inotify', 'polling'):
+        raise ValueError(f"Unknown backend {backend!r}; expected 'inotify' or 'polling'.")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if max_batch < 1:
+        raise ValueError("max_batch must be at least 1.")
+
+    inotify = _load_inotify() if backend != 'polling' else None
+    if backend == 'inotify' and inotify is None:
+        raise OSError(errno.ENOSYS, "inotify is not available on this system")
+    if inotify is not None:
+        source = _InotifySource(directory, inotify)
+        pending = dict.fromkeys(_list_files(directory), time.monotonic()) if existing else {}
+    else:
+        source = _PollingSource(directory, poll_interval, existing)
+        pending = {}
+
+    folders = _FolderCache()
+    result = OrganizeResult(keep_records=keep_records)
+    move = mover.move if mover is not None else move_file
+    pool = ThreadPoolExecutor(max_workers=workers) if workers is not None else None
+
+    def organize(filepath):
+        return _organize_file(directory, filepath, folders, get_file_type, move, rules)
+
+    def process(batch):
+        # Files may have been removed or renamed again since they were reported
+        batch = [path for path in batch if os.path.isfile(path)]
+        if pool is None:
+            records = map(organize, batch)
+        else:
+            records = (future.result() for _, future in
+                       bounded_map(pool, organize, batch, max_pending=workers * 4))
+        for record in records:
+            if record is None:
+                continue
+            status, source_path, detail = record
+            result.add(status, source_path, detail)
+            if on_result is not None:
+                on_result(status, source_path, detail)
+
+    last_arrival = time.monotonic()
+    try:
+        while not (stop is not None and stop.is_set()) and not source.gone:
+            now = time.monotonic()
+            if pending:
+                oldest = next(iter(pending.values()))
+                due = min(last_arrival + debounce, oldest + max_delay)
+                if now >= due or len(pending) >= max_batch:
+                    batch = list(pending)[:max_batch]
+                    for path in batch:
+                        del pending[path]
+                    process(batch)
+                    continue
+                timeout = min(due - now, _STOP_CHECK_INTERVAL)
+            else:
+                timeout = _STOP_CHECK_INTERVAL
+
+            arrived = source.read(timeout)
+            if arrived:
+                last_arrival = time.monotonic()
+                for path in arrived:
+                    # Keep the time of the first arrival, so max_delay is honoured
+                    pending.setdefault(path, last_arrival)
+        if pending and not source.gone:
+            process(list(pending))
+    finally:
+        source.close()
+        if pool is not None:
+            pool.shutdown(wait=True)
+    return result
@@ -0,0 +1,182 @@
+import os
+import gc
+import asyncio
+import unittest
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from smartfile import aio
+from smartfile.aio import AsyncSmartFile
+from smartfile.cache import MetadataCache
+
+class TestAsyncSmartFile(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with a few text files and an image.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.text_files = []
+        for i in range(20):
+            path = os.path.join(self.test_dir.name, f'file{i}.txt')
+            with open(path, 'w') as f:
+                f.write(f"line one of {i}\nline two\n")
+            self.text_files.append(path)
+        self.image_path = os.path.join(self.test_dir.name, 'image.png')
+        Image.new('RGB', (300, 200), color='blue').save(self.image_path)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def smartfile(self, **options):
+        # Threads instead of processes keep most tests fast
+        options.setdefault('cpu_executor', ThreadPoolExecutor(max_workers=2))
+        return AsyncSmartFile(io_workers=4, **options)
+
+    def test_operations(self):
+        """Test that each coroutine returns what the blocking function returns."""
+        async def run():
+            async with self.smartfile() as sf:
+                mime = await sf.get_file_type(self.text_files[0])
+                image_metadata = await sf.get_metadata(self.image_path)
+                text_metadata = await sf.get_metadata(self.text_files[0])
+                text = await sf.preview_text_file(self.text_files[0], num_lines=1)
+                thumbnail = await sf.preview_image_file(self.image_path, size=(30, 30))
+                return mime, image_metadata, text_metadata, text, thumbnail.size
+
+        mime, image_metadata, text_metadata, text, size = asyncio.run(run())
+        self.assertEqual(mime, 'text/plain')
+        self.assertEqual(image_metadata, {'format': 'PNG', 'size': (300, 200), 'mode': 'RGB'})
+        self.assertIn('created', text_metadata)
+        self.assertEqual(text, 'line one of 0')
+        self.assertEqual(size, (30, 20))
+
+    def test_process_pool(self):
+        """Test that CPU-bound work runs on a real process pool."""
+        async def run():
+            async with AsyncSmartFile(io_workers=2, cpu_workers=1) as sf:
+                return await sf.get_metadata(self.image_path)
+
+        self.assertEqual(asyncio.run(run())['size'], (300, 200))
+
+    def test_as_completed(self):
+        """Test that batch results are yielded for every path, including failures."""
+        missing = os.path.join(self.test_dir.name, 'missing.txt')
+
+        async def run():
+            async with self.smartfile() as sf:
+                return [record async for record in
+                        sf.as_completed(sf.get_file_type, self.text_files + [missing], limit=5)]
+
+        records = dict(asyncio.run(run()))
+        self.assertEqual(len(records), 21)
+        self.assertTrue(all(records[path] == 'text/plain' for path in self.text_files))
+        self.assertIsInstance(records[missing], FileNotFoundError)
+
+    def test_as_completed_raises(self):
+        """Test that `return_exceptions=False` raises the first error."""
+        missing = os.path.join(self.test_dir.name, 'missing.txt')
+
+        async def run():
+            async with self.smartfile() as sf:
+                async for _ in sf.as_completed(sf.get_file_type, [missing],
+                                               return_exceptions=False):
+                    pass
+
+        with self.assertRaises(FileNotFoundError):
+            asyncio.run(run())
+
+    def test_concurrency_is_bounded(self):
+        """Test that no more than `io_limit` calls are submitted at once."""
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def tracked(path):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            threading.Event().wait(0.01)
+            with lock:
+                state['running'] -= 1
+            return path
+
+        async def run():
+            sf = AsyncSmartFile(io_workers=8, io_limit=3)
+            try:
+                await asyncio.gather(*(sf._run('io', tracked, i) for i in range(30)))
+            finally:
+                sf.close()
+
+        asyncio.run(run())
+        self.assertLessEqual(state['peak'], 3)
+
+    def test_cancellation(self):
+        """Test that a cancelled call that has not started never runs and frees its slot."""
+        release = threading.Event()
+        calls = []
+
+        def blocking(name):
+            calls.append(name)
+            release.wait(5)
+            return name
+
+        async def run():
+            sf = AsyncSmartFile(io_workers=1, io_limit=1)
+            try:
+                first = asyncio.ensure_future(sf._run('io', blocking, 'first'))
+                waiting = asyncio.ensure_future(sf._run('io', blocking, 'second'))
+                await asyncio.sleep(0.05)
+                waiting.cancel()
+                release.set()
+                self.assertEqual(await first, 'first')
+                with self.assertRaises(asyncio.CancelledError):
+                    await waiting
+                return await sf._run('io', blocking, 'third')
+            finally:
+                sf.close()
+
+        self.assertEqual(asyncio.run(run()), 'third')
+        self.assertEqual(calls, ['first', 'third'])
+
+    def test_metadata_cache(self):
+        """Test that cached metadata is returned without parsing the file again."""
+        cache = MetadataCache(os.path.join(self.test_dir.name, 'cache.sqlite3'))
+
+        async def run():
+            async with self.smartfile(cache=cache) as sf:
+                await sf.get_metadata(self.image_path)
+                return await sf.get_metadata(self.image_path)
+
+        try:
+            self.assertEqual(asyncio.run(run())['format'], 'PNG')
+            self.assertEqual(cache.stats()['hits'], 1)
+        finally:
+            cache.close()
+
+    def test_semaphores_follow_loops(self):
+        """Test that finished event loops are dropped, even after waiting for slots."""
+        sf = self.smartfile(io_limit=1)
+
+        async def run():
+            await asyncio.gather(*(sf.get_file_type(path) for path in self.text_files))
+
+        try:
+            for _ in range(3):
+                asyncio.run(run())
+                asyncio.run(sf.get_file_type(self.text_files[0]))
+            gc.collect()
+            self.assertEqual(sf._loops, {})
+        finally:
+            sf.close()
+
+    def test_module_functions(self):
+        """Test the coroutines using the shared default instance."""
+        async def run():
+            return [record async for record in aio.as_completed(aio.get_file_type,
+                                                                self.text_files[:3])]
+
+        self.assertEqual(len(asyncio.run(run())), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import io
+import os
+import tarfile
+import zipfile
+import unittest
+import tempfile
+from PIL import Image
+from fpdf import FPDF
+from smartfile.archives import (split_archive_path, stat_member, open_member, list_members)
+from smartfile.file_types import get_file_type, get_file_types, HEADER_SIZE
+from smartfile.instrumentation import HistogramSink, instrumented
+from smartfile.metadata import get_metadata
+from smartfile.preview import preview_text, preview_text_file, preview_image_file
+
+class TestArchives(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a zip, a tar and a tar.gz archive holding the same image, text file and PDF.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        image = io.BytesIO()
+        Image.new('RGB', (64, 48), color='orange').save(image, format='PNG')
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.add_page()
+        self.files = {
+            'photos/photo.png': image.getvalue(),
+            'notes.txt': "".join(f"line {i}\n" for i in range(10000)).encode(),
+            'docs/report.pdf': pdf.output(dest='S').encode('latin-1'),
+            'blob': b'%PDF-1.4 not really',
+        }
+
+        self.zip_path = os.path.join(self.test_dir.name, 'bundle.zip')
+        with zipfile.ZipFile(self.zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in self.files.items():
+                archive.writestr(name, data)
+
+        self.tar_paths = []
+        for name, mode in (('bundle.tar', 'w'), ('bundle.tar.gz', 'w:gz')):
+            path = os.path.join(self.test_dir.name, name)
+            with tarfile.open(path, mode) as archive:
+                for member, data in self.files.items():
+                    info = tarfile.TarInfo('./' + member)
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            self.tar_paths.append(path)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def archives(self):
+        return [self.zip_path] + self.tar_paths
+
+    def test_split_archive_path(self):
+        """Test that only separators after an existing file split a path."""
+        self.assertEqual(split_archive_path(self.zip_path + '!/photos/photo.png'),
+                         (self.zip_path, 'photos/photo.png'))
+        self.assertIsNone(split_archive_path(os.path.join(self.test_dir.name, 'odd!/name.txt')))
+        self.assertIsNone(split_archive_path(self.zip_path))
+
+    def test_file_types(self):
+        """Test that members are identified by extension or by their first bytes."""
+        for archive in self.archives():
+            self.assertEqual(get_file_type(archive + '!/photos/photo.png'), 'image/png')
+            self.assertEqual(get_file_type(archive + '!/blob'), 'application/pdf')
+            types = get_file_types([archive + '!/notes.txt', archive + '!/missing.txt'])
+            self.assertEqual(list(types.values()), ['text/plain', None])
+
+    def test_only_the_header_is_read(self):
+        """Test that sniffing a member reads at most HEADER_SIZE bytes."""
+        with instrumented(HistogramSink()) as histogram:
+            get_file_type(self.zip_path + '!/blob')
+        self.assertLessEqual(histogram.summary()['file_types.sniff']['bytes'], HEADER_SIZE)
+
+    def test_missing_members_and_directories(self):
+        """Test that missing members and directories raise like regular paths."""
+        with self.assertRaises(FileNotFoundError):
+            get_file_type(self.zip_path + '!/missing.png')
+        with self.assertRaises(ValueError):
+            get_file_type(self.zip_path + '!/photos')
+        with self.assertRaises(IsADirectoryError):
+            open_member(self.tar_paths[0] + '!/docs')
+        self.assertTrue(stat_member(self.tar_paths[1] + '!/docs/').is_dir)
+
+    def test_metadata(self):
+        """Test image, PDF and generic metadata of members."""
+        for archive in self.archives():
+            self.assertEqual(get_metadata(archive + '!/photos/photo.png'),
+                             {"format": 'PNG', "size": (64, 48), "mode": 'RGB'})
+            self.assertEqual(get_metadata(archive + '!/docs/report.pdf')["num_pages"], 2)
+            self.assertEqual(get_metadata(archive + '!/notes.txt')["size"],
+                             len(self.files['notes.txt']))
+
+    def test_previews(self):
+        """Test text and image previews of members."""
+        for archive in self.archives():
+            self.assertEqual(preview_text_file(archive + '!/notes.txt', num_lines=2),
+                             "line 0\nline 1")
+            tail = preview_text(archive + '!/notes.txt', num_lines=1, tail=True, max_bytes=100)
+            self.assertEqual(tail.lines, ["line 9999"])
+            self.assertEqual(preview_image_file(archive + '!/photos/photo.png', (16, 16)).size,
+                             (16, 12))
+
+    def test_random_access_reads(self):
+        """Test that member streams can seek, as image decoders need."""
+        for archive in self.archives():
+            with open_member(archive + '!/notes.txt') as f:
+                f.seek(7)
+                self.assertEqual(f.read(6), b'line 1')
+                f.seek(0)
+                self.assertEqual(f.read(4), b'line')
+
+    def test_list_members(self):
+        """Test that members are listed as sorted virtual paths."""
+        self.assertEqual(list_members(self.tar_paths[0]),
+                         [self.tar_paths[0] + '!/' + name for name in sorted(self.files)])
+
+    def test_changed_archive_is_reloaded(self):
+        """Test that a rewritten archive is not served from the member cache."""
+        get_file_type(self.zip_path + '!/notes.txt')
+        with zipfile.ZipFile(self.zip_path, 'a') as archive:
+            archive.writestr('added.txt', "new")
+        self.assertEqual(get_file_type(self.zip_path + '!/added.txt'), 'text/plain')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import json
+import unittest
+import tempfile
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import BENCHMARKS, main, run_benchmarks
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_corpus_is_reproducible(self):
+        """Test that the same seed produces identical files."""
+        spec = {'jpeg': {'count': 1, 'size': (64, 48)}, 'png': {'count': 1, 'size': (32, 32)},
+                'pdf': {'count': 1, 'pages': 2}, 'text': {'count': 1, 'lines': 10},
+                'single_line': {'count': 1, 'bytes': 1000}}
+        first = generate_corpus(os.path.join(self.test_dir.name, 'a'), spec, seed=7)
+        second = generate_corpus(os.path.join(self.test_dir.name, 'b'), spec, seed=7)
+        self.assertEqual({kind: len(paths) for kind, paths in first.items()},
+                         {'jpeg': 1, 'png': 1, 'pdf': 1, 'text': 1, 'single_line': 1})
+        self.assertEqual(os.path.getsize(first['single_line'][0]), 1000)
+        for kind in ('jpeg', 'png', 'text', 'single_line'):
+            with open(first[kind][0], 'rb') as a, open(second[kind][0], 'rb') as b:
+                self.assertEqual(a.read(), b.read(), kind)
+
+    def test_smoke(self):
+        """Test that every benchmark runs on a tiny corpus and reports its measurements."""
+        report = run_benchmarks(scale='tiny', isolate=False)
+        self.assertEqual([result['name'] for result in report['results']], list(BENCHMARKS))
+        for result in report['results']:
+            self.assertGreater(result['files'], 0)
+            self.assertGreater(result['files_per_second'], 0)
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['max'])
+        json.dumps(report)  # The report must be serializable
+
+    def test_isolated_run_writes_json(self):
+        """Test the command line, with the benchmark running in its own process."""
+        output = os.path.join(self.test_dir.name, 'report.json')
+        self.assertEqual(main(['--scale', 'tiny', '--only', 'get_file_type',
+                               '--output', output]), 0)
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report['results'][0]['name'], 'get_file_type')
+        self.assertIn('peak_rss_kb', report['results'][0])
+
+if __name__ == '__main__':
+    unittest.main()
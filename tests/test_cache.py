@@ -0,0 +1,139 @@
+import os
+import time
+import unittest
+import tempfile
+from unittest import mock
+from PIL import Image
+from smartfile.cache import MetadataCache
+from smartfile.metadata import get_metadata
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory holding the cache database and test files.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.cache = MetadataCache(os.path.join(self.test_dir.name, 'cache.sqlite3'))
+
+    def tearDown(self):
+        """
+        Close the cache and clean up the temporary directory.
+        """
+        self.cache.close()
+        self.test_dir.cleanup()
+
+    def create_image(self, filename, size):
+        image_path = os.path.join(self.test_dir.name, filename)
+        Image.new('RGB', size, color='red').save(image_path)
+        return image_path
+
+    def test_unchanged_file_is_served_from_cache(self):
+        """Test that a second lookup for an unchanged file is a hit."""
+        image_path = self.create_image('image.png', (40, 30))
+
+        first = get_metadata(image_path, cache=self.cache)
+        second = get_metadata(image_path, cache=self.cache)
+
+        self.assertEqual(first, second)
+        self.assertEqual(second["size"], (40, 30))
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
+
+    def test_hits_skip_type_detection(self):
+        """Test that a hit costs one stat: the type is stored with the entry."""
+        image_path = self.create_image('image.png', (40, 30))
+        get_metadata(image_path, cache=self.cache)
+        with mock.patch('smartfile.metadata.get_file_type') as get_file_type, \
+                mock.patch('smartfile.metadata.os.stat', wraps=os.stat) as stat:
+            metadata = get_metadata(image_path, cache=self.cache)
+            self.assertEqual(dict(metadata), {"format": 'PNG', "size": (40, 30), "mode": 'RGB'})
+        get_file_type.assert_not_called()
+        self.assertEqual(stat.call_count, 1)
+
+    def test_modified_file_is_invalidated(self):
+        """Test that changing a file's size or mtime invalidates its entry."""
+        image_path = self.create_image('image.png', (40, 30))
+        get_metadata(image_path, cache=self.cache)
+
+        # Rewrite the file with different dimensions and a different mtime
+        self.create_image('image.png', (80, 60))
+        future = time.time() + 10
+        os.utime(image_path, (future, future))
+
+        metadata = get_metadata(image_path, cache=self.cache)
+        self.assertEqual(metadata["size"], (80, 60))
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_cache_persists_across_instances(self):
+        """Test that entries survive closing and reopening the database."""
+        image_path = self.create_image('image.png', (10, 10))
+        get_metadata(image_path, cache=self.cache)
+        self.cache.close()
+
+        self.cache = MetadataCache(os.path.join(self.test_dir.name, 'cache.sqlite3'))
+        self.assertEqual(self.cache.get(os.stat(image_path))["size"], (10, 10))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the cache stays within max_entries by evicting the oldest entries."""
+        self.cache.close()
+        self.cache = MetadataCache(os.path.join(self.test_dir.name, 'lru.sqlite3'), max_entries=3)
+
+        paths = [self.create_image(f'image{i}.png', (i + 1, i + 1)) for i in range(4)]
+        for path in paths[:3]:
+            get_metadata(path, cache=self.cache)
+        # Touch the first entry so the second one becomes the least recently used
+        get_metadata(paths[0], cache=self.cache)
+        get_metadata(paths[3], cache=self.cache)
+
+        self.assertLessEqual(len(self.cache), 3)
+        self.assertIsNotNone(self.cache.get(os.stat(paths[0])))
+        self.assertIsNone(self.cache.get(os.stat(paths[1])))
+
+    def test_missing_fields_are_added_to_the_entry(self):
+        """Test that fields requested later are extracted once and merged into the entry."""
+        image_path = self.create_image('image.png', (40, 30))
+        get_metadata(image_path, cache=self.cache, fields={'size'})
+        self.assertEqual(self.cache.get(os.stat(image_path)),
+                         {"size": (40, 30), "_mime_type": 'image/png'})
+
+        metadata = get_metadata(image_path, cache=self.cache)
+        self.assertEqual(metadata, {"format": 'PNG', "size": (40, 30), "mode": 'RGB'})
+        self.assertEqual(len(self.cache.get(os.stat(image_path))), 4)
+
+    def test_values_round_trip(self):
+        """Test that non-finite floats, bytes, tuples and non-string keys read back as stored."""
+        st = os.stat(self.create_image('image.png', (4, 4)))
+        stored = {"ratio": float('nan'), "limit": float('inf'), "size": (4, 4),
+                  "exif": {"MakerNote": b'\x00\x01', 59932: [1, (2, 3)]}, "__tuple__": None}
+        self.cache.put(st, stored)
+        value = self.cache.get(st)
+        self.assertNotEqual(value["ratio"], value["ratio"])  # NaN
+        del stored["ratio"], value["ratio"]
+        self.assertEqual(value, stored)
+
+    def test_damaged_entry_is_a_miss(self):
+        """Test that an entry that cannot be decoded is dropped instead of raising."""
+        image_path = self.create_image('image.png', (40, 30))
+        st = os.stat(image_path)
+        self.cache.put(st, {"size": (40, 30)})
+        self.cache._conn.execute("UPDATE metadata SET value = 'not a value ('")
+        self.assertIsNone(self.cache.get(st))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(get_metadata(image_path, cache=self.cache)["size"], (40, 30))
+        self.assertEqual(self.cache.get(st), {"format": 'PNG', "size": (40, 30), "mode": 'RGB',
+                                              "_mime_type": 'image/png'})
+
+    def test_other_files_bypass_the_cache(self):
+        """Test that cheap stat-based metadata is not stored."""
+        text_path = os.path.join(self.test_dir.name, 'notes.txt')
+        with open(text_path, 'w') as f:
+            f.write("plain text")
+
+        metadata = get_metadata(text_path, cache=self.cache)
+        self.assertEqual(metadata["size"], os.path.getsize(text_path))
+        self.assertEqual(len(self.cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
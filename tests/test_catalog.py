@@ -0,0 +1,146 @@
+import os
+import time
+import shutil
+import unittest
+import tempfile
+from fpdf import FPDF
+from PIL import Image
+from smartfile.catalog import Catalog
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory tree and a catalog database outside of it.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.db_dir = tempfile.TemporaryDirectory()
+        self.root = self.test_dir.name
+        os.makedirs(os.path.join(self.root, 'docs', 'old'))
+        os.makedirs(os.path.join(self.root, 'pictures'))
+        self.create_pdf(os.path.join('docs', 'long.pdf'), 120)
+        self.create_pdf(os.path.join('docs', 'old', 'short.pdf'), 2)
+        Image.new('RGB', (64, 48)).save(os.path.join(self.root, 'pictures', 'photo.png'))
+        self.create_test_file('notes.txt', b'hello')
+        self.catalog = Catalog(self.root, path=os.path.join(self.db_dir.name, 'catalog.db'))
+
+    def tearDown(self):
+        self.catalog.close()
+        self.test_dir.cleanup()
+        self.db_dir.cleanup()
+
+    def create_test_file(self, relative_path, content):
+        file_path = os.path.join(self.root, relative_path)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+    def create_pdf(self, relative_path, num_pages):
+        pdf = FPDF()
+        for _ in range(num_pages):
+            pdf.add_page()
+        pdf.output(os.path.join(self.root, relative_path))
+
+    def age_directories(self):
+        """
+        Helper function to date every directory in the past, as if the tree had been left
+        untouched since well before the next refresh.
+        """
+        past = time.time() - 3600
+        for dirpath, _, _ in os.walk(self.root):
+            os.utime(dirpath, (past, past))
+
+    def test_initial_refresh(self):
+        """Test that the first refresh catalogs every file with its type and metadata."""
+        stats = self.catalog.refresh()
+        self.assertEqual(stats['files_added'], 4)
+        self.assertEqual(stats['directories_scanned'], 4)
+        self.assertEqual(len(self.catalog), 4)
+
+        pdfs = self.catalog.query(mime='application/pdf')
+        self.assertEqual([os.path.basename(row['path']) for row in pdfs], ['long.pdf', 'short.pdf'])
+        self.assertEqual(pdfs[0]['metadata']['num_pages'], 120)
+
+    def test_queries(self):
+        """Test queries combining type, page count, dimensions, time and location."""
+        self.catalog.refresh()
+        long_pdfs = self.catalog.query(mime='application/pdf', min_pages=101,
+                                       modified_after=time.time() - 7 * 24 * 3600)
+        self.assertEqual([os.path.basename(row['path']) for row in long_pdfs], ['long.pdf'])
+
+        images = self.catalog.query(mime_major='image', min_width=64)
+        self.assertEqual(len(images), 1)
+        self.assertEqual(images[0]['metadata']['size'], (64, 48))
+        self.assertEqual(self.catalog.query(mime_major='image', min_width=65), [])
+
+        self.assertEqual(len(self.catalog.query(under=os.path.join(self.root, 'docs'))), 2)
+        self.assertEqual(len(self.catalog.query(max_size=5)), 1)
+        self.assertEqual(len(self.catalog.query(limit=3)), 3)
+
+    def test_unchanged_directories_are_skipped(self):
+        """Test that a refresh of an unchanged tree does not list any directory."""
+        self.age_directories()
+        self.catalog.refresh()
+        stats = self.catalog.refresh()
+        self.assertEqual(stats['directories_scanned'], 0)
+        self.assertEqual(stats['directories_skipped'], 4)
+        self.assertEqual(len(self.catalog), 4)
+
+    def test_changed_directory_is_rescanned(self):
+        """Test that only a directory with new or removed entries is listed again."""
+        self.age_directories()
+        self.catalog.refresh()
+
+        self.create_test_file(os.path.join('pictures', 'new.txt'), b'new file')
+        os.remove(os.path.join(self.root, 'notes.txt'))
+        stats = self.catalog.refresh()
+        self.assertEqual(stats['directories_scanned'], 2)  # The root and 'pictures'
+        self.assertEqual(stats['files_added'], 1)
+        self.assertEqual(stats['files_removed'], 1)
+        self.assertEqual(stats['files_updated'], 0)
+        self.assertEqual(len(self.catalog.query(mime='text/plain')), 1)
+
+    def test_removed_subtree(self):
+        """Test that files below a removed directory are forgotten."""
+        self.catalog.refresh()
+        shutil.rmtree(os.path.join(self.root, 'docs'))
+        stats = self.catalog.refresh()
+        self.assertEqual(stats['files_removed'], 2)
+        self.assertEqual(self.catalog.query(mime='application/pdf'), [])
+
+    def test_full_refresh_detects_in_place_edits(self):
+        """Test that `full=True` catches files rewritten without changing their directory."""
+        self.age_directories()
+        self.catalog.refresh()
+        st = os.stat(self.root)
+        notes = self.create_test_file('notes.txt', b'hello, rewritten')
+        os.utime(self.root, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.assertEqual(self.catalog.refresh()['files_updated'], 0)
+        stats = self.catalog.refresh(full=True)
+        self.assertEqual(stats['files_updated'], 1)
+        rewritten = self.catalog.query(mime='text/plain')
+        self.assertEqual([(row['path'], row['size']) for row in rewritten], [(notes, 16)])
+
+    def test_workers(self):
+        """Test that a threaded refresh catalogs the same files."""
+        stats = self.catalog.refresh(workers=4)
+        self.assertEqual(stats['files_added'], 4)
+        self.assertEqual(len(self.catalog.query(min_pages=1)), 2)
+
+    def test_persistence(self):
+        """Test that the catalog survives being closed and reopened."""
+        self.age_directories()
+        self.catalog.refresh()
+        self.catalog.close()
+        self.catalog = Catalog(self.root, path=os.path.join(self.db_dir.name, 'catalog.db'))
+        self.assertEqual(len(self.catalog), 4)
+        self.assertEqual(self.catalog.refresh()['directories_scanned'], 0)
+
+    def test_nonexistent_directory(self):
+        """Test that cataloging a missing directory raises ValueError."""
+        with self.assertRaises(ValueError):
+            Catalog(os.path.join(self.root, 'missing'))
+
+if __name__ == '__main__':
+    unittest.main()
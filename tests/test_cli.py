@@ -0,0 +1,131 @@
+import io
+import os
+import json
+import unittest
+import tempfile
+from contextlib import redirect_stdout
+from unittest import mock
+from smartfile.cli import main
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with text files, one of them in a subdirectory.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.test_dir.name, 'nested'))
+        self.files = [
+            self.create_test_file('a.txt', "first line\nsecond line\n"),
+            self.create_test_file('b.txt', "only line\n"),
+            self.create_test_file(os.path.join('nested', 'c.txt'), "nested line\n"),
+        ]
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def create_test_file(self, relative_path, content):
+        file_path = os.path.join(self.test_dir.name, relative_path)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        return file_path
+
+    def run_cli(self, argv, stdin=None):
+        """
+        Helper function to run the CLI and return its exit status and parsed output lines.
+        """
+        output = io.StringIO()
+        with redirect_stdout(output):
+            if stdin is None:
+                status = main(argv)
+            else:
+                with mock.patch('sys.stdin', io.TextIOWrapper(io.BytesIO(stdin))):
+                    status = main(argv)
+        return status, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_type(self):
+        """Test that MIME types are printed for a directory, recursively with --jobs."""
+        status, records = self.run_cli(['type', '--recursive', '--jobs', '4', self.test_dir.name])
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(record['path'] for record in records), sorted(self.files))
+        self.assertTrue(all(record['mime_type'] == 'text/plain' for record in records))
+
+    def test_non_recursive(self):
+        """Test that subdirectories are not entered without --recursive."""
+        _, records = self.run_cli(['type', self.test_dir.name])
+        self.assertEqual(len(records), 2)
+
+    def test_paths_from_stdin(self):
+        """Test that '-' reads newline- and NUL-delimited paths from standard input."""
+        _, records = self.run_cli(['type', '-'], stdin="\n".join(self.files[:2]).encode())
+        self.assertEqual([record['path'] for record in records], self.files[:2])
+
+        _, records = self.run_cli(['type', '-0', '-'], stdin=b"\0".join(
+            os.fsencode(path) for path in self.files) + b"\0")
+        self.assertEqual([record['path'] for record in records], self.files)
+
+    def test_errors_are_reported(self):
+        """Test that a missing file produces an error record and a non-zero status."""
+        missing = os.path.join(self.test_dir.name, 'missing.txt')
+        status, records = self.run_cli(['metadata', self.files[0], missing])
+        self.assertEqual(status, 1)
+        self.assertIn('created', records[0]['metadata'])
+        self.assertEqual(records[1]['path'], missing)
+        self.assertIn('error', records[1])
+
+    def test_metadata_with_processes(self):
+        """Test that metadata is extracted on worker processes with --jobs."""
+        status, records = self.run_cli(['metadata', '-j', '2', *self.files])
+        self.assertEqual(status, 0)
+        self.assertEqual(len(records), 3)
+
+    def test_metadata_fields(self):
+        """Test that --fields restricts the extracted fields."""
+        _, records = self.run_cli(['metadata', '--fields', 'size', self.files[1]])
+        self.assertEqual(records, [{"path": self.files[1], "metadata": {"size": 10}}])
+
+    def test_preview(self):
+        """Test that text previews honour --lines."""
+        _, records = self.run_cli(['preview', '-n', '1', self.files[0]])
+        self.assertEqual(records, [{"path": self.files[0], "preview": "first line"}])
+
+    def test_organize(self):
+        """Test that organize streams one record per moved file."""
+        status, records = self.run_cli(['organize', self.test_dir.name])
+        self.assertEqual(status, 0)
+        self.assertEqual(len(records), 2)
+        self.assertTrue(all(record['status'] == 'moved' for record in records))
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir.name, 'text', 'a.txt')))
+
+    def test_organize_with_rules(self):
+        """Test that organize --rules files by the rule set."""
+        rules_path = os.path.join(self.test_dir.name, 'nested', 'rules.json')
+        with open(rules_path, 'w') as f:
+            json.dump({"rules": [{"destination": "firsts", "glob": "a.*"}], "default": None}, f)
+        status, records = self.run_cli(['organize', '--rules', rules_path, self.test_dir.name])
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(record['status'] for record in records), ['moved', 'skipped'])
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir.name, 'firsts', 'a.txt')))
+
+    def test_rename(self):
+        """Test that rename prints the new paths."""
+        _, records = self.run_cli(['rename', '--prefix', 'doc_', self.test_dir.name])
+        self.assertEqual(len(records), 2)
+        self.assertTrue(all(os.path.basename(record['path']).startswith('doc_')
+                            for record in records))
+
+    def test_invalid_directory(self):
+        """Test that an invalid directory exits with status 2."""
+        with redirect_stdout(io.StringIO()), mock.patch('sys.stderr', io.StringIO()):
+            self.assertEqual(main(['organize', os.path.join(self.test_dir.name, 'missing')]), 2)
+            self.assertEqual(main(['organize', '--rules', os.path.join(self.test_dir.name, 'none'),
+                                   self.test_dir.name]), 2)
+
+    def test_runtime_failure(self):
+        """Test that an error raised while a command runs exits with status 1."""
+        with redirect_stdout(io.StringIO()), mock.patch('sys.stderr', io.StringIO()), \
+                mock.patch('smartfile.cli.bulk_rename', side_effect=ValueError("conflict")):
+            self.assertEqual(main(['rename', self.test_dir.name]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
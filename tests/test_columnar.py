@@ -0,0 +1,120 @@
+import os
+import unittest
+import tempfile
+from unittest import mock
+from PIL import Image
+from smartfile import columnar
+from smartfile.columnar import ScanRecord, ScanTable, scan_table
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with two images, a text file and a subdirectory.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        root = self.test_dir.name
+        os.makedirs(os.path.join(root, 'sub'))
+        Image.new('RGB', (30, 20)).save(os.path.join(root, 'wide.png'))
+        Image.new('L', (10, 10)).save(os.path.join(root, 'sub', 'gray.jpg'))
+        with open(os.path.join(root, 'notes.txt'), 'w') as f:
+            f.write("hello")
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def records(self, table):
+        return {os.path.relpath(record.path, self.test_dir.name): record for record in table}
+
+    def test_scan_with_metadata(self):
+        """Test that a scan records types, sizes and image fields per file."""
+        records = self.records(scan_table(self.test_dir.name, metadata=True))
+        self.assertEqual(set(records), {'wide.png', 'notes.txt', os.path.join('sub', 'gray.jpg')})
+        wide = records['wide.png']
+        self.assertEqual((wide.mime_type, wide.width, wide.height, wide.mode),
+                         ('image/png', 30, 20, 'RGB'))
+        self.assertEqual(wide.size, os.path.getsize(os.path.join(self.test_dir.name, 'wide.png')))
+        notes = records['notes.txt']
+        self.assertEqual((notes.mime_type, notes.size, notes.width, notes.mode),
+                         ('text/plain', 5, None, None))
+
+    def test_scan_without_metadata(self):
+        """Test that image fields are left empty unless metadata is requested."""
+        records = self.records(scan_table(self.test_dir.name, recursive=False))
+        self.assertEqual(set(records), {'wide.png', 'notes.txt'})
+        self.assertIsNone(records['wide.png'].mode)
+
+    def test_summarize(self):
+        """Test the group-by summaries, with and without NumPy."""
+        table = scan_table(self.test_dir.name, metadata=True)
+        image_bytes = sum(record.size for record in table if record.mime_type.startswith('image/'))
+        expected = {'image': {'count': 2, 'bytes': image_bytes},
+                    'text': {'count': 1, 'bytes': 5}}
+        self.assertEqual(table.summarize('mime_major'), expected)
+        with mock.patch.object(columnar, '_numpy', return_value=None):
+            self.assertEqual(table.summarize('mime_major'), expected)
+            self.assertEqual(table.summarize('mode')['RGB']['count'], 1)
+        self.assertEqual(table.summarize('mode')[None], {'count': 1, 'bytes': 5})
+        self.assertEqual(table.summarize('directory')[self.test_dir.name]['count'], 2)
+        with self.assertRaises(ValueError):
+            table.summarize('owner')
+
+    def test_save_and_load(self):
+        """Test that a saved table loads back, memory-mapped and read-only."""
+        table = scan_table(self.test_dir.name, metadata=True)
+        path = os.path.join(self.test_dir.name, 'scan.bin')
+        table.save(path)
+        with ScanTable.load(path) as loaded:
+            self.assertEqual(list(loaded), list(table))
+            self.assertEqual(loaded.summarize('mime'), table.summarize('mime'))
+            self.assertEqual(loaded[-1], table[-1])
+            with self.assertRaises(ValueError):
+                loaded.append('x', 1, 0.0)
+
+        with open(path, 'wb') as f:
+            f.write(b'not a table')
+        with self.assertRaises(ValueError):
+            ScanTable.load(path)
+
+    def test_compact_rows(self):
+        """Test that a row costs tens of bytes, not a dictionary."""
+        table = ScanTable()
+        for index in range(10000):
+            table.append(f'/srv/photos/2024/IMG_{index:05d}.jpg', 2000000, 1700000000.0,
+                         'image/jpeg', 4000, 3000, 'RGB')
+        self.assertLess(table.nbytes / len(table), 80)
+        self.assertEqual(table[5], ScanRecord('/srv/photos/2024/IMG_00005.jpg', 2000000,
+                                              1700000000.0, 'image/jpeg', 4000, 3000, 'RGB',
+                                              None))
+        self.assertEqual(len(table.mime_types), 2)
+
+    def test_append_rejects_overflow(self):
+        """Test that values that do not fit leave the table unchanged."""
+        table = ScanTable()
+        for index in range(65535):
+            table.append(f'/srv/{index}.raw', 1, 0.0, mode=f'mode{index}')
+        with self.assertRaises(ValueError):
+            table.append('/srv/last.raw', 1, 0.0, mode='one too many')
+        with self.assertRaises(ValueError):
+            table.append('/srv/huge.raw', 1, 0.0, 'image/png', width=2 ** 40)
+        with self.assertRaises(ValueError):
+            table.append('/srv/huge.raw', 1, 0.0, 'image/png', mode='mode0', num_pages=2 ** 40)
+        self.assertEqual(len(table), 65535)
+        self.assertEqual(table.mime_types, [None])
+        self.assertEqual(len(table.modes), 65536)
+        self.assertNotIn('one too many', table.modes)
+        self.assertEqual(table._interned['mime'], {None: 0})
+        self.assertEqual({len(values) for values in map(table.column, ('directory', 'size',
+                                                                        'mode', 'width'))},
+                         {65535})
+        self.assertEqual(table[-1].mode, 'mode65534')
+
+        table = ScanTable()
+        with self.assertRaises(ValueError):
+            table.append('/srv/huge.png', 1, 0.0, 'image/png', width=2 ** 40, mode='RGB')
+        self.assertEqual((len(table), table.mime_types, table.modes), (0, [None], [None]))
+        table.append('/srv/small.png', 1, 0.0, 'image/png', width=20, mode='RGB')
+        self.assertEqual((table.mime_types, table[0].mode), ([None, 'image/png'], 'RGB'))
+
+if __name__ == '__main__':
+    unittest.main()
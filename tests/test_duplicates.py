@@ -0,0 +1,73 @@
+import os
+import unittest
+import tempfile
+from smartfile.duplicates import find_duplicates
+
+class TestFindDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory tree with duplicated and unique files.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.test_dir.name, 'nested'))
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def create_test_file(self, relative_path, content):
+        file_path = os.path.join(self.test_dir.name, relative_path)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+    def test_small_duplicates(self):
+        """Test that small identical files are grouped together."""
+        first = self.create_test_file('a.txt', b'same content')
+        second = self.create_test_file(os.path.join('nested', 'b.txt'), b'same content')
+        self.create_test_file('c.txt', b'different!!!')  # Same size, different content
+        self.create_test_file('d.txt', b'unique')
+
+        groups = list(find_duplicates(self.test_dir.name))
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0].paths, sorted([first, second]))
+        self.assertEqual(groups[0].size, len(b'same content'))
+        self.assertEqual(groups[0].mime_type, 'text/plain')
+
+    def test_large_files_differing_only_in_the_middle(self):
+        """Test that files whose partial hashes collide are told apart by the full hash."""
+        head, tail = os.urandom(4096), os.urandom(4096)
+        original = self.create_test_file('original.bin', head + b'A' * 10000 + tail)
+        copy = self.create_test_file(os.path.join('nested', 'copy.bin'), head + b'A' * 10000 + tail)
+        self.create_test_file('modified.bin', head + b'A' * 5000 + b'B' + b'A' * 4999 + tail)
+
+        groups = list(find_duplicates(self.test_dir.name, workers=4, partial_size=1024))
+        self.assertEqual([group.paths for group in groups], [sorted([original, copy])])
+
+    def test_groups_are_ordered_by_size(self):
+        """Test that larger duplicates are reported first."""
+        for name in ('big1', 'big2'):
+            self.create_test_file(name, b'x' * 5000)
+        for name in ('small1', 'small2'):
+            self.create_test_file(name, b'y' * 10)
+
+        sizes = [group.size for group in find_duplicates(self.test_dir.name, max_pending=1)]
+        self.assertEqual(sizes, [5000, 10])
+
+    def test_hard_links_and_empty_files_are_ignored(self):
+        """Test that hard links to one file and empty files are not reported."""
+        original = self.create_test_file('original.txt', b'linked')
+        os.link(original, os.path.join(self.test_dir.name, 'link.txt'))
+        self.create_test_file('empty1', b'')
+        self.create_test_file('empty2', b'')
+
+        self.assertEqual(list(find_duplicates([self.test_dir.name, original])), [])
+
+    def test_non_recursive(self):
+        """Test that subdirectories are skipped when recursive is False."""
+        self.create_test_file('a.txt', b'same content')
+        self.create_test_file(os.path.join('nested', 'b.txt'), b'same content')
+        self.assertEqual(list(find_duplicates(self.test_dir.name, recursive=False)), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
 import os
-from smartfile.file_management import organize_by_type
+import threading
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from smartfile.file_management import organize_by_type, OrganizeResult
 from smartfile.file_types import get_file_type
 
 class TestFileManagement(unittest.TestCase):
@@ -47,6 +50,135 @@ class TestFileManagement(unittest.TestCase):
                 f"{file_name} should be in the {subfolder_path} folder."
             )
     
+    def test_organize_by_type_with_workers(self):
+        """
+        Test that a threaded run moves the same files and reports them in the result.
+        """
+        result = organize_by_type(self.test_dir, workers=4)
+
+        self.assertIsInstance(result, OrganizeResult)
+        self.assertEqual(len(result.moved), len(self.files))
+        self.assertEqual(result.failed, [])
+        for source, destination in result.moved:
+            self.assertFalse(os.path.exists(source))
+            self.assertTrue(os.path.exists(destination))
+
+    def test_organize_by_type_with_executor(self):
+        """
+        Test that type detection can be delegated to a separate executor.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            result = organize_by_type(self.test_dir, workers=2, executor=executor)
+        self.assertEqual(len(result.moved), len(self.files))
+
+    def test_executor_without_workers_detects_in_batches(self):
+        """
+        Test that an executor without workers still detects several files at once.
+        """
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def tracked(path):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            threading.Event().wait(0.05)
+            with lock:
+                state['running'] -= 1
+            return get_file_type(path)
+
+        with mock.patch('smartfile.file_management.get_file_type', tracked), \
+                ThreadPoolExecutor(max_workers=4) as executor:
+            result = organize_by_type(self.test_dir, executor=executor)
+        self.assertEqual(len(result.moved), len(self.files))
+        self.assertGreater(state['peak'], 1)
+
+    def test_unknown_type_is_skipped(self):
+        """
+        Test that files with an undetectable type stay in place and are reported as skipped.
+        """
+        unknown_path = os.path.join(self.test_dir, 'mystery')
+        with open(unknown_path, 'w') as f:
+            f.write("no extension, no magic bytes")
+
+        result = organize_by_type(self.test_dir)
+
+        self.assertTrue(os.path.exists(unknown_path))
+        self.assertEqual(result.skipped, [(unknown_path, "unknown file type")])
+
+    def test_existing_destination_is_not_overwritten(self):
+        """
+        Test that a file is skipped rather than overwriting one already organized under its name.
+        """
+        os.makedirs(os.path.join(self.test_dir, 'text'))
+        existing_path = os.path.join(self.test_dir, 'text', 'text1.txt')
+        with open(existing_path, 'w') as f:
+            f.write("already organized")
+
+        result = organize_by_type(self.test_dir, workers=2)
+
+        with open(existing_path) as f:
+            self.assertEqual(f.read(), "already organized")
+        self.assertEqual([source for source, _ in result.skipped],
+                         [os.path.join(self.test_dir, 'text1.txt')])
+
+    def test_recursive_organize(self):
+        """
+        Test that files in nested directories are moved into the top-level type folders.
+        """
+        nested_dir = os.path.join(self.test_dir, 'nested', 'deeper')
+        os.makedirs(nested_dir)
+        with open(os.path.join(nested_dir, 'notes.txt'), 'w') as f:
+            f.write("nested notes")
+
+        result = organize_by_type(self.test_dir, recursive=True, workers=2)
+
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, 'text', 'notes.txt')))
+        self.assertFalse(os.path.exists(os.path.join(nested_dir, 'notes.txt')))
+        self.assertEqual(result.counts['moved'], len(self.files) + 1)
+
+        # A second run finds everything already organized
+        again = organize_by_type(self.test_dir, recursive=True)
+        self.assertEqual(again.counts, {'moved': 0, 'skipped': 0, 'failed': 0})
+
+    def test_checkpoint_resumes_interrupted_run(self):
+        """
+        Test that an interrupted run resumes from its checkpoint without revisiting files.
+        """
+        for i in range(10):
+            with open(os.path.join(self.test_dir, f'mystery{i}'), 'w') as f:
+                f.write("undetectable")
+        checkpoint = os.path.join(self.test_dir, 'progress.jsonl')
+
+        skipped = []
+
+        def interrupt(status, source, detail):
+            if status == 'skipped':
+                skipped.append(source)
+                # Stop while the third undetectable file is being processed
+                if len(skipped) == 3:
+                    raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            organize_by_type(self.test_dir, chunk_size=1, checkpoint=checkpoint, on_result=interrupt)
+        self.assertTrue(os.path.exists(checkpoint))
+
+        first = organize_by_type(self.test_dir, chunk_size=3, checkpoint=checkpoint)
+        self.assertFalse(os.path.exists(checkpoint))
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, 'text', 'text1.txt')))
+        # The two undetectable files checkpointed before the interruption are not revisited
+        self.assertEqual(first.counts['skipped'], 8)
+        self.assertNotIn(skipped[0], [source for source, _ in first.skipped])
+        self.assertEqual(len(first.skipped), first.counts['skipped'])
+
+    def test_counts_without_records(self):
+        """
+        Test that keep_records=False keeps only the counts.
+        """
+        result = organize_by_type(self.test_dir, keep_records=False)
+        self.assertEqual(result.counts['moved'], len(self.files))
+        self.assertEqual(result.moved, [])
+
     def tearDown(self):
         """
         Clean up test directory by removing all files and subdirectories.
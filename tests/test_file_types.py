@@ -1,7 +1,7 @@
 import unittest
 import os
 import tempfile
-from smartfile.file_types import get_file_type
+from smartfile.file_types import get_file_type, get_file_types
 
 class TestGetFileType(unittest.TestCase):
 
@@ -69,5 +69,48 @@ class TestGetFileType(unittest.TestCase):
         result = get_file_type(file_path)
         self.assertEqual(result, 'application/octet-stream')
 
+class TestGetFileTypes(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def create_test_file(self, filename, content):
+        file_path = os.path.join(self.test_dir.name, filename)
+        with open(file_path, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+        return file_path
+
+    def test_batch_matches_single_file_detection(self):
+        paths = [
+            self.create_test_file('test.txt', "This is a text file."),
+            self.create_test_file('photo', b'\xff\xd8\xff\xe0\x00\x10JFIF'),
+            self.create_test_file('document', b'%PDF-1.4'),
+            self.create_test_file('archive.tar.gz', b'\x1f\x8b\x08\x00'),
+        ]
+        result = get_file_types(paths)
+        self.assertEqual(result, {path: get_file_type(path) for path in paths})
+        self.assertEqual(result[paths[1]], 'image/jpeg')
+        self.assertEqual(result[paths[2]], 'application/pdf')
+
+    def test_directory_entries(self):
+        self.create_test_file('image', b'\x89PNG\r\n\x1a\n')
+        os.mkdir(os.path.join(self.test_dir.name, 'subdir'))
+        with os.scandir(self.test_dir.name) as entries:
+            result = get_file_types(entries)
+        self.assertEqual(result[os.path.join(self.test_dir.name, 'image')], 'image/png')
+        self.assertIsNone(result[os.path.join(self.test_dir.name, 'subdir')])
+
+    def test_missing_and_empty_files(self):
+        missing = os.path.join(self.test_dir.name, 'missing')
+        empty = self.create_test_file('empty', b'')
+        self.assertEqual(get_file_types([missing, empty]), {missing: None, empty: None})
+
+    def test_invalid_input_type(self):
+        with self.assertRaises(TypeError):
+            get_file_types([None])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
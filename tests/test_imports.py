@@ -0,0 +1,56 @@
+import sys
+import unittest
+import subprocess
+
+# Cumulative import time allowed for `import smartfile`, in microseconds. Loading everything
+# eagerly took about 100 ms; lazy loading takes a few.
+IMPORT_BUDGET_US = 50000
+HEAVY_MODULES = ('PIL', 'PyPDF2', 'filetype')
+
+def run_python(code, *options):
+    return subprocess.run([sys.executable, *options, '-c', code], capture_output=True,
+                          text=True, check=True)
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_import_time_budget(self):
+        """Test that `import smartfile` stays within the import time budget."""
+        stderr = run_python('import smartfile', '-X', 'importtime').stderr
+        times = {}
+        for line in stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                _, cumulative, name = line[len('import time:'):].split('|')
+                if cumulative.strip().isdigit():
+                    times[name.strip()] = int(cumulative)
+        self.assertLess(times['smartfile'], IMPORT_BUDGET_US)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+
+    def test_heavy_dependencies_are_deferred(self):
+        """Test that light functions can be used without loading Pillow or PyPDF2."""
+        code = (
+            "import sys, tempfile, smartfile\n"
+            "with tempfile.NamedTemporaryFile(suffix='.txt') as f:\n"
+            "    assert smartfile.get_file_type(f.name) == 'text/plain'\n"
+            "smartfile.bulk_rename\n"
+            "print(' '.join(m for m in ('PIL', 'PyPDF2') if m in sys.modules))\n"
+        )
+        self.assertEqual(run_python(code).stdout.strip(), '')
+
+    def test_public_names(self):
+        """Test that every public name resolves and unknown names raise AttributeError."""
+        import smartfile
+        for name in smartfile.__all__:
+            self.assertTrue(callable(getattr(smartfile, name)), name)
+            self.assertIn(name, dir(smartfile))
+        with self.assertRaises(AttributeError):
+            smartfile.does_not_exist
+
+    def test_watch_stays_a_function(self):
+        """Test that importing the `watching` submodule keeps `smartfile.watch` the function."""
+        code = ("import smartfile.watching, smartfile\n"
+                "print(callable(smartfile.watch))\n")
+        self.assertEqual(run_python(code).stdout.strip(), 'True')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import unittest
+import tempfile
+from PIL import Image
+from smartfile import instrumentation
+from smartfile.instrumentation import (HistogramSink, PrometheusTextfileSink, add_sink,
+                                       instrumented, remove_sink, stage)
+from smartfile.file_management import organize_by_type
+from smartfile.file_types import get_file_type
+from smartfile.metadata import get_metadata
+from smartfile.preview import preview_image_file, preview_text_file
+from smartfile.renaming import bulk_rename
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with a text file, an image and a file of unknown type.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.text_path = os.path.join(self.test_dir.name, 'notes.txt')
+        with open(self.text_path, 'w') as f:
+            f.write("line one\nline two\n")
+        self.image_path = os.path.join(self.test_dir.name, 'photo.png')
+        Image.new('RGB', (40, 30)).save(self.image_path)
+        self.unknown_path = os.path.join(self.test_dir.name, 'blob')
+        with open(self.unknown_path, 'wb') as f:
+            f.write(b'\x00\x01\x02' * 100)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_disabled_by_default(self):
+        """Test that stages are no-ops while no sink is registered."""
+        self.assertFalse(instrumentation.enabled())
+        self.assertIs(stage('a'), stage('b'))
+
+    def test_callback_sink(self):
+        """Test that plain callables receive events, including failed stages."""
+        events = []
+        sink = add_sink(events.append)
+        try:
+            with stage('custom', nbytes=10) as current:
+                current.add_bytes(5)
+            with self.assertRaises(KeyError):
+                with stage('failing'):
+                    raise KeyError('x')
+        finally:
+            remove_sink(sink)
+        self.assertEqual([(event.stage, event.bytes, event.error) for event in events],
+                         [('custom', 15, None), ('failing', 0, 'KeyError')])
+        self.assertFalse(instrumentation.enabled())
+
+    def test_instrumented_functions(self):
+        """Test that the public functions report their stages to a histogram."""
+        with instrumented(HistogramSink()) as histogram:
+            get_file_type(self.unknown_path)
+            dict(get_metadata(self.image_path))  # Fields are extracted on first access
+            dict(get_metadata(self.text_path))
+            preview_text_file(self.text_path)
+            preview_image_file(self.image_path)
+            organize_by_type(self.test_dir.name)
+            bulk_rename(os.path.join(self.test_dir.name, 'text'))
+
+        summary = histogram.summary()
+        for name in ('file_types.stat', 'file_types.sniff', 'metadata.image', 'metadata.stat',
+                     'preview.text_read', 'preview.image', 'organize.detect', 'organize.move',
+                     'rename.rename'):
+            self.assertIn(name, summary)
+        self.assertEqual(summary['file_types.sniff']['bytes'], 600)  # Sniffed twice
+        self.assertEqual(summary['preview.text_read']['bytes'], 18)
+        self.assertEqual(summary['organize.move']['count'], 2)  # The unknown file stays
+        self.assertGreaterEqual(summary['metadata.image']['p99'], summary['metadata.image']['p50'])
+
+    def test_histogram_percentiles(self):
+        """Test that percentiles are read from the histogram buckets."""
+        sink = HistogramSink(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.05, 0.05, 0.5, 5.0):
+            sink.record(instrumentation.Event('s', seconds, 0, None))
+        summary = sink.summary()['s']
+        self.assertEqual(summary['count'], 5)
+        self.assertEqual(summary['p50'], 0.1)
+        self.assertEqual(summary['p90'], float('inf'))
+        sink.reset()
+        self.assertEqual(sink.summary(), {})
+
+    def test_prometheus_textfile(self):
+        """Test that the Prometheus sink writes the text exposition format."""
+        path = os.path.join(self.test_dir.name, 'smartfile.prom')
+        sink = PrometheusTextfileSink(path, buckets=(0.5, 1.0))
+        sink.record(instrumentation.Event('organize.move', 0.25, 100, None))
+        sink.record(instrumentation.Event('organize.move', 0.75, 50, 'OSError'))
+        sink.write()
+        with open(path) as f:
+            text = f.read()
+        self.assertIn('# TYPE smartfile_stage_duration_seconds histogram', text)
+        self.assertIn('smartfile_stage_duration_seconds_bucket{stage="organize.move",le="0.5"} 1',
+                      text)
+        self.assertIn('smartfile_stage_duration_seconds_bucket{stage="organize.move",le="+Inf"} 2',
+                      text)
+        self.assertIn('smartfile_stage_duration_seconds_count{stage="organize.move"} 2', text)
+        self.assertIn('smartfile_stage_bytes_total{stage="organize.move"} 150', text)
+        self.assertIn('smartfile_stage_errors_total{stage="organize.move"} 1', text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import unittest
+import tempfile
+from smartfile.line_index import LineIndex, index_path_for, load_line_index
+from smartfile.preview import preview_lines
+
+class TestLineIndex(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with a log file and a separate index cache directory.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.test_dir.name, 'indexes')
+        self.log_path = os.path.join(self.test_dir.name, 'app.log')
+        self.write_lines(0, 1000)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def write_lines(self, first, last, mode='w'):
+        with open(self.log_path, mode) as f:
+            for i in range(first, last):
+                f.write(f"line {i}\n")
+
+    def test_preview_lines_with_every_stride(self):
+        """Test that any range of lines is returned correctly, whatever the stride."""
+        for stride in (1, 7, 1024):
+            index = load_line_index(self.log_path, stride=stride, cache_dir=self.cache_dir)
+            self.assertEqual(index.line_count, 1000)
+            for start in (0, 6, 7, 500, 998):
+                self.assertEqual(preview_lines(self.log_path, start, 3, index=index),
+                                 [f"line {i}" for i in range(start, min(start + 3, 1000))])
+
+    def test_range_past_end_of_file(self):
+        """Test that ranges beyond the last line return what is left."""
+        self.assertEqual(preview_lines(self.log_path, 999, 5, stride=10, cache_dir=self.cache_dir),
+                         ["line 999"])
+        self.assertEqual(preview_lines(self.log_path, 5000, 5, stride=10, cache_dir=self.cache_dir), [])
+
+    def test_index_is_persisted_and_reused(self):
+        """Test that a saved index is loaded instead of being rebuilt."""
+        load_line_index(self.log_path, stride=16, cache_dir=self.cache_dir)
+        index_path = index_path_for(self.log_path, cache_dir=self.cache_dir)
+        self.assertTrue(os.path.exists(index_path))
+
+        stored = LineIndex.load(index_path)
+        self.assertEqual(stored.line_count, 1000)
+        self.assertEqual(len(stored.offsets), 63)
+
+    def test_index_is_extended_when_the_file_grows(self):
+        """Test that appending to the file extends the stored index."""
+        load_line_index(self.log_path, stride=16, sidecar=True)
+        self.write_lines(1000, 1500, mode='a')
+
+        index = load_line_index(self.log_path, stride=16, sidecar=True)
+        self.assertEqual(index.line_count, 1500)
+        self.assertEqual(preview_lines(self.log_path, 1490, 2, index=index), ["line 1490", "line 1491"])
+        self.assertTrue(os.path.exists(self.log_path + '.lineidx'))
+
+    def test_index_is_rebuilt_when_the_file_is_rewritten(self):
+        """Test that a rewritten file gets a fresh index."""
+        load_line_index(self.log_path, stride=16, cache_dir=self.cache_dir)
+        with open(self.log_path, 'w') as f:
+            f.write("only\nthree\nlines")
+
+        index = load_line_index(self.log_path, stride=16, cache_dir=self.cache_dir)
+        self.assertEqual(index.line_count, 3)
+        self.assertEqual(preview_lines(self.log_path, 1, 5, index=index), ["three", "lines"])
+
+if __name__ == '__main__':
+    unittest.main()
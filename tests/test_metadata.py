@@ -3,7 +3,9 @@ import os
 import tempfile
 from PIL import Image
 from fpdf import FPDF
-from smartfile.metadata import get_metadata
+from smartfile import metadata as metadata_module
+from smartfile.metadata import get_metadata, get_pdf_metadata, iter_metadata, register_extractor
+from smartfile.pdfinfo import read_pdf_info, PDFInfoError
 
 class TestGetMetadata(unittest.TestCase):
 
@@ -63,6 +65,68 @@ class TestGetMetadata(unittest.TestCase):
         self.assertEqual(metadata["num_pages"], 1)  # One page added
         self.assertIsNone(metadata["author"])  # Author is None unless set in FPDF
 
+    def create_minimal_pdf(self, filename, num_pages, broken_xref=False, info=None):
+        """
+        Helper function to write a hand-made PDF, with the given document information
+        dictionary or none at all.
+        """
+        kids = " ".join(f"{3 + i} 0 R" for i in range(num_pages))
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            f"<< /Type /Pages /Kids [{kids}] /Count {num_pages} >>".encode(),
+        ] + [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"] * num_pages
+        if info is not None:
+            objects.append(info)
+
+        content = b"%PDF-1.4\n"
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(content))
+            content += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+        xref_offset = len(content)
+        content += f"xref\n0 {len(objects) + 1}\n".encode() + b"0000000000 65535 f \n"
+        for offset in offsets:
+            content += f"{offset:010d} 00000 n \n".encode()
+        info_ref = f" /Info {len(objects)} 0 R" if info is not None else ""
+        content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R{info_ref} >>\n".encode()
+        startxref = xref_offset + 3 if broken_xref else xref_offset
+        content += f"startxref\n{startxref}\n%%EOF\n".encode()
+        return self.create_test_file(filename, content, is_binary=True)
+
+    def test_pdf_metadata_with_author_and_pages(self):
+        """Test that the author and page count are read from a multi-page PDF."""
+        pdf_path = os.path.join(self.test_dir.name, 'authored.pdf')
+        pdf = FPDF()
+        pdf.set_author("Jane (Doe)")
+        for _ in range(25):
+            pdf.add_page()
+        pdf.output(pdf_path)
+
+        expected = {"author": "Jane (Doe)", "num_pages": 25}
+        self.assertEqual(read_pdf_info(pdf_path), expected)
+        self.assertEqual(get_metadata(pdf_path), expected)
+
+    def test_pdf_without_info_dictionary(self):
+        """Test a PDF that has no /Info dictionary at all."""
+        pdf_path = self.create_minimal_pdf('no_info.pdf', 3)
+        self.assertEqual(get_pdf_metadata(pdf_path), {"author": None, "num_pages": 3})
+
+    def test_pdf_with_broken_xref_falls_back(self):
+        """Test that a damaged cross-reference table is handled by the full parser."""
+        pdf_path = self.create_minimal_pdf('broken.pdf', 2, broken_xref=True)
+        with self.assertRaises(PDFInfoError):
+            read_pdf_info(pdf_path)
+        self.assertEqual(get_pdf_metadata(pdf_path), {"author": None, "num_pages": 2})
+
+    def test_deeply_nested_pdf_falls_back(self):
+        """Test that a deeply nested object is rejected by the fast path, not by recursion."""
+        nested = b"[" * 5000 + b"]" * 5000
+        pdf_path = self.create_minimal_pdf('nested.pdf', 2,
+                                           info=b"<< /Author (Nested) /Extra " + nested + b" >>")
+        with self.assertRaises(PDFInfoError):
+            read_pdf_info(pdf_path)
+        self.assertEqual(get_pdf_metadata(pdf_path), {"author": "Nested", "num_pages": 2})
+
     def test_other_file_type(self):
         """Test retrieving metadata from a regular text file."""
         text_file_path = self.create_test_file('test_text.txt', "This is a text file.")
@@ -81,5 +145,165 @@ class TestGetMetadata(unittest.TestCase):
         self.assertEqual(metadata["size"], 0)
         self.assertEqual(metadata["created"], os.path.getctime(empty_file_path))
 
+class TestIterMetadata(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a small directory tree with an image, a PDF, a text file and a corrupt image.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        root = self.test_dir.name
+        os.makedirs(os.path.join(root, 'nested'))
+
+        self.image_path = os.path.join(root, 'image.png')
+        Image.new('RGB', (20, 10), color='green').save(self.image_path)
+
+        self.pdf_path = os.path.join(root, 'nested', 'document.pdf')
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.output(self.pdf_path)
+
+        self.text_path = os.path.join(root, 'nested', 'notes.txt')
+        with open(self.text_path, 'w') as f:
+            f.write("notes")
+
+        self.corrupt_path = os.path.join(root, 'corrupt.png')
+        with open(self.corrupt_path, 'wb') as f:
+            f.write(b'not really a png')
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def check_records(self, records):
+        self.assertEqual(set(records), {self.image_path, self.pdf_path, self.text_path, self.corrupt_path})
+        self.assertEqual(records[self.image_path]["size"], (20, 10))
+        self.assertEqual(records[self.pdf_path]["num_pages"], 1)
+        self.assertEqual(records[self.text_path]["size"], 5)
+        self.assertIsInstance(records[self.corrupt_path], Exception)
+
+    def test_sequential(self):
+        """Test streaming metadata in the calling process."""
+        self.check_records(dict(iter_metadata(self.test_dir.name)))
+
+    def test_process_pool(self):
+        """Test streaming metadata from worker processes with a small in-flight limit."""
+        self.check_records(dict(iter_metadata(self.test_dir.name, workers=2, max_pending=1)))
+
+    def test_non_recursive(self):
+        """Test that subdirectories are skipped when recursive is False."""
+        records = dict(iter_metadata(self.test_dir.name, recursive=False))
+        self.assertEqual(set(records), {self.image_path, self.corrupt_path})
+
+    def test_nonexistent_directory(self):
+        """Test that a missing directory raises ValueError."""
+        with self.assertRaises(ValueError):
+            next(iter_metadata(os.path.join(self.test_dir.name, 'missing')))
+
+class TestExtractorRegistry(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory and a registry snapshot restored after each test.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.registry = {mime: list(extractors)
+                         for mime, extractors in metadata_module._extractors.items()}
+
+    def tearDown(self):
+        metadata_module._extractors.clear()
+        metadata_module._extractors.update(self.registry)
+        self.test_dir.cleanup()
+
+    def create_image(self, filename, image_format, exif=None):
+        image_path = os.path.join(self.test_dir.name, filename)
+        options = {'exif': exif} if exif is not None else {}
+        Image.new('RGB', (30, 20), color='blue').save(image_path, format=image_format, **options)
+        return image_path
+
+    def test_types_are_detected_from_content_and_extension(self):
+        """Test that images are recognized whatever their extension's case or spelling."""
+        for filename, image_format in (('upper.JPG', 'JPEG'), ('photo.jpeg', 'JPEG'),
+                                       ('image.webp', 'WEBP'), ('scan.tiff', 'TIFF')):
+            metadata = get_metadata(self.create_image(filename, image_format))
+            self.assertEqual(dict(metadata), {"format": image_format, "size": (30, 20),
+                                              "mode": 'RGB'})
+
+    def test_fields_are_extracted_on_first_access(self):
+        """Test that a group of fields is only extracted once one of them is read."""
+        image_path = self.create_image('image.png', 'PNG')
+        metadata = get_metadata(image_path)
+        self.assertEqual(list(metadata), ['format', 'size', 'mode'])
+        self.assertFalse(metadata.is_loaded('size'))
+
+        self.assertEqual(metadata["size"], (30, 20))
+        self.assertTrue(metadata.is_loaded('mode'))  # Read from the same header
+
+    def test_field_selection(self):
+        """Test that only the requested fields are returned and computed."""
+        image_path = self.create_image('image.png', 'PNG')
+        self.assertEqual(dict(get_metadata(image_path, fields={'size', 'mode'})),
+                         {"size": (30, 20), "mode": 'RGB'})
+
+        pdf_path = os.path.join(self.test_dir.name, 'document.pdf')
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.output(pdf_path)
+        self.assertEqual(dict(get_metadata(pdf_path, fields=['author'])), {"author": None})
+        self.assertEqual(get_pdf_metadata(pdf_path, fields=('num_pages',)), {"num_pages": 1})
+
+    def test_exif_is_optional(self):
+        """Test that EXIF tags are only extracted when asked for."""
+        exif = Image.Exif()
+        exif[0x0110] = 'TestCam'  # Model
+        image_path = self.create_image('photo.jpg', 'JPEG', exif=exif)
+
+        self.assertNotIn('exif', get_metadata(image_path))
+        metadata = get_metadata(image_path, fields={'exif', 'size'})
+        self.assertEqual(metadata["exif"]["Model"], 'TestCam')
+        self.assertFalse(metadata.is_loaded('size'))
+
+    def test_exif_zero_rationals(self):
+        """Test that 0/0 rationals written for unset tags are read as None."""
+        from PIL.TiffImagePlugin import IFDRational
+        from smartfile.metadata import get_exif_metadata
+
+        exif = Image.Exif()
+        exif[0x011A] = IFDRational(0, 0)  # XResolution
+        exif[0x011B] = IFDRational(72, 1)  # YResolution
+        image_path = self.create_image('zero.jpg', 'JPEG', exif=exif)
+
+        tags = get_exif_metadata(image_path)['exif']
+        self.assertIsNone(tags['XResolution'])
+        self.assertEqual(tags['YResolution'], 72.0)
+        self.assertIsNone(get_metadata(image_path, fields={'exif'})['exif']['XResolution'])
+
+    def test_registered_extractor(self):
+        """Test that custom extractors are called lazily and can override a pattern."""
+        calls = []
+
+        def count_lines(filepath):
+            calls.append(filepath)
+            with open(filepath) as f:
+                return {"lines": sum(1 for _ in f)}
+
+        register_extractor('text/*', ('lines',), count_lines)
+        text_path = os.path.join(self.test_dir.name, 'notes.txt')
+        with open(text_path, 'w') as f:
+            f.write("one\ntwo\n")
+
+        metadata = get_metadata(text_path)
+        self.assertEqual(list(metadata), ['lines'])
+        self.assertEqual(calls, [])
+        self.assertEqual(metadata["lines"], 2)
+        self.assertEqual(metadata["lines"], 2)
+        self.assertEqual(calls, [text_path])
+
+    def test_unknown_field_raises_key_error(self):
+        """Test that fields the file type does not provide are missing from the mapping."""
+        metadata = get_metadata(self.create_image('image.png', 'PNG'), fields={'num_pages'})
+        self.assertEqual(len(metadata), 0)
+        with self.assertRaises(KeyError):
+            metadata["num_pages"]
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
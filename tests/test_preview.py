@@ -2,7 +2,8 @@ import unittest
 import os
 import tempfile
 from PIL import Image
-from smartfile.preview import preview_text_file, preview_image_file
+from smartfile.cache import ThumbnailCache
+from smartfile.preview import preview_text, preview_text_file, preview_image_file
 
 class TestFilePreview(unittest.TestCase):
 
@@ -55,6 +56,56 @@ class TestFilePreview(unittest.TestCase):
         expected_preview = "\n".join([f"Line {i + 1}" for i in range(3)])
         self.assertEqual(preview, expected_preview)
 
+    def test_text_file_preview_keeps_blank_lines(self):
+        """Test that blank lines and indentation are part of the preview."""
+        text_file_path = self.create_test_file('blank_lines.txt', "first\n\n    indented\nlast\n")
+        self.assertEqual(preview_text_file(text_file_path), "first\n\n    indented\nlast")
+
+    def test_text_preview_reports_truncation(self):
+        """Test that the preview says whether lines were left out."""
+        text_file_path = self.create_test_file('lines.txt', "\n".join([f"Line {i + 1}" for i in range(10)]))
+
+        preview = preview_text(text_file_path, num_lines=5)
+        self.assertTrue(preview.truncated)
+        complete = preview_text(text_file_path, num_lines=10)
+        self.assertFalse(complete.truncated)
+        self.assertEqual(len(complete.lines), 10)
+
+    def test_single_line_file_is_read_within_budget(self):
+        """Test that a huge file without line breaks is cut at the byte budget."""
+        text_file_path = self.create_test_file('minified.json', "[" + "1," * 500000 + "1]")
+
+        for use_mmap in (False, True):
+            preview = preview_text(text_file_path, max_bytes=1024, use_mmap=use_mmap)
+            self.assertEqual(len(preview.lines), 1)
+            self.assertEqual(len(preview.lines[0]), 1024)
+            self.assertTrue(preview.truncated)
+
+    def test_tail_preview(self):
+        """Test previewing the last lines of a file."""
+        text_file_path = self.create_test_file('log.txt', "".join([f"Line {i + 1}\n" for i in range(1000)]))
+
+        preview = preview_text(text_file_path, num_lines=3, max_bytes=64, tail=True)
+        self.assertEqual(preview.lines, ["Line 998", "Line 999", "Line 1000"])
+        self.assertTrue(preview.truncated)
+        self.assertEqual(preview_text_file(text_file_path, num_lines=2, tail=True, use_mmap=True),
+                         "Line 999\nLine 1000")
+
+    def test_text_preview_encoding(self):
+        """Test that encodings are detected from a byte order mark or can be given explicitly."""
+        utf16_path = os.path.join(self.test_dir.name, 'utf16.txt')
+        with open(utf16_path, 'w', encoding='utf-16') as f:
+            f.write("héllo\nwörld\n")
+        preview = preview_text(utf16_path)
+        self.assertEqual(preview.lines, ["héllo", "wörld"])
+        self.assertTrue(preview.encoding.startswith('utf-16'))
+
+        latin1_path = os.path.join(self.test_dir.name, 'latin1.txt')
+        with open(latin1_path, 'wb') as f:
+            f.write("café".encode('latin-1'))
+        self.assertEqual(preview_text_file(latin1_path), "café")
+        self.assertEqual(preview_text_file(latin1_path, encoding='cp1252'), "café")
+
     def test_image_file_preview(self):
         """Test previewing an image file (resize to 100x100)."""
         image_path = os.path.join(self.test_dir.name, 'test_image.png')
@@ -77,6 +128,48 @@ class TestFilePreview(unittest.TestCase):
         preview_img = preview_image_file(image_path)
         self.assertEqual(preview_img.size, (50, 50))
 
+    def test_large_jpeg_preview(self):
+        """Test that a large JPEG is previewed at the requested size, keeping its aspect ratio."""
+        image_path = os.path.join(self.test_dir.name, 'large.jpg')
+        Image.new('RGB', (2400, 1800), color='green').save(image_path)
+
+        preview_img = preview_image_file(image_path, size=(200, 200))
+        self.assertEqual(preview_img.size, (200, 150))
+
+    def test_image_preview_cache(self):
+        """Test that repeated previews are served from the thumbnail cache."""
+        image_path = os.path.join(self.test_dir.name, 'cached.png')
+        Image.new('RGB', (300, 300), color='blue').save(image_path)
+        cache = ThumbnailCache(os.path.join(self.test_dir.name, 'thumbnails'))
+
+        first = preview_image_file(image_path, cache=cache)
+        second = preview_image_file(image_path, cache=cache)
+        self.assertEqual(first.size, (100, 100))
+        self.assertEqual(second.size, (100, 100))
+        self.assertEqual(second.getpixel((0, 0)), (0, 0, 255))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # A different size is a different entry
+        preview_image_file(image_path, size=(50, 50), cache=cache)
+        self.assertEqual(len(cache), 2)
+
+        # Entries survive reopening the cache directory
+        reopened = ThumbnailCache(os.path.join(self.test_dir.name, 'thumbnails'))
+        self.assertEqual(len(reopened), 2)
+        self.assertIsNotNone(reopened.get(os.stat(image_path), (50, 50)))
+
+    def test_image_preview_cache_eviction(self):
+        """Test that the thumbnail cache stays under its size cap."""
+        cache = ThumbnailCache(os.path.join(self.test_dir.name, 'thumbnails'), max_bytes=1)
+        for i in range(3):
+            image_path = os.path.join(self.test_dir.name, f'image{i}.png')
+            Image.new('RGB', (120, 120), color=(i, 0, 0)).save(image_path)
+            preview_image_file(image_path, cache=cache)
+
+        # Only the most recent thumbnail is kept
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(len(os.listdir(cache.directory)), 1)
+
     def test_nonexistent_file(self):
         """Test previewing a non-existent file (should raise FileNotFoundError)."""
         non_existent_path = os.path.join(self.test_dir.name, 'non_existent_file.txt')
@@ -1,7 +1,10 @@
 import os
 import unittest
 import tempfile
-from smartfile.renaming import bulk_rename
+from unittest import mock
+from smartfile import renaming
+from smartfile.renaming import (bulk_rename, plan_renames, recover_renames, undo_renames,
+                                RenameConflictError)
 
 class TestBulkRename(unittest.TestCase):
 
@@ -45,6 +48,116 @@ class TestBulkRename(unittest.TestCase):
             self.assertTrue(os.path.exists(new_file_path), f"File {new_file_path} does not exist.")
             self.assertTrue(new_name.startswith('file_'), f"File {new_name} does not start with the expected prefix.")
 
+    def names(self):
+        return sorted(os.listdir(self.test_dir.name))
+
+    def test_numbering_is_deterministic(self):
+        """Test that files are numbered in sorted name order."""
+        self.assertEqual(bulk_rename(self.test_dir.name),
+                         [f"file_{i + 1}_testfile_{i}.txt" for i in range(5)])
+
+    def test_rerun_does_not_stack_prefixes(self):
+        """Test that a second run only renames the files added since the first."""
+        bulk_rename(self.test_dir.name)
+        with open(os.path.join(self.test_dir.name, 'extra.txt'), 'w') as f:
+            f.write("new")
+        self.assertEqual(bulk_rename(self.test_dir.name), ["file_6_extra.txt"])
+        self.assertEqual(len(self.names()), 6)
+
+    def test_empty_prefix_renames_every_file(self):
+        """Test that names starting with a number are not mistaken for renamed files."""
+        with open(os.path.join(self.test_dir.name, '2024_report.txt'), 'w') as f:
+            f.write("report")
+        self.assertEqual(bulk_rename(self.test_dir.name, prefix='', dry_run=True),
+                         ["1_2024_report.txt"] + [f"{i + 2}_testfile_{i}.txt" for i in range(5)])
+
+    def test_dry_run(self):
+        """Test that a dry run returns the new names without renaming anything."""
+        before = self.names()
+        self.assertEqual(len(bulk_rename(self.test_dir.name, dry_run=True)), 5)
+        self.assertEqual(self.names(), before)
+
+    def test_conflicts_leave_files_untouched(self):
+        """Test that an existing target or a duplicate target aborts before renaming."""
+        before = self.names()
+        with self.assertRaises(RenameConflictError) as raised:
+            plan_renames(self.test_dir.name, {'testfile_0.txt': 'testfile_1.txt',
+                                              'testfile_2.txt': 'copy.txt',
+                                              'testfile_3.txt': 'copy.txt'})
+        self.assertEqual(len(raised.exception.conflicts), 2)
+        self.assertEqual(self.names(), before)
+
+    def test_cycles_are_broken_with_a_temporary_name(self):
+        """Test that swapping names and rotating a chain of names works."""
+        plan = plan_renames(self.test_dir.name, {'testfile_0.txt': 'testfile_1.txt',
+                                                 'testfile_1.txt': 'testfile_0.txt',
+                                                 'testfile_2.txt': 'testfile_3.txt',
+                                                 'testfile_3.txt': 'testfile_9.txt'})
+        self.assertEqual(len(plan.steps), 5)
+        plan.apply()
+        read = lambda name: open(os.path.join(self.test_dir.name, name)).read()
+        self.assertEqual(read('testfile_0.txt'), "Sample content for file 1")
+        self.assertEqual(read('testfile_1.txt'), "Sample content for file 0")
+        self.assertEqual(read('testfile_3.txt'), "Sample content for file 2")
+        self.assertEqual(read('testfile_9.txt'), "Sample content for file 3")
+
+    def test_failure_reverts_applied_renames(self):
+        """Test that a failing rename restores the files renamed before it."""
+        before = self.names()
+        real_rename = os.rename
+        calls = []
+
+        def failing_rename(source, target):
+            calls.append(source)
+            if len(calls) == 3:
+                raise PermissionError("denied")
+            real_rename(source, target)
+
+        with mock.patch.object(renaming.os, 'rename', failing_rename):
+            with self.assertRaises(PermissionError):
+                bulk_rename(self.test_dir.name)
+        self.assertEqual(self.names(), before)
+
+    def test_undo(self):
+        """Test that a journaled run can be undone and redone."""
+        journal = os.path.join(self.test_dir.name, 'rename.journal')
+        before = self.names()
+        bulk_rename(self.test_dir.name, journal=journal)
+        self.assertIn('rename.journal', self.names())  # The journal itself is not renamed
+
+        self.assertEqual(sorted(undo_renames(journal)), [f"testfile_{i}.txt" for i in range(5)])
+        self.assertEqual(self.names(), sorted(before + ['rename.journal']))
+        undo_renames(journal)
+        self.assertIn('file_1_testfile_0.txt', self.names())
+
+    def test_recover_after_crash(self):
+        """Test that an interrupted run is finished, or rolled back, from its journal."""
+        journal = os.path.join(self.test_dir.name, 'rename.journal')
+        real_rename = os.rename
+        calls = []
+
+        def crashing_rename(source, target):
+            calls.append(source)
+            real_rename(source, target)
+            if len(calls) == 2:
+                raise KeyboardInterrupt  # Stops after renaming, before the journal records it
+
+        with mock.patch.object(renaming.os, 'rename', crashing_rename):
+            with self.assertRaises(KeyboardInterrupt):
+                bulk_rename(self.test_dir.name, journal=journal)
+
+        self.assertEqual(recover_renames(journal, rollback=True), 2)
+        self.assertEqual(self.names(), sorted([f"testfile_{i}.txt" for i in range(5)]
+                                              + ['rename.journal']))
+        self.assertEqual(recover_renames(journal), 0)  # Nothing left to recover
+
+        calls.clear()
+        with mock.patch.object(renaming.os, 'rename', crashing_rename):
+            with self.assertRaises(KeyboardInterrupt):
+                bulk_rename(self.test_dir.name, journal=journal)
+        self.assertEqual(recover_renames(journal), 3)
+        self.assertEqual(len([name for name in self.names() if name.startswith('file_')]), 5)
+
     def tearDown(self):
         """
         Clean up the temporary directory and files after the test.
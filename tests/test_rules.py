@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import unittest
+import tempfile
+from unittest import mock
+from PIL import Image
+from smartfile.file_management import organize_by_type
+from smartfile.rules import compile_rules, load_rules
+
+class TestRules(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with images, logs, notes and a PDF.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        Image.new('RGB', (1200, 1000)).save(self.path('large.png'))
+        Image.new('RGB', (10, 10)).save(self.path('small.png'))
+        Image.new('CMYK', (10, 10)).save(self.path('print.jpg'))
+        self.create_test_file('IMG_0001.CR2', b'raw')
+        self.create_test_file('server.log', b'log line\n')
+        self.create_test_file('server.log.1', b'old log line\n')
+        self.create_test_file('note_short.txt', b'short')
+        self.create_test_file('note_long.txt', b'long' * 100)
+        self.create_test_file('report.pdf', b'%PDF-1.4\n')
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.test_dir.name, name)
+
+    def create_test_file(self, name, content):
+        with open(self.path(name), 'wb') as f:
+            f.write(content)
+
+    def routes(self, rules, **options):
+        rule_set = compile_rules(rules, **options)
+        return {name: rule_set.route(self.path(name)) for name in os.listdir(self.test_dir.name)}
+
+    def test_conditions(self):
+        """Test each kind of condition and the destination placeholders."""
+        routes = self.routes([
+            {"destination": "raw", "extension": [".cr2", "nef"]},
+            {"destination": "large", "mime": "image/*", "min_megapixels": 1},
+            {"destination": "logs/{extension}", "glob": ["*.log", "*.log.*"]},
+            {"destination": "notes", "regex": "^note", "max_size": 100},
+            {"destination": "documents/{subtype}", "mime": "application/pdf"},
+            {"destination": "print", "metadata": {"mode": ["CMYK", "YCbCr"]}},
+        ], default=None)
+        self.assertEqual(routes, {
+            'IMG_0001.CR2': 'raw', 'large.png': 'large', 'small.png': None,
+            'print.jpg': 'print', 'server.log': 'logs/log', 'server.log.1': 'logs/1',
+            'note_short.txt': 'notes', 'note_long.txt': None, 'report.pdf': 'documents/pdf'})
+
+    def test_first_match_wins(self):
+        """Test that rules apply in order, including rules after a failed pattern match."""
+        routes = self.routes([
+            {"destination": "tiny_notes", "glob": "note_*", "max_size": 10},
+            {"destination": "text", "extension": ".txt", "min_size": 100},
+            {"destination": "other_notes", "regex": "note"},
+        ])
+        self.assertEqual(routes['note_short.txt'], 'tiny_notes')
+        self.assertEqual(routes['note_long.txt'], 'text')
+        self.assertEqual(routes['large.png'], 'image')  # The default: the MIME major type
+
+    def test_glob_and_regex_must_both_match(self):
+        """Test that a rule with a glob and a regex needs both, and either of each list."""
+        routes = self.routes([
+            {"destination": "old_logs", "glob": "*.log*", "regex": [r"\.1$", r"\.2$"]},
+            {"destination": "png_notes", "glob": "*.png", "regex": "^note"},
+        ], default=None)
+        self.assertEqual([name for name, folder in routes.items() if folder], ['server.log.1'])
+        self.assertEqual(routes['server.log.1'], 'old_logs')
+
+    def test_age(self):
+        """Test that age conditions use the modification time."""
+        old = time.time() - 10 * 86400
+        os.utime(self.path('server.log.1'), (old, old))
+        routes = self.routes([{"destination": "stale", "min_age": 86400}], default=None)
+        self.assertEqual([name for name, folder in routes.items() if folder], ['server.log.1'])
+
+    def test_expensive_checks_are_skipped(self):
+        """Test that types and metadata are only computed when a cheaper check passes."""
+        rule_set = compile_rules([{"destination": "big", "min_size": 10 ** 6,
+                                   "min_megapixels": 1}], default=None)
+        detect = mock.Mock(return_value='image/png')
+        with mock.patch('smartfile.rules.get_metadata') as get_metadata:
+            self.assertIsNone(rule_set.route(self.path('large.png'), detect=detect))
+        detect.assert_not_called()
+        get_metadata.assert_not_called()
+
+    def test_invalid_rules(self):
+        """Test that invalid rule sets are rejected when compiled."""
+        for rules in ([{"glob": "*"}], [{"destination": "x", "colour": "red"}],
+                      [{"destination": "../outside"}], [{"destination": "x", "regex": "("}],
+                      [{"destination": "{owner}"}]):
+            with self.assertRaises(ValueError):
+                compile_rules(rules)
+
+    def test_organize_with_rules(self):
+        """Test that organize_by_type moves files into nested rule destinations."""
+        rules_path = os.path.join(tempfile.gettempdir(), f'rules-{os.getpid()}.json')
+        with open(rules_path, 'w') as f:
+            json.dump([{"destination": "media/raw", "extension": ".cr2"},
+                       {"destination": "logs", "glob": "*.log*"}], f)
+        self.addCleanup(os.remove, rules_path)
+
+        result = organize_by_type(self.test_dir.name, rules=load_rules(rules_path))
+        self.assertTrue(os.path.exists(self.path(os.path.join('media', 'raw', 'IMG_0001.CR2'))))
+        self.assertTrue(os.path.exists(self.path(os.path.join('logs', 'server.log.1'))))
+        self.assertTrue(os.path.exists(self.path(os.path.join('text', 'note_long.txt'))))
+        self.assertEqual(result.counts['failed'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import unittest
+import tempfile
+from smartfile.scanning import scan_files
+
+class TestScanFiles(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory tree with files at two levels.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.test_dir.name, 'a', 'b'))
+        for relative_path in ['top.txt', os.path.join('a', 'middle.txt'), os.path.join('a', 'b', 'deep.txt')]:
+            with open(os.path.join(self.test_dir.name, relative_path), 'w') as f:
+                f.write(relative_path)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_recursive_scan(self):
+        """Test that files in every subdirectory are yielded, but directories are not."""
+        names = sorted(entry.name for entry in scan_files(self.test_dir.name))
+        self.assertEqual(names, ['deep.txt', 'middle.txt', 'top.txt'])
+
+    def test_non_recursive_scan(self):
+        """Test that only top-level files are yielded when recursive is False."""
+        names = [entry.name for entry in scan_files(self.test_dir.name, recursive=False)]
+        self.assertEqual(names, ['top.txt'])
+
+    def test_unreadable_directory_is_reported(self):
+        """Test that listing errors are passed to onerror instead of being raised."""
+        errors = []
+        missing = os.path.join(self.test_dir.name, 'missing')
+        self.assertEqual(list(scan_files(missing, onerror=errors.append)), [])
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], FileNotFoundError)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import random
+import unittest
+import tempfile
+from PIL import Image, ImageDraw
+from smartfile.similarity import (BKTree, HammingIndex, find_similar_images, hamming_distance,
+                                  image_hash, organize_similar)
+
+class TestSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with a photo, a resized and re-encoded copy of it, and an
+        unrelated picture.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.original = self.create_image('beach.png', self.draw_scene(False))
+        copy = self.draw_scene(False).resize((300, 200))
+        self.copy = self.create_image('beach_small.jpg', copy, quality=70)
+        self.other = self.create_image('forest.png', self.draw_scene(True))
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def draw_scene(self, mirrored):
+        image = Image.new('RGB', (1200, 800), 'white')
+        draw = ImageDraw.Draw(image)
+        for x in range(0, 1200, 8):
+            shade = x * 255 // 1200
+            draw.rectangle([x, 0, x + 7, 800], fill=(shade, shade // 2, 255 - shade))
+        draw.ellipse([100, 100, 500, 500], fill='black')
+        draw.rectangle([700, 400, 1100, 700], fill='yellow')
+        return image.transpose(Image.FLIP_LEFT_RIGHT) if mirrored else image
+
+    def create_image(self, name, image, **options):
+        path = os.path.join(self.test_dir.name, name)
+        image.save(path, **options)
+        return path
+
+    def test_hashes_of_copies_are_close(self):
+        """Test that resized copies hash close together and other pictures do not."""
+        for method in ('dhash', 'phash'):
+            original, copy, other = (image_hash(path, method) for path in
+                                     (self.original, self.copy, self.other))
+            self.assertLess(original, 1 << 64)
+            self.assertLessEqual(hamming_distance(original, copy), 4, method)
+            self.assertGreater(hamming_distance(original, other), 12, method)
+        with self.assertRaises(ValueError):
+            image_hash(self.original, 'md5')
+
+    def test_indexes_match_a_linear_scan(self):
+        """Test that both indexes return exactly the hashes within the radius."""
+        generator = random.Random(7)
+        values = [generator.getrandbits(64) for _ in range(2000)]
+        values += [value ^ (1 << generator.randrange(64)) for value in values[:200]]
+        tree = BKTree((value, index) for index, value in enumerate(values))
+        index = HammingIndex.for_size(len(values))
+        for position, value in enumerate(values):
+            index.add(value, position)
+        for query in values[:50]:
+            expected = sorted(value for value in set(values)
+                              if hamming_distance(query, value) <= 6)
+            for found in (tree.query(query, 6), index.query(query, 6)):
+                self.assertEqual(sorted(value for _, value, _ in found), expected)
+                self.assertEqual([match[0] for match in found],
+                                 sorted(match[0] for match in found))
+        self.assertEqual(index.query(values[0], 0)[0], (0, values[0], [0]))
+
+    def test_find_and_organize(self):
+        """Test that near-duplicates are clustered and moved into a folder."""
+        groups = find_similar_images(self.test_dir.name, workers=2)
+        self.assertEqual([group.paths for group in groups], [sorted([self.original, self.copy])])
+        self.assertEqual(find_similar_images(self.test_dir.name, threshold=0), [])
+
+        review = os.path.join(self.test_dir.name, 'review')
+        result = organize_similar(groups, review)
+        self.assertEqual(result.counts, {'moved': 2, 'skipped': 0, 'failed': 0})
+        self.assertEqual(sorted(os.listdir(os.path.join(review, 'similar_0001'))),
+                         ['beach.png', 'beach_small.jpg'])
+        self.assertTrue(os.path.exists(self.other))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import json
+import unittest
+import tempfile
+from unittest import mock
+from PIL import Image
+from smartfile.thumbnails import generate_thumbnails, make_thumbnails, pack_atlases
+
+class TestThumbnails(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with a landscape JPEG and an RGBA PNG.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.test_dir.name, 'thumbs')
+        self.jpeg_path = self.create_image('photo.jpg', (2400, 1600), 'RGB', 'JPEG')
+        self.png_path = self.create_image('logo.png', (300, 300), 'RGBA', 'PNG')
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def create_image(self, name, size, mode, image_format, **options):
+        path = os.path.join(self.test_dir.name, name)
+        Image.new(mode, size, color='red').save(path, image_format, **options)
+        return path
+
+    def test_sizes_from_one_decode(self):
+        """Test that all sizes are rendered from a single open of the source."""
+        with mock.patch('smartfile.thumbnails.Image.open', wraps=Image.open) as image_open:
+            thumbnails = make_thumbnails(self.jpeg_path, self.output_dir,
+                                         sizes=(64, 256, (300, 100)))
+        self.assertEqual(image_open.call_count, 1)
+        self.assertEqual([(t.label, t.width, t.height) for t in thumbnails],
+                         [('64', 64, 43), ('256', 256, 171), ('300x100', 150, 100)])
+        for thumbnail in thumbnails:
+            with Image.open(thumbnail.path) as img:
+                self.assertEqual(img.format, 'JPEG')
+                self.assertEqual(img.size, (thumbnail.width, thumbnail.height))
+
+    def test_reduced_decode(self):
+        """Test that a large JPEG is decoded at reduced resolution for small sizes."""
+        with mock.patch('smartfile.thumbnails.ImageOps.exif_transpose',
+                        side_effect=lambda img: img.copy()) as transpose:
+            make_thumbnails(self.jpeg_path, self.output_dir, sizes=(64,))
+        decoded = transpose.call_args[0][0]
+        self.assertLess(decoded.width, 2400)
+        self.assertGreaterEqual(decoded.width, 128)
+
+    def test_exif_orientation(self):
+        """Test that the EXIF orientation is applied."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees
+        rotated = self.create_image('rotated.jpg', (400, 200), 'RGB', 'JPEG', exif=exif.tobytes())
+        thumbnail, = make_thumbnails(rotated, self.output_dir, sizes=(100,))
+        self.assertEqual((thumbnail.width, thumbnail.height), (50, 100))
+
+    def test_formats(self):
+        """Test PNG and WebP output, and conversion of modes JPEG cannot store."""
+        png, = make_thumbnails(self.png_path, self.output_dir, sizes=(32,), image_format='png')
+        with Image.open(png.path) as img:
+            self.assertEqual((img.format, img.mode), ('PNG', 'RGBA'))
+        jpeg, = make_thumbnails(self.png_path, self.output_dir, sizes=(32,))
+        with Image.open(jpeg.path) as img:
+            self.assertEqual(img.mode, 'RGB')
+        with self.assertRaises(ValueError):
+            make_thumbnails(self.png_path, self.output_dir, image_format='GIF')
+
+    def test_images_are_not_enlarged(self):
+        """Test that sizes larger than the source keep the source dimensions."""
+        thumbnail, = make_thumbnails(self.png_path, self.output_dir, sizes=(1024,))
+        self.assertEqual((thumbnail.width, thumbnail.height), (300, 300))
+
+    def test_generate_with_process_pool(self):
+        """Test batch rendering on worker processes, with errors reported per source."""
+        missing = os.path.join(self.test_dir.name, 'missing.jpg')
+        results = dict(generate_thumbnails([self.jpeg_path, self.png_path, missing],
+                                           self.output_dir, sizes=(64, 128), workers=2))
+        self.assertEqual(len(results[self.jpeg_path]), 2)
+        self.assertEqual(len(results[self.png_path]), 2)
+        self.assertIsInstance(results[missing], FileNotFoundError)
+
+    def test_pack_atlases(self):
+        """Test that thumbnails are packed per size with their positions recorded."""
+        sources = [self.create_image(f'image{i}.png', (200, 100), 'RGB', 'PNG') for i in range(5)]
+        thumbnails = [thumbnail for _, result in generate_thumbnails(sources, self.output_dir,
+                                                                     sizes=(64, 32))
+                      for thumbnail in result]
+        manifest = pack_atlases(thumbnails, self.output_dir, max_dimension=128)
+
+        self.assertEqual(sorted(manifest), ['32', '64'])
+        # 64x32 cells: 2 columns and 4 rows fit in 128 px, so 5 tiles need one atlas
+        atlas, = manifest['64']
+        self.assertEqual((atlas['width'], atlas['height']), (128, 96))
+        self.assertEqual(atlas['tiles'][sources[2]], [0, 32, 64, 32])
+        with open(os.path.join(self.output_dir, 'atlas.json')) as f:
+            self.assertEqual(json.load(f), manifest)
+        with Image.open(os.path.join(self.output_dir, atlas['image'])) as img:
+            self.assertEqual(img.size, (128, 96))
+
+if __name__ == '__main__':
+    unittest.main()
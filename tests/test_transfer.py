@@ -0,0 +1,77 @@
+import os
+import time
+import errno
+import unittest
+import tempfile
+from unittest import mock
+from smartfile.transfer import BandwidthLimiter, Mover, move_file
+
+def raise_exdev(source, destination):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+class TestMover(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary directory with a source file of a few chunks.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.test_dir.name, 'source.bin')
+        self.destination = os.path.join(self.test_dir.name, 'destination.bin')
+        self.content = os.urandom(300000)
+        with open(self.source, 'wb') as f:
+            f.write(self.content)
+        os.utime(self.source, (1000000000, 1000000000))
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def assert_moved(self):
+        self.assertFalse(os.path.exists(self.source))
+        with open(self.destination, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        # No temporary files are left behind
+        self.assertEqual(sorted(os.listdir(self.test_dir.name)), ['destination.bin'])
+
+    def test_same_filesystem_move(self):
+        """Test that a plain rename is used on the same filesystem."""
+        self.assertEqual(move_file(self.source, self.destination), self.destination)
+        self.assert_moved()
+
+    def test_cross_device_move(self):
+        """Test that EXDEV falls back on an atomic copy that preserves the modification time."""
+        with mock.patch('os.rename', side_effect=raise_exdev):
+            Mover(chunk_size=65536).move(self.source, self.destination)
+        self.assert_moved()
+        self.assertEqual(os.path.getmtime(self.destination), 1000000000)
+
+    def test_fallback_when_zero_copy_is_unavailable(self):
+        """Test that the copy falls back on plain reads and writes."""
+        unsupported = OSError(errno.ENOSYS, "Function not implemented")
+        with mock.patch('os.rename', side_effect=raise_exdev), \
+                mock.patch('os.copy_file_range', side_effect=unsupported, create=True), \
+                mock.patch('os.sendfile', side_effect=unsupported, create=True):
+            Mover(chunk_size=65536, max_copies=1).move(self.source, self.destination)
+        self.assert_moved()
+
+    def test_failed_copy_leaves_source_intact(self):
+        """Test that a failing copy removes its temporary file and keeps the source."""
+        failure = OSError(errno.EIO, "Input/output error")
+        with mock.patch('os.rename', side_effect=raise_exdev), \
+                mock.patch('os.copy_file_range', side_effect=failure, create=True):
+            with self.assertRaises(OSError):
+                Mover().move(self.source, self.destination)
+        self.assertEqual(os.listdir(self.test_dir.name), ['source.bin'])
+
+    def test_bandwidth_limit(self):
+        """Test that copies are slowed down to the configured rate."""
+        limiter = BandwidthLimiter(rate=200000, burst=100000)
+        start = time.monotonic()
+        with mock.patch('os.rename', side_effect=raise_exdev):
+            Mover(limiter=limiter, chunk_size=50000).move(self.source, self.destination)
+        # 300 kB at 200 kB/s with a 100 kB burst takes about one second
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+        self.assert_moved()
+
+if __name__ == '__main__':
+    unittest.main()
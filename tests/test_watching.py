@@ -0,0 +1,104 @@
+import os
+import time
+import unittest
+import tempfile
+import threading
+from smartfile.watching import watch, _load_inotify
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a temporary inbox directory.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.inbox = self.test_dir.name
+        self.stop = threading.Event()
+        self.records = []
+        self.thread = None
+        self.result = None
+
+    def tearDown(self):
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+        self.test_dir.cleanup()
+
+    def create_test_file(self, name, content):
+        file_path = os.path.join(self.inbox, name)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        return file_path
+
+    def start(self, **options):
+        """
+        Helper function to run the watcher in a background thread.
+        """
+        def run():
+            self.result = watch(self.inbox, stop=self.stop, keep_records=True,
+                                on_result=lambda *record: self.records.append(record), **options)
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+
+    def wait_for(self, path, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(path):
+                return True
+            time.sleep(0.02)
+        return False
+
+    def check_backend(self, **options):
+        self.create_test_file('existing.txt', 'already here')
+        self.start(debounce=0.05, **options)
+        self.assertTrue(self.wait_for(os.path.join(self.inbox, 'text', 'existing.txt')))
+
+        self.create_test_file('arrived.txt', 'new content')
+        self.assertTrue(self.wait_for(os.path.join(self.inbox, 'text', 'arrived.txt')))
+
+        self.stop.set()
+        self.thread.join(timeout=10)
+        self.assertFalse(self.thread.is_alive())
+        self.assertEqual(self.result.counts['moved'], 2)
+        self.assertEqual(len(self.records), 2)
+
+    @unittest.skipIf(_load_inotify() is None, "inotify is not available")
+    def test_inotify(self):
+        """Test that existing and newly written files are organized with inotify."""
+        self.check_backend(backend='inotify')
+
+    def test_polling(self):
+        """Test that existing and newly written files are organized by polling."""
+        self.check_backend(backend='polling', poll_interval=0.05)
+
+    @unittest.skipIf(_load_inotify() is None, "inotify is not available")
+    def test_files_moved_in_are_organized(self):
+        """Test that a file renamed into the directory is organized once, with workers."""
+        outside = tempfile.NamedTemporaryFile('w', suffix='.txt', dir=os.path.dirname(self.inbox),
+                                              delete=False)
+        with outside:
+            outside.write('written elsewhere')
+        self.start(debounce=0.05, workers=2)
+        time.sleep(0.1)
+        destination = os.path.join(self.inbox, 'moved_in.txt')
+        os.rename(outside.name, destination)
+        self.assertTrue(self.wait_for(os.path.join(self.inbox, 'text', 'moved_in.txt')))
+
+    def test_existing_files_can_be_left_alone(self):
+        """Test that `existing=False` only organizes files that arrive after starting."""
+        old = self.create_test_file('old.txt', 'left alone')
+        self.start(debounce=0.05, backend='polling', poll_interval=0.05, existing=False)
+        time.sleep(0.2)  # Let the watcher take its initial listing
+        self.create_test_file('new.txt', 'organized')
+        self.assertTrue(self.wait_for(os.path.join(self.inbox, 'text', 'new.txt')))
+        self.assertTrue(os.path.exists(old))
+
+    def test_invalid_arguments(self):
+        """Test that a missing directory or unknown backend raises ValueError."""
+        with self.assertRaises(ValueError):
+            watch(os.path.join(self.inbox, 'missing'), stop=self.stop)
+        with self.assertRaises(ValueError):
+            watch(self.inbox, stop=self.stop, backend='kqueue')
+
+if __name__ == '__main__':
+    unittest.main()